@@ -3,14 +3,11 @@ import sys
 import os
 from pathlib import Path
 
-from key_command import KeyCommand
-from balance_command import BalanceCommand
-from address_command import AddressCommand
-from consolidate_command import ConsolidateCommand
-from transaction_command import TransactionCommand
-from pkeyformat_command import PkeyformatCommand
-from utxo_command import utxoCommand
-from useful import address_regex_type
+# the command modules (and tx_engine behind them) are imported by the
+# sub-command that runs them, so e.g. 'pkeyformat' does not load the
+# network interfaces and './wbt.sh <command> -h' answers at once
+from useful import address_regex_type, fee_rate_type
+from coin_selection import STRATEGIES
 
 # Specify the directory path
 # path = r'/app/data'
@@ -25,7 +22,9 @@ else:
 # -------------------------------------------------------------------
 class ArgumentHandler(object):
 
-    def __init__(self):
+    # argv: the command line without the program name (default sys.argv[1:])
+    def __init__(self, argv=None):
+        self.argv = sys.argv[1:] if argv is None else list(argv)
         parser = argparse.ArgumentParser(
             prog="wbt.sh",
             description='WildBitTool',
@@ -40,11 +39,15 @@ The most commonly used WildBitTool commands are:
    transaction  Create a transaction
    pkeyformat   Convert a private key to and from different formats
    consolidate  Consolidate UTXOs (many inputs to one output)
+   split        Split a balance into many equal UTXOs (one input set to many outputs)
+   serve        Keep one process warm and run commands sent by wbt_client.py
+   batch        Run the command lines of a script (or stdin) in one process
+   discover     Find the used addresses of an HD account (key -hd -out <file>.hd)
 ''')
         parser.add_argument('command', help='Subcommand to run')
         # parse_args defaults to [1:] for args
         # exclude the rest of the args or validation will fail
-        args = parser.parse_args(sys.argv[1:2])
+        args = parser.parse_args(self.argv[0:1])
         if not hasattr(self, args.command):
             print('Unrecognized command')
             parser.print_help()
@@ -65,6 +68,8 @@ The most commonly used WildBitTool commands are:
             usage='''./wbt.sh <key> [-s <seed>] [-n <nonce>] [-out <output file>] \
                 [-paramfile <parameter file>] [-genparam] \
                 [-outform <toml|pem>]
+                [-batch <batch file> [-workers <n>] [-show_seed]]
+                [-hd [-from <index>] [-count <n>] [-account <n>]]
                 [-l]\
                 [--network <mainnet|testnet|regtest>]
 
@@ -75,6 +80,10 @@ Example commands:
     key -genparam -s "my seed" -n "my nonce" -out myparamfile.toml  # generate parameters, save to file
     key -paramfile myparamfile.toml                                 # create key from parameter file, output to stdout
     key -paramfile myparamfile.toml -out my_key.txt                 # create key from parameter file, save to file
+    key -batch keys.toml                                            # create every key in the batch file, JSON lines to stdout
+    key -batch keys.toml -out wallet.key                            # ... each saved to wallet_001.key, wallet_002.key, ...
+    key -hd -s "my seed" -n "my nonce" -count 100                   # HD receive addresses 0..99 with private keys, JSON lines
+    key -hd -s "my seed" -n "my nonce" -from 0 -count 100000 -out shop.hd  # ... addresses only, account manifest saved
 ''')
 
         parser.add_argument("-s", "--seed", help="seed phrase used to generate private key")
@@ -84,9 +93,17 @@ Example commands:
         parser.add_argument("-genparam", help="generate parameters", action="store_true")
         parser.add_argument("-outform", help="output file format", choices=['toml', 'pem'], default='toml')
         parser.add_argument("-l", "--list", help="list all keys", action="store_true")
+        parser.add_argument("-batch", help="batch file of seeds and nonces ([[key_input]] / [[key_range]]) to generate keys from")
+        parser.add_argument("-workers", help="worker processes for -batch (default: one per core)", type=int)
+        parser.add_argument("-show_seed", help="-batch: also print the seed and nonce of each key", action="store_true")
+        parser.add_argument("-hd", help="HD mode: derive receive addresses m/<account>'/0/<index> from one master key", action="store_true")
+        parser.add_argument("-from", help="HD mode: first index (default: 0)", dest='from_', metavar='FROM', type=int, default=0)
+        parser.add_argument("-count", help="HD mode: number of addresses (default: 20)", type=int, default=20)
+        parser.add_argument("-account", help="HD mode: account number (default: 0)", type=int, default=0)
         parser.add_argument("--network", help="network: mainnet, testnet or regtest", choices=['mainnet', 'testnet', 'regtest'], default='testnet')
-        args = parser.parse_args(sys.argv[2:])
+        args = parser.parse_args(self.argv[1:])
 
+        from key_command import KeyCommand
         cmd = KeyCommand(
             seed=args.seed,
             nonce=args.nonce,
@@ -95,7 +112,14 @@ Example commands:
             genparam=args.genparam,
             outform=args.outform,
             list_all=args.list,
-            network=args.network)
+            network=args.network,
+            batch_file=args.batch,
+            workers=args.workers,
+            show_seed=args.show_seed,
+            hd=args.hd,
+            start=args.from_,
+            count=args.count,
+            account=args.account)
 
         cmd.run()
 
@@ -105,21 +129,24 @@ Example commands:
         parser = argparse.ArgumentParser(
             prog="wbt.sh",
             description='Get the balance of a bitcoin address',
-            usage="./wbt.sh balance -a <address> [-n <network>]")
+            usage="./wbt.sh balance -a <address> [-n <network>] [--cached]")
         parser.add_argument('-a', '--address', help="bitcoin address", type=address_regex_type)
         parser.add_argument('-n', '--network', help="network: mainnet, testnet or regtest", choices=['mainnet', 'testnet', 'regtest'], default='testnet')
         parser.add_argument('-in', '--input', help="input file", dest='in_', metavar='IN')
         parser.add_argument("-inform", help="input file format", choices=['toml', 'pem'], default='toml')
         parser.add_argument("--all", help="get balance for all addresses", action="store_true")
+        parser.add_argument("--cached", "--offline", dest="cached", help="read the local utxo index instead of the network", action="store_true")
 
-        args = parser.parse_args(sys.argv[2:])
+        args = parser.parse_args(self.argv[1:])
 
+        from balance_command import BalanceCommand
         cmd = BalanceCommand(
             address=args.address,
             network=args.network,
             input_file=args.in_,
             inform=args.inform,
-            all=args.all)
+            all=args.all,
+            cached=args.cached)
         cmd.run()
 
     # -------------------------------------------------------------------
@@ -144,8 +171,9 @@ Example commands:
         parser.add_argument('-n', '--network', help="network: mainnet or testnet", choices=['mainnet', 'testnet'], default='testnet')
         parser.add_argument('-in', '--input', help="input file", dest='in_', metavar='IN')
         parser.add_argument("-inform", help="input file format", choices=['toml', 'pem'], default='toml')
-        args = parser.parse_args(sys.argv[2:])
+        args = parser.parse_args(self.argv[1:])
 
+        from address_command import AddressCommand
         cmd = AddressCommand(
             private_key=args.private_key,
             network=args.network,
@@ -160,14 +188,19 @@ Example commands:
         parser = argparse.ArgumentParser(
             prog="wbt_dev.sh",
             description='Get a list of UTXO for a given WIF key',
-            usage="./wbt_dev.sh utxo -key <key file> [-n <network>]")
+            usage="./wbt_dev.sh utxo -key <key file> | --all [-n <network>] [--cached]")
         parser.add_argument('-k', '--key', help="bitcoin WIF key file")
+        parser.add_argument("--all", help="get the utxos of all key files (.key|.pem)", action="store_true")
         parser.add_argument('-n', '--network', help="network: mainnet, testnet or regtest", choices=['mainnet', 'testnet', 'regtest'], default='testnet')
+        parser.add_argument("--cached", "--offline", dest="cached", help="read the local utxo index instead of the network", action="store_true")
 
-        args = parser.parse_args(sys.argv[2:])
+        args = parser.parse_args(self.argv[1:])
+        from utxo_command import utxoCommand
         cmd = utxoCommand(
             key=args.key,
-            network=args.network)
+            network=args.network,
+            cached=args.cached,
+            all=args.all)
         cmd.run()
 
 # -------------------------------------------------------------------
@@ -184,7 +217,8 @@ Example commands:
             nargs="+"
         )
         parser.add_argument('-n', '--network', help="network: mainnet, testnet or regtest", choices=['mainnet', 'testnet', 'regtest'], default='testnet')
-        args = parser.parse_args(sys.argv[2:])
+        args = parser.parse_args(self.argv[1:])
+        from utxo_command import utxoCommand
         for tx in args.hashes:
             cmd = utxoCommand(
                 tx_hash=tx,
@@ -213,11 +247,17 @@ Example commands:
                 [-sender_key <sender key file>] \
                 [-inform <toml|pem>] \
                 [-recipient <recipient address>] \
+                [-recipients <csv file> [-max_outputs <n>] [-max_bytes <bytes>]] \
+                [-chain <csv file>] \
                 [-fee <fee>] \
+                [-fee_rate <sat/byte|node>] \
                 [-change <change address>] \
                 [-pem <private key in pem format>] \
                 [-opreturn_data <File Path or Data on commandline] \
-                [-opreturn_data_only]
+                [-opreturn_data_only] \
+                [-sign_workers <processes>] \
+                [--cached] \
+                [-coin_selection <strategy>]
 
 Example commands:
     transaction -genparam s
@@ -227,6 +267,10 @@ Example commands:
     transaction -paramfile -locking_script "LOCKING SCRIPT"
     transaction -paramfile -opreturn_only
     transaction -paramfile -out my_transaction.toml -auto_utxo
+    transaction -paramfile consolidate.toml -sign_workers 8
+    transaction -genparam -amount 1000 -sender_key alice.key -recipient <address> -coin_selection bnb
+    transaction -genparam -sender_key alice.key -recipients payouts.csv -out payout.toml
+    transaction -chain payments.csv -sender_key alice.key -out chain.hex
 ''')
         parser.add_argument("-paramfile", help="input parameter file for transaction creation")
         parser.add_argument("-genparam", help="generate parameters", action="store_true")
@@ -239,15 +283,32 @@ Example commands:
         parser.add_argument("-sender_key", help="file containing key to sign transaction")
         parser.add_argument("-inform", help="input file format for sender key", choices=['toml', 'pem'], default='toml')
         parser.add_argument("-fee", help="fee (default 300)", default=300, type=int)
+        parser.add_argument("-fee_rate", help="fee rate in sat/byte of the predicted size, or 'node' (the regtest node's minimum relay fee); replaces -fee", type=fee_rate_type)
         parser.add_argument("-recipient", help="recipient address")
+        parser.add_argument("-recipients", help="csv file of 'address,amount' payouts, packed into as few transactions as possible (one param file each)")
+        parser.add_argument("-max_outputs", help="-recipients: payouts per transaction at most", type=int)
+        parser.add_argument("-max_bytes", help="-recipients: transaction size at most (default 1000000)", type=int)
+        parser.add_argument("-chain", help="csv file of 'address,amount' payments: build one transaction per payment, each spending the change of the one before, then broadcast them in order")
         parser.add_argument("-change", help="change address")
         parser.add_argument("-opreturn_data", metavar='<DATA_OR_FILE>', help="data to add using an opreturn and p2pkh")
         parser.add_argument("-opreturn_data_only", help="op_return only or attach to a p2pkh", action="store_true")
-        args = parser.parse_args(sys.argv[2:])
+        parser.add_argument("-sign_workers", help="sign the inputs of a large transaction across this many processes (default 1)", default=1, type=int)
+        parser.add_argument("-coin_selection", help="how -genparam picks the inputs (default first_fit)", choices=list(STRATEGIES), default='first_fit')
+        parser.add_argument("--cached", "--offline", dest="cached", help="read the local utxo index instead of the network", action="store_true")
+        args = parser.parse_args(self.argv[1:])
 
         # Custom validation for mutually exclusive arguments
-        if not args.paramfile and not args.genparam:
-            parser.error("Either -paramfile or -genparam must be specified.")
+        if not args.paramfile and not args.genparam and not args.chain:
+            parser.error("Either -paramfile, -genparam or -chain must be specified.")
+        if args.chain and (args.paramfile or args.genparam or args.recipient or args.recipients or args.amount or args.change):
+            parser.error("-chain cannot be combined with -paramfile, -genparam, -recipient(s), -amount or -change")
+        if args.chain and not args.sender_key:
+            parser.error("-chain needs -sender_key")
+
+        if args.recipients and (args.recipient or args.amount or args.opreturn_data):
+            parser.error("-recipients cannot be combined with -recipient, -amount or -opreturn_data")
+        if args.recipients and not args.genparam:
+            parser.error("-recipients needs -genparam")
 
         # Custom logic to warn if --broadcast is used with -genparam
         if args.genparam and args.broadcast != 'true':
@@ -265,6 +326,7 @@ Example commands:
             else:
                 data_val_or_file = args.opreturn_data
 
+        from transaction_command import TransactionCommand
         cmd = TransactionCommand(
             paramfile=args.paramfile,
             genparam=args.genparam,
@@ -277,7 +339,15 @@ Example commands:
             inform=args.inform,
             fee=args.fee,
             recipient=args.recipient,
-            change=args.change
+            change=args.change,
+            sign_workers=args.sign_workers,
+            cached=args.cached,
+            coin_selection=args.coin_selection,
+            fee_rate=args.fee_rate,
+            recipients=args.recipients,
+            max_outputs=args.max_outputs,
+            max_bytes=args.max_bytes,
+            chain=args.chain
         )
 
         if data_val_or_file is not None:
@@ -299,23 +369,95 @@ Example commands:
                 [-fee <fee>] \
                 [-inform <toml|pem>] \
                 [-out <output file>] \
-                [-n <network>]")
+                [-n <network>] \
+                [-batch_size <inputs per transaction>] \
+                [-max_bytes <bytes per transaction>] \
+                [-fee_rate <sat/byte|node>] \
+                [-sign [-broadcast]] \
+                [-workers <processes>]")
 
         parser.add_argument("-sender_key", help="file containing key to sign transaction")
         parser.add_argument("-sender", help="address to send from")
         parser.add_argument("-n", "--network", help="network: mainnet, testnet or regtest", choices=['mainnet', 'testnet', 'regtest'], default='testnet')
         parser.add_argument("-fee", help="fee (default 300)", default=300, type=int)
         parser.add_argument("-inform", help="input file format for sender key", choices=['toml', 'pem'], default='toml')
-        parser.add_argument("-out", help="output file", dest='out', metavar='OUTFILE')
-        args = parser.parse_args(sys.argv[2:])
-
+        parser.add_argument("-out", help="output file (numbered per batch in batch mode)", dest='out', metavar='OUTFILE')
+        parser.add_argument("-batch_size", help="batch mode: at most this many inputs per transaction", type=int)
+        parser.add_argument("-max_bytes", help="batch mode: at most this many bytes per transaction", type=int)
+        parser.add_argument("-fee_rate", help="fee rate in sat/byte, or 'node' (the regtest node's minimum relay fee); replaces -fee (batch mode default 0.5)", type=fee_rate_type)
+        parser.add_argument("-sign", help="batch mode: also build and sign every batch", action="store_true")
+        parser.add_argument("-workers", help="batch mode: worker processes used to sign (default: all cores)", type=int)
+        parser.add_argument("-broadcast", help="batch mode with -sign: broadcast the signed batches", action="store_true")
+        args = parser.parse_args(self.argv[1:])
+
+        if args.broadcast and not args.sign:
+            parser.error("-broadcast needs -sign")
+
+        from consolidate_command import ConsolidateCommand
         cmd = ConsolidateCommand(
             sender_key=args.sender_key,
             sender=args.sender,
             network=args.network,
             fee=args.fee,
             inform=args.inform,
-            out=args.out
+            out=args.out,
+            batch_size=args.batch_size,
+            max_bytes=args.max_bytes,
+            fee_rate=args.fee_rate,
+            sign=args.sign,
+            workers=args.workers,
+            broadcast=args.broadcast
+        )
+
+        cmd.run()
+
+    # -------------------------------------------------------------------
+    # split: this is a sub-command
+    def split(self):
+        parser = argparse.ArgumentParser(
+            prog="wbt.sh",
+            description='Split the balance of an address into equal UTXOs',
+            usage="./wbt.sh split -count <outputs> \
+                [-sender_key <sender key file> | -sender <address>] \
+                [-inform <toml|pem>] \
+                [-out <output file>] \
+                [-n <network>] \
+                [-fee_rate <sat/byte|node>] \
+                [-max_outputs <outputs per transaction>] \
+                [-sign [-broadcast]] \
+                [-workers <processes>]")
+
+        parser.add_argument("-count", help="number of equal outputs", type=int, required=True)
+        parser.add_argument("-sender_key", help="file containing key to sign transaction")
+        parser.add_argument("-sender", help="address to split")
+        parser.add_argument("-n", "--network", help="network: mainnet, testnet or regtest", choices=['mainnet', 'testnet', 'regtest'], default='testnet')
+        parser.add_argument("-inform", help="input file format for sender key", choices=['toml', 'pem'], default='toml')
+        parser.add_argument("-out", help="output file (numbered per transaction for a tree)", dest='out', metavar='OUTFILE')
+        parser.add_argument("-fee_rate", help="fee rate in sat/byte, or 'node' (the regtest node's minimum relay fee); default 0.5", type=fee_rate_type)
+        parser.add_argument("-max_outputs", help="outputs per transaction at most; more make a tree of transactions (default 1000)", type=int, default=1000)
+        parser.add_argument("-sign", help="also build and sign the transactions", action="store_true")
+        parser.add_argument("-workers", help="worker processes used to sign a tree (default: all cores)", type=int)
+        parser.add_argument("-broadcast", help="with -sign: broadcast the transactions, root first", action="store_true")
+        args = parser.parse_args(self.argv[1:])
+
+        if args.broadcast and not args.sign:
+            parser.error("-broadcast needs -sign")
+        if not args.sender_key and not args.sender:
+            parser.error("-sender_key or -sender is required")
+
+        from split_command import SplitCommand
+        cmd = SplitCommand(
+            sender_key=args.sender_key,
+            sender=args.sender,
+            network=args.network,
+            count=args.count,
+            inform=args.inform,
+            out=args.out,
+            fee_rate=args.fee_rate,
+            max_outputs=args.max_outputs,
+            sign=args.sign,
+            workers=args.workers,
+            broadcast=args.broadcast
         )
 
         cmd.run()
@@ -347,11 +489,12 @@ Example commands:
         parser.add_argument("-from", help="input private key format", dest='from_', metavar='FROM', choices=['wif', 'hex', 'int'], default='wif')
         parser.add_argument("-to", help="output private key format", choices=['wif', 'hex', 'int'], default='wif')
         parser.add_argument('-n', '--network', help="network: mainnet or testnet", choices=['mainnet', 'testnet'], default='testnet')
-        args = parser.parse_args(sys.argv[2:])
+        args = parser.parse_args(self.argv[1:])
 
         # if args.pkey and not args.from:
         #     self.parser.error("--from is re")
 
+        from pkeyformat_command import PkeyformatCommand
         cmd = PkeyformatCommand(
             pkey=args.private_key,
             input_file=args.in_,
@@ -361,3 +504,90 @@ Example commands:
             network=args.network
         )
         cmd.run()
+
+    # -------------------------------------------------------------------
+    # serve: this is a sub-command
+    #          - keep one process warm and run the commands sent to it
+    def serve(self):
+        parser = argparse.ArgumentParser(
+            prog="wbt.sh",
+            description='Run commands sent by wbt_client.py in one long-lived process',
+            usage='''./wbt.sh serve \
+                [-socket <unix socket path>] \
+                [-port <tcp port>] \
+                [-host <tcp address>] \
+                [-regtest]
+
+Example commands:
+    serve                                # listen on ./data/wbt.sock
+    serve -regtest                       # also reach the regtest node
+    serve -port 8765 -host 0.0.0.0       # listen on TCP inside docker; there is no
+                                         # authentication, wbt.sh publishes the port
+                                         # on the host's 127.0.0.1 only
+''')
+        parser.add_argument("-socket", help="unix socket to listen on (default: wbt.sock in the data directory)")
+        parser.add_argument("-port", help="listen on this TCP port instead of a unix socket", type=int)
+        parser.add_argument("-host", help="TCP address to bind (default 127.0.0.1)", default='127.0.0.1')
+        parser.add_argument("-regtest", help="attach the container to the regtest network (used by wbt.sh)", action='store_true')
+        args = parser.parse_args(self.argv[1:])
+
+        from serve_command import ServeCommand
+        cmd = ServeCommand(
+            socket_path=args.socket,
+            host=args.host,
+            port=args.port)
+        cmd.run()
+
+    # -------------------------------------------------------------------
+    # batch: this is a sub-command
+    #          - run many command lines in one process
+    def batch(self):
+        parser = argparse.ArgumentParser(
+            prog="wbt.sh",
+            description='Run the command lines of a script in one process, one JSON result per line',
+            usage='''./wbt.sh batch <script file | -> \
+                [-stop_on_error]
+
+Example commands:
+    batch payouts.txt                    # script in the data directory
+    batch - < payouts.txt                # script on stdin
+''')
+        parser.add_argument("script", help="file in the data directory with one command per line, or - for stdin")
+        parser.add_argument("-stop_on_error", help="stop at the first line that fails", action="store_true")
+        args = parser.parse_args(self.argv[1:])
+
+        from batch_command import BatchCommand
+        cmd = BatchCommand(
+            script=args.script,
+            stop_on_error=args.stop_on_error)
+        cmd.run()
+
+    # -------------------------------------------------------------------
+    # discover: this is a sub-command
+    def discover(self):
+        parser = argparse.ArgumentParser(
+            prog="wbt.sh",
+            description='Find the used receive addresses of an HD account manifest',
+            usage='''./wbt.sh discover -in <account manifest> \
+                [-gap <n>] [-window <n>] [-rescan] \
+                [--network <mainnet|testnet|regtest>]
+
+Example commands:
+    discover -in shop.hd                 # resume after the last used index
+    discover -in shop.hd -gap 50 -rescan # scan again from the first index
+''')
+        parser.add_argument('-in', '--input', help="account manifest (.hd) written by key -hd -out", dest='in_', metavar='IN', required=True)
+        parser.add_argument("-gap", help="stop after this many unused addresses in a row (default: 20)", type=int, default=20)
+        parser.add_argument("-window", help="addresses queried at once (default: 100)", type=int, default=100)
+        parser.add_argument("-rescan", help="scan from the first index instead of after the last used one", action="store_true")
+        parser.add_argument("--network", help="network: mainnet, testnet or regtest", choices=['mainnet', 'testnet', 'regtest'], default='testnet')
+        args = parser.parse_args(self.argv[1:])
+
+        from discover_command import DiscoverCommand
+        cmd = DiscoverCommand(
+            input_file=args.in_,
+            network=args.network,
+            gap_limit=args.gap,
+            window=args.window,
+            rescan=args.rescan)
+        cmd.run()
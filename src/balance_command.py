@@ -1,5 +1,7 @@
-from useful import load_key_from_file, list_keys, network_to_key_type, build_interface_config
-from tx_engine import interface_factory
+from useful import load_key_from_file, list_keys, network_to_key_type, print_balance
+from interfaces import create_interface
+from utxo_index import cached_balance
+from key_functions import balances_all
 
 
 class BalanceCommand:
@@ -10,12 +12,15 @@ class BalanceCommand:
                  input_file=None,
                  inform='toml',
                  all=False,
-                 key_type=None):
+                 key_type=None,
+                 cached=False):
         self.address = address
         self.network = network
         self.input_file = input_file
         self.inform = inform
         self.all = all
+        # read the local utxo index instead of the network
+        self.cached = cached
 
         self.key_type = network_to_key_type(network)
 
@@ -25,18 +30,22 @@ class BalanceCommand:
             print("Error: No address provided.")
             return
 
-        config = build_interface_config(self.network)
-        interface = interface_factory.set_config(config)
+        if self.cached:
+            balance = cached_balance(self.address, self.network)
+            if balance is None:
+                print(f"Error: no cached utxos for {self.address}, run once without --cached first.")
+            return balance
+
+        interface = create_interface(self.network)
         balance = interface.get_balance(self.address)
         return balance
 
     def print_balance(self):
-        balance = self.get_balance()
+        self.show_balance(self.get_balance())
 
+    def show_balance(self, balance):
         if balance is not None:
-            print('\n------------------------------------------------------------------------------------')
-            print('PubKey: \t{}\nBalance: \t{}'.format(self.address, balance))
-            print('------------------------------------------------------------------------------------\n')
+            print_balance(self.address, balance)
         else:
             print(f"Failed to retrieve balance for address {self.address}.")
 
@@ -59,7 +68,7 @@ class BalanceCommand:
             elif self.all:
                 print(f'\n  -> Running bbt balance for all key files (.key|.pem), network={self.network}')
                 key_list, pem_list = list_keys(network=self.network)
-                key_bunch = BunchOfBalances(key_list, pem_list, self.network)
+                key_bunch = BunchOfBalances(key_list, pem_list, self.network, self.cached)
                 key_bunch.check_balances()
                 exit(0)
 
@@ -74,7 +83,7 @@ class BalanceCommand:
 
 # A class to handle many keys and pems
 class BunchOfBalances():
-    def __init__(self, keys, pems, network):
+    def __init__(self, keys, pems, network, cached=False):
         self.key_name_list = keys
         self.pem_name_list = pems
 
@@ -85,7 +94,8 @@ class BunchOfBalances():
                 address=key[1],
                 input_file=key[0],
                 network=network,
-                inform='toml')
+                inform='toml',
+                cached=cached)
 
             self.resource_balances.append(resource)
         for pem in self.pem_name_list:
@@ -93,11 +103,17 @@ class BunchOfBalances():
                 address=pem[1],
                 input_file=pem[0],
                 network=network,
-                inform='pem')
+                inform='pem',
+                cached=cached)
             self.resource_balances.append(resource)
 
+    # one request per BULK_ADDRESS_LIMIT addresses on WoC, run concurrently
     def check_balances(self):
+        if not self.resource_balances:
+            return
+        resource = self.resource_balances[0]
+        balances = balances_all([r.address for r in self.resource_balances], resource.network, resource.cached)
         for resource in self.resource_balances:
             print(f'\n    * {resource.input_file}')
-            resource.print_balance()
+            resource.show_balance(balances[resource.address])
         return
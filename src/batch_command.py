@@ -0,0 +1,94 @@
+import json
+import os
+import shlex
+import sys
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from command_runner import run_command
+from useful import path
+
+# -------------------------------------------------------------------
+# wbt batch: run many command lines in one process.
+#
+# Each line of the script is one wbt command line without './wbt.sh', e.g.
+#
+#   # comments and blank lines are skipped
+#   key -s "alice seed" -n "nonce 1" -out alice.key --network regtest
+#   balance -in alice.key --network regtest
+#
+# The lines run in order through command_runner, so modules, key files, the
+# raw-tx cache, the utxo index and the rate limiters are loaded once for the
+# whole script. One JSON object is written per line as soon as it finishes:
+#
+#   {"line": 2, "argv": [...], "exit_code": 0, "output": "..."}
+#
+# The batch exits 1 if any line failed.
+
+# commands a script line may not run
+NOT_IN_BATCH = ('batch', 'serve')
+
+
+# Helper function to split a script into (line number, argv), skipping
+# blank lines and comments; a line that cannot be split gets argv None
+def parse_script(lines: Iterable[str]) -> Iterator[Tuple[int, Optional[List[str]], str]]:
+    for number, line in enumerate(lines, 1):
+        try:
+            argv = shlex.split(line, comments=True)
+        except ValueError as e:
+            yield number, None, f"Error: cannot parse line {number}: {e}\n"
+            continue
+        if argv:
+            yield number, argv, ''
+
+
+class BatchCommand:
+
+    def __init__(self,
+                 script: str,
+                 stop_on_error: bool = False):
+        # script file in the data directory, or '-' for stdin
+        self.script = script
+        self.stop_on_error = stop_on_error
+
+    # --------------------------------------------------------------
+    # Run one script line and return its result
+    def run_line(self, number: int, argv: Optional[List[str]], error: str) -> Dict[str, Any]:
+        result: Dict[str, Any]
+        if argv is None:
+            result = {'argv': None, 'exit_code': 2, 'output': error}
+        elif argv[0] in NOT_IN_BATCH:
+            result = {'argv': argv, 'exit_code': 2, 'output': f"Error: '{argv[0]}' cannot run inside a batch\n"}
+        else:
+            result = run_command(argv)
+        return {'line': number, **result}
+
+    # --------------------------------------------------------------
+    # Run every line of lines, writing one JSON line per result to out;
+    # returns the number of lines that failed
+    def run_lines(self, lines: Iterable[str], out=None) -> int:
+        out = out or sys.stdout
+        failed = 0
+        for number, argv, error in parse_script(lines):
+            result = self.run_line(number, argv, error)
+            out.write(json.dumps(result) + '\n')
+            out.flush()
+            if result['exit_code'] != 0:
+                failed += 1
+                if self.stop_on_error:
+                    break
+        return failed
+
+    def run(self):
+        if self.script == '-':
+            # read the whole script first: the builtin exit() that commands
+            # call on errors closes sys.stdin
+            failed = self.run_lines(sys.stdin.read().splitlines())
+        else:
+            script_file = os.path.join(path, self.script)
+            if not os.path.isfile(script_file):
+                print(f"Error: File {script_file} not found.")
+                exit(1)
+            with open(script_file, 'r') as file:
+                failed = self.run_lines(file)
+        if failed:
+            exit(1)
@@ -0,0 +1,159 @@
+from bisect import bisect_left, bisect_right
+from typing import Any, Callable, Dict, List, Optional
+
+from fee import CHANGE_DUST_LIMIT
+
+# -------------------------------------------------------------------
+# Coin selection: which utxos fund a payment of target satoshis.
+#
+#   first_fit           utxos in the order the API returned them until the
+#                       target is covered (the original behaviour, default)
+#   largest_first       largest utxos first: fewest inputs for the target
+#   smallest_sufficient the smallest single utxo that covers the target,
+#                       else largest_first
+#   min_inputs          as few inputs as largest_first, but the last input
+#                       is the smallest one that still covers the target
+#   bnb                 branch and bound search for a set that matches the
+#                       target to within CHANGE_DUST_LIMIT, so no change output
+#                       is needed; falls back to min_inputs
+#
+# The strategies work on a UtxoPool, the utxos sorted by value once, so each
+# selection is a bisect or a walk over the largest values rather than a
+# scan, even for wallets with 100k utxos.
+
+BNB_MAX_TRIES = 100000
+
+
+class InsufficientFundsError(ValueError):
+    pass
+
+
+# -------------------------------------------------------------------
+class UtxoPool:
+
+    def __init__(self, utxos: List[Dict[str, Any]]):
+        self.utxos = utxos
+        self.by_value = sorted(utxos, key=lambda u: u['value'])
+        self.values = [u['value'] for u in self.by_value]
+        self.total = sum(self.values)
+
+    def check(self, target: int) -> None:
+        if self.total < target:
+            raise InsufficientFundsError(f"utxos worth {self.total} cannot cover {target}")
+
+    # number of inputs largest_first needs for target
+    def min_count(self, target: int) -> int:
+        self.check(target)
+        total = 0
+        for count, value in enumerate(reversed(self.values), 1):
+            total += value
+            if total >= target:
+                return count
+        return 0
+
+
+# -------------------------------------------------------------------
+def first_fit(pool: UtxoPool, target: int) -> List[Dict[str, Any]]:
+    pool.check(target)
+    selected, total = [], 0
+    for utxo in pool.utxos:
+        if total >= target:
+            break
+        selected.append(utxo)
+        total += utxo['value']
+    return selected
+
+
+def largest_first(pool: UtxoPool, target: int) -> List[Dict[str, Any]]:
+    count = pool.min_count(target)
+    return pool.by_value[::-1][:count] if count else []
+
+
+def smallest_sufficient(pool: UtxoPool, target: int) -> List[Dict[str, Any]]:
+    pool.check(target)
+    i = bisect_left(pool.values, target)
+    if i < len(pool.values):
+        return [pool.by_value[i]]
+    return largest_first(pool, target)
+
+
+def min_inputs(pool: UtxoPool, target: int) -> List[Dict[str, Any]]:
+    count = pool.min_count(target)
+    if count <= 1:
+        return smallest_sufficient(pool, target)
+
+    # the count - 1 largest, then the smallest of the rest that covers the remainder
+    n = len(pool.values)
+    top = pool.by_value[n - count + 1:]
+    remainder = target - sum(pool.values[n - count + 1:])
+    i = bisect_left(pool.values, remainder, 0, n - count + 1)
+    return top[::-1] + [pool.by_value[i]]
+
+
+def bnb(pool: UtxoPool, target: int) -> List[Dict[str, Any]]:
+    pool.check(target)
+    # utxos above target + tolerance overshoot on their own
+    end = bisect_right(pool.values, target + CHANGE_DUST_LIMIT)
+    candidates = pool.by_value[:end][::-1]
+    match = _branch_and_bound([u['value'] for u in candidates], target, CHANGE_DUST_LIMIT)
+    if match is None:
+        return min_inputs(pool, target)
+    return [candidates[i] for i in match]
+
+
+# depth first search over values (descending) for a subset summing to
+# target .. target + tolerance; returns the indices of the closest match
+def _branch_and_bound(values: List[int], target: int, tolerance: int) -> Optional[List[int]]:
+    best: Optional[List[int]] = None
+    best_excess = tolerance + 1
+    decisions: List[List[Any]] = []  # [index, included]
+    remaining = sum(values)
+    total = 0
+    i = 0
+    for _ in range(BNB_MAX_TRIES):
+        backtrack = True
+        if target <= total <= target + tolerance:
+            if total - target < best_excess:
+                best_excess = total - target
+                best = [index for index, included in decisions if included]
+                if best_excess == 0:
+                    break
+        elif total < target and total + remaining >= target and i < len(values):
+            backtrack = False
+
+        if backtrack:
+            # undo trailing exclusions, then exclude the last included value
+            while decisions and not decisions[-1][1]:
+                remaining += values[decisions.pop()[0]]
+            if not decisions:
+                break
+            decisions[-1][1] = False
+            total -= values[decisions[-1][0]]
+            i = decisions[-1][0] + 1
+            continue
+
+        remaining -= values[i]
+        # excluding a value and then including an equal one repeats a branch
+        if decisions and not decisions[-1][1] and values[decisions[-1][0]] == values[i]:
+            decisions.append([i, False])
+        else:
+            decisions.append([i, True])
+            total += values[i]
+        i += 1
+    return best
+
+
+STRATEGIES: Dict[str, Callable[[UtxoPool, int], List[Dict[str, Any]]]] = {
+    'first_fit': first_fit,
+    'largest_first': largest_first,
+    'smallest_sufficient': smallest_sufficient,
+    'min_inputs': min_inputs,
+    'bnb': bnb,
+}
+
+
+# -------------------------------------------------------------------
+# Helper function to select utxos worth at least target with strategy
+# raises InsufficientFundsError when all of them together are not enough
+def select_coins(utxos: List[Dict[str, Any]], target: int, strategy: str = 'first_fit') -> List[Dict[str, Any]]:
+    return STRATEGIES[strategy](UtxoPool(utxos), target)
@@ -0,0 +1,48 @@
+import contextlib
+import io
+import threading
+import traceback
+from typing import Any, Dict, List
+
+# -------------------------------------------------------------------
+# Run a wbt command line inside the current process.
+#
+# The commands print their results and finish with exit(), so run_command
+# captures stdout / stderr and turns SystemExit into an exit code. Anything
+# loaded by an earlier command (modules, the raw-tx cache, the utxo index,
+# the rate limiters) is reused by the next one. Output capture swaps
+# sys.stdout for the whole process, so commands run one at a time; the lock is
+# reentrant so that a batch run by the server can run its own lines.
+
+_run_lock = threading.RLock()
+
+
+# Helper function to map SystemExit.code to a process exit code
+def exit_code_of(code: Any) -> int:
+    if code is None:
+        return 0
+    if isinstance(code, int):
+        return code
+    return 1
+
+
+# -------------------------------------------------------------------
+# Run one command line (without the program name), e.g.
+# ['balance', '-a', '<address>']; returns its exit code and output
+def run_command(argv: List[str]) -> Dict[str, Any]:
+    # imported here: argument_handler pulls in every command module
+    from argument_handler import ArgumentHandler
+
+    output = io.StringIO()
+    exit_code = 0
+    with _run_lock, contextlib.redirect_stdout(output), contextlib.redirect_stderr(output):
+        try:
+            ArgumentHandler(argv)
+        except SystemExit as e:
+            exit_code = exit_code_of(e.code)
+            if isinstance(e.code, str):
+                print(e.code)
+        except Exception:
+            traceback.print_exc()
+            exit_code = 1
+    return {'argv': argv, 'exit_code': exit_code, 'output': output.getvalue()}
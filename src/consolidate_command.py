@@ -1,6 +1,12 @@
-from useful import add_interface_to_config, load_key_from_file, write_to_file, write_to_stdout, network_to_key_type
-from key_functions import balance, utxo_all, get_full_tx
-from typing import Dict, Any
+from useful import add_interface_to_config, load_key_from_file, write_to_file, write_to_stdout, network_to_key_type, numbered_file_name, print_balance
+from key_functions import get_full_tx, fetch_workers, raw_transactions_fetcher
+from interfaces import create_interface, command_fee_rate
+from wallet_snapshot import wallet_snapshot
+from input_resolver import InputResolver
+from fee import DEFAULT_FEE_RATE, estimate_p2pkh_size, fee_for_size, max_inputs_for_size
+from transaction import build_tx_in_worker, broadcast_all
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Any, List
 
 
 class ConsolidateCommand:
@@ -11,7 +17,13 @@ class ConsolidateCommand:
                  network,
                  fee,
                  inform,
-                 out):
+                 out,
+                 batch_size=None,
+                 max_bytes=None,
+                 fee_rate=None,
+                 sign=False,
+                 workers=None,
+                 broadcast=False):
 
         self.sender_key = sender_key
         self.sender = sender
@@ -19,6 +31,17 @@ class ConsolidateCommand:
         self.inform = inform
         self.out = out
         self.network = network
+        # batch mode: split the UTXO set into transactions of at most
+        # batch_size inputs and/or max_bytes bytes, each paying fee_rate
+        # sat/byte (default DEFAULT_FEE_RATE). A fee_rate (sat/byte or 'node')
+        # also replaces the flat fee of a single consolidation.
+        self.batch_size = batch_size
+        self.max_bytes = max_bytes
+        self.fee_rate = fee_rate
+        self.sign = sign
+        self.workers = workers
+        # broadcast the signed batches (regtest: in JSON-RPC batches)
+        self.broadcast = broadcast
         # validates the network and yields the tx_engine key type
         # (regtest -> BSV_Testnet); used when loading .pem sender keys
         self.key_type = network_to_key_type(network)
@@ -42,29 +65,45 @@ class ConsolidateCommand:
 
             key_for_signing, sender_address = load_key_from_file(self.sender_key, toml_, self.key_type)
 
-        # get balance for the sender
-        sender_balance = balance(sender_address, self.network)
-        sender_balance = int(sender_balance['confirmed'] + sender_balance['unconfirmed'])
-        # should check the balance covers the fee
-        amount = sender_balance - self.fee
-        if sender_balance <= amount:
-            print(f"Error: not enough funds to cover fee of {self.fee}")
+        if self.sign and not self.sender_key:
+            print("Error: -sign needs the -sender_key to sign with")
             exit(1)
 
-        sender_utxo = utxo_all(sender_address, self.network)
+        self.fee_rate = command_fee_rate(self.fee_rate, lambda: create_interface(self.network))
 
-        # create transaction inputs (vin)
-        data_dict['transactioninput'] = []
+        # get the sender's utxos (one request); the balance is derived from them
+        snapshot = wallet_snapshot(sender_address, self.network, create_interface(self.network))
+        if snapshot is None:
+            print(f"Error: failed to retrieve the utxos for {sender_address}.")
+            exit(1)
+        print_balance(sender_address, snapshot.balance())
+        sender_utxo = snapshot.utxos
+
+        # the single output must be worth something once the fee is paid
+        # (batch mode checks each batch against its own fee)
+        fee = self.fee
+        if self.fee_rate is not None:
+            fee = fee_for_size(estimate_p2pkh_size(len(sender_utxo), 1), self.fee_rate)
+        amount = snapshot.total - fee
+        batch_mode = self.batch_size or self.max_bytes
+        if not batch_mode and amount <= 0:
+            print(f"Error: not enough funds to cover fee of {fee}")
+            exit(1)
+
+        # create transaction inputs (vin); each distinct parent tx is
+        # downloaded once, concurrently (within the rate limit), or in
+        # JSON-RPC batches on regtest
+        resolver = InputResolver(
+            lambda txid: get_full_tx(txid, self.network),
+            key_for_signing,
+            fetch_workers(self.network),
+            raw_transactions_fetcher(self.network))
+
+        if batch_mode:
+            self.consolidate_in_batches(sender_address, sender_utxo, resolver)
+            return
 
-        for utxo in sender_utxo:
-            full_tx = get_full_tx(utxo['tx_hash'], self.network)
-            data_dict['transactioninput'].append({
-                'tx_hash': utxo['tx_hash'],
-                'tx_pos': utxo['tx_pos'],
-                'amount': utxo['value'],
-                'private_key_for_signing': key_for_signing,
-                'input_tx_hash': full_tx
-            })
+        data_dict['transactioninput'] = resolver.resolve(sender_utxo)
 
         # print out number of utxo's
         print(f"Number of utxo's: {len(sender_utxo)}")
@@ -79,7 +118,10 @@ class ConsolidateCommand:
         # add fee
         data_dict['tx_info'] = {}
         data_dict['tx_info']['create_change_output'] = False
-        data_dict['tx_info']['tx_default_fee'] = self.fee
+        data_dict['tx_info']['tx_default_fee'] = fee
+        if self.fee_rate is not None:
+            data_dict['tx_info']['tx_fee_rate'] = self.fee_rate
+            data_dict['tx_info']['tx_predicted_size'] = estimate_p2pkh_size(len(sender_utxo), 1)
 
         # write to file or stdout; default is stdout
         if self.out:
@@ -87,3 +129,92 @@ class ConsolidateCommand:
             print(f'Parameters generated, saved to file: {self.out}')
         else:
             write_to_stdout(data_dict)
+
+    # --------------------------------------------------------------
+    # number of inputs per batch, from -batch_size and/or -max_bytes
+    def inputs_per_batch(self) -> int:
+        limits = []
+        if self.batch_size:
+            limits.append(self.batch_size)
+        if self.max_bytes:
+            limits.append(max_inputs_for_size(self.max_bytes, 1))
+        return max(1, min(limits))
+
+    # --------------------------------------------------------------
+    # split utxos into batches of inputs
+    def split_batches(self, utxos: List[Dict[str, Any]]) -> List[List[Dict[str, Any]]]:
+        n = self.inputs_per_batch()
+        return [utxos[i:i + n] for i in range(0, len(utxos), n)]
+
+    # --------------------------------------------------------------
+    # parameters for one batch: all its inputs to a single output back to
+    # the sender, paying a fee proportional to the estimated size
+    def batch_parameters(self, sender_address: str, inputs: List[Dict[str, Any]]) -> Dict[Any, Any]:
+        fee_rate = DEFAULT_FEE_RATE if self.fee_rate is None else self.fee_rate
+        size = estimate_p2pkh_size(len(inputs), 1)
+        fee = fee_for_size(size, fee_rate)
+        total = sum(i['amount'] for i in inputs)
+
+        data_dict: Dict[Any, Any] = {}
+        add_interface_to_config(data_dict, self.network)
+        data_dict['transactioninput'] = inputs
+        data_dict['transactionoutput'] = [{
+            'public_key': sender_address,
+            'amount': total - fee,
+            'op_return': False,
+            'data_to_encode': ''
+        }]
+        data_dict['tx_info'] = {
+            'create_change_output': False,
+            'tx_default_fee': fee,
+            'tx_fee_rate': fee_rate,
+            'tx_predicted_size': size
+        }
+        return data_dict
+
+    # --------------------------------------------------------------
+    # consolidate the UTXO set as several transactions, one param file each
+    def consolidate_in_batches(self, sender_address: str, sender_utxo: List[Dict[str, Any]], resolver: InputResolver) -> None:
+        # fetch every parent up front so all batches download concurrently
+        resolver.prefetch(sender_utxo)
+
+        batches = []
+        for utxos in self.split_batches(sender_utxo):
+            params = self.batch_parameters(sender_address, resolver.resolve(utxos))
+            if params['transactionoutput'][0]['amount'] <= 0:
+                print(f"Warning: skipping a batch of {len(utxos)} utxo's worth less than its fee of {params['tx_info']['tx_default_fee']}")
+                continue
+            batches.append(params)
+
+        print(f"Number of utxo's: {len(sender_utxo)}, number of batches: {len(batches)}")
+        for i, params in enumerate(batches):
+            if self.out:
+                filename = numbered_file_name(self.out, i, len(batches))
+                write_to_file(filename, params)
+                print(f'Batch {i + 1}/{len(batches)} parameters generated, saved to file: {filename}')
+            else:
+                print(f'# batch {i + 1}/{len(batches)}')
+                write_to_stdout(params)
+
+        if self.sign:
+            signed = self.sign_batches(batches)
+            if self.broadcast:
+                broadcast_all(signed, self.network, 'batches')
+
+    # --------------------------------------------------------------
+    # build and sign the batches in parallel worker processes
+    def sign_batches(self, batches: List[Dict[Any, Any]]) -> List[str]:
+        signed: List[str] = []
+        with ProcessPoolExecutor(max_workers=self.workers) as executor:
+            for tx, output in executor.map(build_tx_in_worker, batches):
+                print(output, end='')
+                signed.append(tx)
+
+        for i, tx in enumerate(signed):
+            if self.out:
+                filename = numbered_file_name(self.out, i, len(signed), '.hex')
+                write_to_file(filename, tx, is_toml=False)
+                print(f'Batch {i + 1}/{len(signed)} signed, saved to file: {filename}')
+            else:
+                print(f'Batch {i + 1}/{len(signed)} serialised transaction: \n\n{tx}\n')
+        return signed
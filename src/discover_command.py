@@ -0,0 +1,121 @@
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Tuple
+
+import toml
+
+from hd_wallet import read_manifest, account_addresses
+from key_functions import balances_all, histories_all
+from useful import write_to_file
+
+# -------------------------------------------------------------------
+# wbt discover: find the used receive addresses of an HD account manifest.
+#
+# The addresses are derived from the manifest's xpub in windows of
+# DISCOVERY_WINDOW. Each window is queried at once: bulk history and bulk
+# balance requests (20 addresses each on WoC) run concurrently. An address is
+# used if it has a confirmed transaction or a balance (which covers
+# unconfirmed receipts). The scan stops once the last gap_limit addresses
+# are all unused.
+#
+# The last used index is saved in the manifest (last_used), and count is
+# raised to cover it so 'balance --all' lists every used address. The next
+# discover resumes after last_used; -rescan starts again from 'from'.
+
+DISCOVERY_WINDOW = 100
+DEFAULT_GAP_LIMIT = 20
+
+
+# Helper function to tell which addresses are used; raises ValueError for an
+# address neither query answered
+def used_addresses(addresses: List[str], network: str) -> Dict[str, bool]:
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        histories = executor.submit(histories_all, addresses, network)
+        balances = executor.submit(balances_all, addresses, network)
+        history, balance = histories.result(), balances.result()
+
+    used = {}
+    for address in addresses:
+        if history.get(address) is None and balance.get(address) is None:
+            raise ValueError(f"could not get the history or balance of {address}")
+        funds = balance.get(address) or {}
+        used[address] = bool(history.get(address)) or bool(funds.get('confirmed') or funds.get('unconfirmed'))
+    return used
+
+
+# Helper function to scan the addresses of xpub from index start; last_used
+# is the last index known to be used (start - 1 if none). Returns the new
+# last used index and the [(index, address)] found used.
+def discover(xpub: str, network: str, start: int, last_used: int,
+             gap_limit: int = DEFAULT_GAP_LIMIT, window: int = DISCOVERY_WINDOW) -> Tuple[int, List[Tuple[int, str]]]:
+    found: List[Tuple[int, str]] = []
+    index = start
+    while True:
+        addresses = account_addresses(xpub, index, window)
+        used = used_addresses(addresses, network)
+        for i, address in enumerate(addresses, index):
+            if used[address]:
+                last_used = i
+                found.append((i, address))
+        index += window
+        if index - 1 - last_used >= gap_limit:
+            return last_used, found
+
+
+class DiscoverCommand:
+
+    def __init__(self,
+                 input_file: str,
+                 network: str = 'testnet',
+                 gap_limit: int = DEFAULT_GAP_LIMIT,
+                 window: int = DISCOVERY_WINDOW,
+                 rescan: bool = False):
+        # account manifest (.hd) in the data directory
+        self.input_file = input_file
+        self.network = network
+        self.gap_limit = gap_limit
+        self.window = window
+        self.rescan = rescan
+
+    def load_account(self) -> Dict[str, Any]:
+        try:
+            account = read_manifest(self.input_file)
+        except (OSError, toml.TomlDecodeError, KeyError, ValueError) as e:
+            print(f"Error: cannot read account manifest {self.input_file}: {e}")
+            exit(1)
+        if account['network'] != ('testnet' if self.network == 'regtest' else self.network):
+            print(f"Error: {self.input_file} is a {account['network']} account, not {self.network}")
+            exit(1)
+        return account
+
+    def run(self):
+        if self.gap_limit < 1 or self.window < 1:
+            print("Error: -gap and -window must be >= 1")
+            exit(1)
+        account = self.load_account()
+        first = int(account['from'])
+        last_used = first - 1
+        if not self.rescan and 'last_used' in account:
+            last_used = max(last_used, int(account['last_used']))
+        start = last_used + 1
+
+        print(f'\n  -> Running bbt discover, {self.input_file} from index {start}, gap limit {self.gap_limit}, network={self.network}')
+        try:
+            last_used, found = discover(account['xpub'], self.network, start, last_used, self.gap_limit, self.window)
+        except ValueError as e:
+            print(f"Error: {e}")
+            exit(1)
+
+        for index, address in found:
+            print(f'\n    * {self.input_file}/{index}')
+            print(f'      -> bitcoin address: {address}')
+
+        if last_used < first:
+            print(f'\nNo used address found in {self.input_file}.')
+            return
+        print(f'\nLast used index: {last_used}')
+        count = max(int(account['count']), last_used + 1 - first)
+        if account.get('last_used') != last_used or account['count'] != count:
+            account['last_used'] = last_used
+            account['count'] = count
+            write_to_file(self.input_file, {'hd_account': account}, True)
+            print(f'{self.input_file} updated (count = {count})')
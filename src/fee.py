@@ -0,0 +1,73 @@
+import math
+from typing import List, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    # annotation only: coin_selection (and so the cli parser) imports this module
+    from tx_engine import Tx
+
+# -------------------------------------------------------------------
+# Transaction size and fee estimates for P2PKH (and OP_RETURN) transactions.
+#
+# Sizes are upper bounds on the serialised transaction:
+#   version (4) + input count + inputs + output count + outputs + locktime (4)
+#   P2PKH input:  outpoint (36) + script length (1) + scriptSig (<= 107) + sequence (4)
+#   P2PKH output: amount (8) + script length (1) + locking script (25)
+#
+# The scriptSig bound is exact for our signatures: a low-S DER signature is at
+# most 71 bytes, plus the sighash byte, plus a 33 byte compressed public key,
+# plus the two push opcodes. A fee computed from the predicted size before
+# signing therefore never falls short of fee_rate once signed.
+
+DEFAULT_FEE_RATE = 0.5  # satoshis per byte
+P2PKH_INPUT_SIZE = 148
+P2PKH_OUTPUT_SIZE = 34
+P2PKH_SCRIPT_SIG_SIZE = 107
+P2PKH_SCRIPT_SIZE = 25
+CHANGE_DUST_LIMIT = 300  # change of this many satoshis or less is left to the fee
+
+
+# -------------------------------------------------------------------
+# Helper function to return the size of a Bitcoin varint
+def varint_size(n: int) -> int:
+    if n < 0xfd:
+        return 1
+    if n <= 0xffff:
+        return 3
+    if n <= 0xffffffff:
+        return 5
+    return 9
+
+
+# -------------------------------------------------------------------
+# Estimated size in bytes of a transaction with P2PKH inputs and outputs
+def estimate_p2pkh_size(n_inputs: int, n_outputs: int) -> int:
+    return 8 + varint_size(n_inputs) + varint_size(n_outputs) + n_inputs * P2PKH_INPUT_SIZE + n_outputs * P2PKH_OUTPUT_SIZE
+
+
+# -------------------------------------------------------------------
+# Estimated size in bytes of a transaction with P2PKH inputs and outputs
+# with locking scripts of the given sizes
+def estimate_size(n_inputs: int, output_script_sizes: List[int]) -> int:
+    outputs = sum(8 + varint_size(n) + n for n in output_script_sizes)
+    return 8 + varint_size(n_inputs) + varint_size(len(output_script_sizes)) + n_inputs * P2PKH_INPUT_SIZE + outputs
+
+
+# -------------------------------------------------------------------
+# Size in bytes of the unsigned (P2PKH input) tx once it has been signed
+def predict_signed_size(tx: 'Tx') -> int:
+    return len(tx.serialize()) + len(tx.tx_ins) * P2PKH_SCRIPT_SIG_SIZE
+
+
+# -------------------------------------------------------------------
+# Largest number of P2PKH inputs that keeps the transaction within max_bytes
+def max_inputs_for_size(max_bytes: int, n_outputs: int) -> int:
+    n_inputs = (max_bytes - estimate_p2pkh_size(0, n_outputs)) // P2PKH_INPUT_SIZE
+    while n_inputs > 1 and estimate_p2pkh_size(n_inputs, n_outputs) > max_bytes:
+        n_inputs -= 1
+    return max(1, n_inputs)
+
+
+# -------------------------------------------------------------------
+# Fee in satoshis for a transaction of size bytes at fee_rate sat/byte
+def fee_for_size(size: int, fee_rate: float) -> int:
+    return math.ceil(size * fee_rate)
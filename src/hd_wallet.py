@@ -0,0 +1,143 @@
+import hashlib
+import os
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import toml
+
+from useful import path, network_to_key_type
+
+# -------------------------------------------------------------------
+# HD (BIP32) accounts.
+#
+# 'key -s <seed> -n <nonce>' pays 100000 PBKDF2 rounds for every key. In HD
+# mode the PBKDF2 output of the seed and nonce is used once, as the BIP32
+# seed of a master key; the receive addresses of an account are its
+# children
+#
+#   m/<account>'/0/<index>
+#
+# which cost one EC derivation each from the chain key m/<account>'/0.
+#
+# An account manifest (.hd, TOML) records the account so the addresses can
+# be listed without one file per key. It holds the account xpub, not the
+# seed, nonce or any private key:
+#
+#   [hd_account]
+#   network = "testnet"
+#   account = 0
+#   xpub = "tpub..."      # m/<account>'
+#   from = 0              # first index in use
+#   count = 100           # number of indexes in use
+
+EXTERNAL_CHAIN = 0
+
+
+# -------------------------------------------------------------------
+# Helper function to create the master HdWallet of a seed and nonce
+def master_wallet(seed: str, nonce: str, network: str = 'testnet') -> Any:
+    from tx_engine import HdWallet
+
+    dk = hashlib.pbkdf2_hmac('sha256', seed.encode('utf-8'), nonce.encode('utf-8'), 100000)
+    return HdWallet.from_seed(network_to_key_type(network), dk)
+
+
+def account_path(account: int) -> str:
+    return f"m/{account}'"
+
+
+def address_path(account: int, index: int) -> str:
+    return f"m/{account}'/{EXTERNAL_CHAIN}/{index}"
+
+
+# -------------------------------------------------------------------
+# Helper function to derive (index, path, address, WIF private key) for
+# count receive addresses of account from index start; the private key is
+# None unless private is set (a private derivation costs about three
+# times an address)
+def derive_keys(master: Any, account: int, start: int, count: int, private: bool = False) -> Iterator[Tuple[int, str, str, Optional[str]]]:
+    from tx_engine import HdWallet, HdWatchWallet
+
+    chain = f"{account_path(account)}/{EXTERNAL_CHAIN}"
+    if private:
+        chain_wallet = HdWallet.from_xprv(master.derive_xprv(chain))
+        for index in range(start, start + count):
+            wallet = chain_wallet.wallet_at_path(f"m/{index}")
+            yield index, address_path(account, index), wallet.get_address(), wallet.to_wif()
+    else:
+        watch = HdWatchWallet.from_xpub(master.derive_xpub(chain))
+        for index in range(start, start + count):
+            yield index, address_path(account, index), watch.address_at_path(f"M/{index}"), None
+
+
+# Helper function to derive the receive addresses [start, start + count)
+# of an account from its xpub
+def account_addresses(xpub: str, start: int, count: int) -> List[str]:
+    from tx_engine import HdWatchWallet
+
+    watch = HdWatchWallet.from_xpub(HdWatchWallet.from_xpub(xpub).derive_xpub(f"M/{EXTERNAL_CHAIN}"))
+    return [watch.address_at_path(f"M/{index}") for index in range(start, start + count)]
+
+
+# Helper function to return the same addresses as account_addresses, taking
+# the ones derived before from the key index and deriving only the rest
+def indexed_account_addresses(xpub: str, start: int, count: int) -> List[str]:
+    from key_index import get_key_index
+
+    index = get_key_index()
+    if index is None:
+        return account_addresses(xpub, start, count)
+
+    known = index.hd_addresses(xpub, start, count)
+    missing = [i for i in range(start, start + count) if i not in known]
+    if missing:
+        # the missing indexes are usually one run (a new account, or count raised)
+        first, last = missing[0], missing[-1]
+        derived = dict(zip(range(first, last + 1), account_addresses(xpub, first, last + 1 - first)))
+        index.add_hd_addresses(xpub, {i: derived[i] for i in missing})
+        known.update(derived)
+    return [known[i] for i in range(start, start + count)]
+
+
+# -------------------------------------------------------------------
+# Helper functions to write and read an account manifest in the data directory
+def account_manifest(master: Any, network: str, account: int, start: int, count: int) -> Dict[str, Any]:
+    return {'hd_account': {'network': 'mainnet' if network == 'mainnet' else 'testnet',
+                           'account': account,
+                           'xpub': master.derive_xpub(account_path(account)),
+                           'from': start,
+                           'count': count}}
+
+
+def read_manifest(filename: str) -> Dict[str, Any]:
+    with open(os.path.join(path, filename), 'r') as file:
+        data_dict = toml.load(file)
+    account = data_dict['hd_account']
+    for field in ('network', 'account', 'xpub', 'from', 'count'):
+        if field not in account:
+            raise ValueError(f"{field} not found in [hd_account] of {filename}")
+    return account
+
+
+# -------------------------------------------------------------------
+# Helper function to list the addresses of every account manifest (.hd) in
+# the data directory for network, as (file/index, address); the addresses
+# come from the key index once derived
+def hd_keys(network: str) -> List[Tuple[str, str]]:
+    if network == 'regtest':
+        network = 'testnet'
+
+    keys: List[Tuple[str, str]] = []
+    for filename in sorted(os.listdir(path)):
+        if not filename.endswith('.hd'):
+            continue
+        try:
+            account = read_manifest(filename)
+        except (OSError, toml.TomlDecodeError, KeyError, ValueError) as e:
+            print(f"Warning: skipping {filename}: {e}")
+            continue
+        if account['network'] != network:
+            continue
+        start = int(account['from'])
+        addresses = indexed_account_addresses(account['xpub'], start, int(account['count']))
+        keys.extend((f"{filename}/{index}", address) for index, address in enumerate(addresses, start))
+    return keys
@@ -0,0 +1,46 @@
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+from key_functions import fetch_raw_transactions
+
+
+# -------------------------------------------------------------------
+# Turns UTXOs into [[transactioninput]] entries for a param file.
+#
+# Every input needs the full parent transaction so build_tx can sign it.
+# The resolver downloads each distinct parent exactly once, concurrently
+# when max_workers > 1, and remembers it for later resolve() calls. A
+# wallet that received many outputs from one fan-out transaction therefore
+# costs a single download. With fetch_many(txids) -> {txid: raw_tx} (the
+# regtest node's JSON-RPC batches) all missing parents go in one call
+# instead. Used by both TransactionCommand and ConsolidateCommand.
+class InputResolver:
+
+    def __init__(self,
+                 fetch: Callable[[str], Optional[str]],
+                 key_for_signing: str,
+                 max_workers: int = 1,
+                 fetch_many: Optional[Callable[[List[str]], Dict[str, Optional[str]]]] = None):
+        self.fetch = fetch
+        self.key_for_signing = key_for_signing
+        self.max_workers = max_workers
+        self.fetch_many = fetch_many
+        self.parents: Dict[str, Optional[str]] = {}
+
+    # download any parents not seen yet
+    def prefetch(self, utxos: Iterable[Dict[str, Any]]) -> None:
+        missing = list(dict.fromkeys(utxo['tx_hash'] for utxo in utxos if utxo['tx_hash'] not in self.parents))
+        if self.fetch_many is not None and missing:
+            self.parents.update(self.fetch_many(missing))
+        else:
+            self.parents.update(fetch_raw_transactions(missing, self.fetch, self.max_workers))
+
+    # return the transaction inputs for utxos, in UTXO order
+    def resolve(self, utxos: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        self.prefetch(utxos)
+        return [{
+            'tx_hash': utxo['tx_hash'],
+            'tx_pos': utxo['tx_pos'],
+            'amount': utxo['value'],
+            'input_tx_hash': self.parents[utxo['tx_hash']],
+            'private_key_for_signing': self.key_for_signing
+        } for utxo in utxos]
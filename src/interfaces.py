@@ -0,0 +1,244 @@
+import threading
+from typing import Any, Callable, Dict, List, MutableMapping, Optional, Tuple
+
+import requests
+from requests.adapters import HTTPAdapter
+from tx_engine import interface_factory, WoCInterface
+from tx_engine.interface.rpc_interface import RPCInterface, RPCReturnInfo
+from tx_engine.interface.woc import get_url
+
+from rate_limiter import limited_request
+from useful import build_interface_config
+
+# the WoC bulk address endpoints take at most this many addresses
+BULK_ADDRESS_LIMIT = 20
+
+# keep-alive connections kept per WoC host; enough for WBT_FETCH_WORKERS
+# downloads at once (more still work, over short-lived connections)
+HTTP_POOL_SIZE = 16
+
+# calls sent to the regtest node in one JSON-RPC batch request
+RPC_BATCH_SIZE = 500
+
+
+# -------------------------------------------------------------------
+# WhatsOnChain interface whose requests all go through the shared
+# per-network rate limiter (see rate_limiter.py). Only the endpoints the
+# tool uses are overridden; the rest fall back to tx_engine.
+class RateLimitedWoCInterface(WoCInterface):
+
+    def __init__(self, network: str):
+        super().__init__()
+        self.network = network
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=HTTP_POOL_SIZE)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+    def _url(self, endpoint: str) -> str:
+        return f"{get_url(self.is_testnet())}/{endpoint}"
+
+    def _get_json(self, endpoint: str) -> Any:
+        response = limited_request(self.network, 'GET', self._url(endpoint), session=self.session)
+        if response is None or response.status_code != 200:
+            return None
+        return response.json()
+
+    def _post_json(self, endpoint: str, payload: Any) -> Any:
+        response = limited_request(self.network, 'POST', self._url(endpoint), session=self.session, idempotent=True, json=payload)
+        if response is None or response.status_code != 200:
+            return None
+        return response.json()
+
+    # POST addresses/<field> for up to BULK_ADDRESS_LIMIT addresses; returns
+    # {address: result} for the addresses WoC answered without an error. The
+    # result is under key (default: field) in each answer.
+    def _get_bulk(self, field: str, addresses: List[str], key: Optional[str] = None) -> Dict[str, Any]:
+        key = key or field
+        results = self._post_json(f"addresses/{field}", {"addresses": addresses})
+        if not isinstance(results, list):
+            return {}
+        return {r['address']: r[key] for r in results
+                if isinstance(r, dict) and 'address' in r and key in r and not r.get('error')}
+
+    def get_utxo(self, address):
+        return self._get_json(f"address/{address}/unspent")
+
+    def get_bulk_utxo(self, addresses: List[str]) -> Dict[str, Any]:
+        return self._get_bulk('unspent', addresses)
+
+    def get_bulk_balance(self, addresses: List[str]) -> Dict[str, Any]:
+        return self._get_bulk('balance', addresses)
+
+    def get_balance(self, address):
+        return self._get_json(f"address/{address}/balance")
+
+    def get_addr_history(self, address):
+        return self._get_json(f"address/{address}/history")
+
+    # confirmed transactions of each address (first page)
+    def get_bulk_history(self, addresses: List[str]) -> Dict[str, Any]:
+        return self._get_bulk('confirmed/history', addresses, 'result')
+
+    def get_raw_transaction(self, txid: str) -> Optional[str]:
+        response = limited_request(self.network, 'GET', self._url(f"tx/{txid}/hex"), session=self.session)
+        if response is None or response.status_code != 200:
+            return None
+        return response.text
+
+    def broadcast_tx(self, transaction: str):
+        data = '{"txhex":"' + transaction + '"}'
+        return limited_request(self.network, 'POST', self._url("tx/raw"), session=self.session, data=data)
+
+
+# -------------------------------------------------------------------
+# Regtest node interface that can send many calls in one JSON-RPC batch
+# (one HTTP POST carrying an array of calls), for parent-tx downloads and
+# multi-transaction broadcasts. Single calls still go through tx_engine.
+class BatchingRPCInterface(RPCInterface):
+
+    def set_config(self, config):
+        super().set_config(config)
+        self.url = f"http://{self.address}/"
+        self.session = requests.Session()
+
+    # send calls ([method, param, ...]) in batches of RPC_BATCH_SIZE and
+    # return (result, error) per call, in order; error is the node's
+    # {'code', 'message'} for that call, or the HTTP / connection error for
+    # its batch
+    def _batch(self, calls: List[List[Any]]) -> List[Tuple[Any, Optional[Dict[str, Any]]]]:
+        results: List[Tuple[Any, Optional[Dict[str, Any]]]] = []
+        for start in range(0, len(calls), RPC_BATCH_SIZE):
+            chunk = calls[start:start + RPC_BATCH_SIZE]
+            payload = [{'jsonrpc': '1.0', 'id': i, 'method': call[0], 'params': call[1:]} for i, call in enumerate(chunk)]
+            error: Optional[Dict[str, Any]] = None
+            try:
+                response = self.session.post(self.url, json=payload, auth=(self.user, self.password), timeout=300)
+                answer_list = response.json()
+                if not isinstance(answer_list, list):
+                    raise ValueError("not a batch answer")
+                answers = {answer['id']: answer for answer in answer_list}
+            except requests.RequestException as e:
+                error = {'code': -1, 'message': str(e)}
+            except (ValueError, TypeError, KeyError):
+                error = {'code': response.status_code, 'message': response.text}
+            if error is not None:
+                results.extend((None, error) for _ in chunk)
+                continue
+            for i in range(len(chunk)):
+                answer = answers.get(i, {'error': {'code': -1, 'message': 'no answer in batch'}})
+                results.append((answer.get('result'), answer.get('error')))
+        return results
+
+    # {txid: raw tx, or None if the node does not have it}
+    def get_raw_transactions(self, txids: List[str]) -> Dict[str, Optional[str]]:
+        distinct = list(dict.fromkeys(txids))
+        results = self._batch([['getrawtransaction', txid] for txid in distinct])
+        return {txid: result for txid, (result, _) in zip(distinct, results)}
+
+    # broadcast the transactions in order; one broadcast_tx style response each
+    def broadcast_many(self, tx_hexes: List[str]) -> List[RPCReturnInfo]:
+        responses = []
+        for result, error in self._batch([['sendrawtransaction', tx_hex] for tx_hex in tx_hexes]):
+            if error is None:
+                response = RPCReturnInfo(result)
+                response.status_code = 200
+            else:
+                response = RPCReturnInfo(error.get('message'))
+                response.status_code = error.get('code', -1)
+            responses.append(response)
+        return responses
+
+
+# -------------------------------------------------------------------
+# Interfaces are created once per network config and reused for the rest of
+# the process (and across commands in serve / batch mode):
+#
+#   woc   one per network, shared by all threads; its requests.Session
+#         keeps the TCP / TLS connections to WhatsOnChain alive
+#   rpc   one per thread, since the JSON-RPC connection (which stays open
+#         between calls) is not thread safe
+#   mock  never shared: each test sets up its own utxos and transactions
+_interfaces: Dict[Tuple, Any] = {}
+_interfaces_lock = threading.Lock()
+_thread_interfaces = threading.local()
+
+
+def _new_interface(network: str, config: MutableMapping[str, Any]):
+    interface: Any
+    if config['interface_type'] == 'woc':
+        interface = RateLimitedWoCInterface(network)
+    elif config['interface_type'] == 'rpc':
+        interface = BatchingRPCInterface()
+    else:
+        return interface_factory.set_config(config)
+    interface.set_config(config)
+    return interface
+
+
+# -------------------------------------------------------------------
+# Helper function to get the blockchain interface for a network.
+# All commands should get their interface here rather than from
+# interface_factory directly, so WoC traffic is always rate limited
+# and connections are reused.
+def create_interface(network: str):
+    config = build_interface_config(network)
+    if config['interface_type'] == 'mock':
+        return _new_interface(network, config)
+
+    key = (network,) + tuple(sorted(config.items()))
+    if config['interface_type'] == 'rpc':
+        interfaces = getattr(_thread_interfaces, 'interfaces', None)
+        if interfaces is None:
+            interfaces = _thread_interfaces.interfaces = {}
+    else:
+        interfaces = _interfaces
+
+    with _interfaces_lock:
+        if key not in interfaces:
+            interfaces[key] = _new_interface(network, config)
+        return interfaces[key]
+
+
+# Helper function to drop the shared interfaces (the rpc ones of the calling
+# thread); the next create_interface call makes new ones
+def clear_interfaces() -> None:
+    with _interfaces_lock:
+        _interfaces.clear()
+        _thread_interfaces.interfaces = {}
+
+
+# -------------------------------------------------------------------
+# Helper function to map the [interface] table of a param file back to the
+# network it was generated for
+def network_from_interface(iface: MutableMapping[str, Any]) -> str:
+    interface_types: Dict[str, str] = {'rpc': 'regtest', 'mock': 'mock'}
+    if iface.get('interface_type') in interface_types:
+        return interface_types[iface['interface_type']]
+    return iface.get('network_type', 'testnet')
+
+
+# -------------------------------------------------------------------
+# Helper function to turn a -fee_rate into sat/byte. 'node' asks the
+# regtest node for its minimum relay fee (getnetworkinfo relayfee, BSV/kB),
+# the lowest rate it accepts, not an estimate of what gets mined;
+# get_interface is only called then, so other rates need no interface
+def resolve_fee_rate(fee_rate, get_interface: Callable[[], Any]) -> Optional[float]:
+    if fee_rate != 'node':
+        return fee_rate
+    rpc_connection = getattr(get_interface(), 'rpc_connection', None)
+    if rpc_connection is None:
+        raise ValueError("-fee_rate node needs a node to ask, use it with --network regtest.")
+    relay_fee = rpc_connection.getnetworkinfo()['relayfee']
+    return float(relay_fee) * 100000000 / 1000
+
+
+# Helper function for the commands: resolve_fee_rate, or default when no
+# -fee_rate was given; reports a -fee_rate that cannot be resolved and exits
+def command_fee_rate(fee_rate, get_interface: Callable[[], Any], default: Optional[float] = None) -> Optional[float]:
+    try:
+        fee_rate = resolve_fee_rate(fee_rate, get_interface)
+    except ValueError as e:
+        print(f"Error: {e}")
+        exit(1)
+    return default if fee_rate is None else fee_rate
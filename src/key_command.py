@@ -1,5 +1,7 @@
-from useful import write_to_file, write_to_stdout, read_toml_file, print_keys
-from key_functions import generate_key
+from useful import write_to_file, write_to_stdout, read_toml_file, print_keys, numbered_file_name
+from key_functions import generate_key, generate_keys
+from hd_wallet import master_wallet, derive_keys, account_manifest
+import json
 import os
 
 # set directory path to the environment variable or default to /app/data
@@ -18,7 +20,14 @@ class KeyCommand:
                  genparam=None,
                  outform='toml',
                  list_all=None,
-                 network='testnet'):
+                 network='testnet',
+                 batch_file=None,
+                 workers=None,
+                 show_seed=False,
+                 hd=False,
+                 start=0,
+                 count=20,
+                 account=0):
         self.seed = seed
         self.nonce = nonce
         self.output_file = output_file
@@ -27,6 +36,16 @@ class KeyCommand:
         self.outform = outform
         self.list_all = list_all
         self.network = network
+        # batch file with many seed / nonce pairs, and the worker processes to derive them
+        self.batch_file = batch_file
+        self.workers = workers
+        # print the seed and nonce (which give the private key) in the batch lines
+        self.show_seed = show_seed
+        # HD mode: count receive addresses of account from index start
+        self.hd = hd
+        self.start = start
+        self.count = count
+        self.account = account
 
     # generate parameters from seed and nonce
     def generate_parameters(self):
@@ -55,9 +74,8 @@ class KeyCommand:
             write_to_stdout(data_dict, toml)
         return
 
-    # generate key from seed and nonce
-    def generate_key(self):
-        # check if a parameter file is provided
+    # read seed and nonce from the parameter file, if one is provided
+    def load_parameters(self):
         if self.param_file:
 
             # read parameter file
@@ -76,6 +94,10 @@ class KeyCommand:
                 print(f'Error: key_input not found in {self.param_file} file. Exiting...\n')
                 exit(1)
 
+    # generate key from seed and nonce
+    def generate_key(self):
+        self.load_parameters()
+
         pem = self.outform == 'pem'
 
         print(f'\n  -> Running bbt key, seed={self.seed}, nonce={self.nonce}, network={self.network}')
@@ -92,12 +114,98 @@ class KeyCommand:
             write_to_stdout(key, is_toml)
         return
 
+    # read the (seed, nonce, output file or None) entries of the batch file:
+    #   [[key_input]]   seed, nonce and an optional out file name
+    #   [[key_range]]   seed, start, count and an optional nonce_prefix;
+    #                   nonces are nonce_prefix + start .. nonce_prefix + start + count - 1
+    # a single [key_input] table, as written by -genparam, is also accepted
+    def read_batch(self):
+        data_dict = read_toml_file(self.batch_file)
+        inputs = data_dict.get('key_input', [])
+        if isinstance(inputs, dict):
+            inputs = [inputs]
+
+        entries = []
+        try:
+            for item in inputs:
+                entries.append((str(item['seed']), str(item['nonce']), item.get('out')))
+            for item in data_dict.get('key_range', []):
+                prefix = str(item.get('nonce_prefix', ''))
+                start = int(item.get('start', 0))
+                for n in range(start, start + int(item['count'])):
+                    entries.append((str(item['seed']), f"{prefix}{n}", None))
+        except (KeyError, TypeError, ValueError, AttributeError) as e:
+            print(f'Error: invalid key_input or key_range in {self.batch_file} file ({e}). Exiting...\n')
+            exit(1)
+
+        if not entries:
+            print(f'Error: no key_input or key_range found in {self.batch_file} file. Exiting...\n')
+            exit(1)
+        return entries
+
+    # generate the keys of the batch file across worker processes; one JSON
+    # line per key, in batch order. With -out every key is written to its own
+    # file (the entry's out, or the -out name numbered); without it the key
+    # itself is in the JSON line. The seed and nonce, which reproduce the key,
+    # are only in the line with -show_seed.
+    def generate_batch(self):
+        entries = self.read_batch()
+        pem = self.outform == 'pem'
+        pairs = [(seed, nonce) for seed, nonce, _ in entries]
+
+        for i, ((seed, nonce, out), (key, address)) in enumerate(zip(entries, generate_keys(pairs, self.network, pem, self.workers))):
+            line = {'seed': seed, 'nonce': nonce} if self.show_seed else {}
+            line['address'] = address
+            if out or self.output_file:
+                out = out or numbered_file_name(self.output_file, i, len(entries))
+                write_to_file(out, key, not pem)
+                line['file'] = out
+            elif pem:
+                line['pem'] = key
+            else:
+                line['private_key'] = key['key_info']['private_key']
+            print(json.dumps(line), flush=True)
+
+    # HD mode: one PBKDF2 derivation for the master key, then one JSON line per
+    # receive address (index, path, address). With -out the account manifest
+    # is written instead of the private keys, which are in the JSON lines
+    # otherwise.
+    def generate_hd(self):
+        self.load_parameters()
+        if not (self.seed and self.nonce):
+            print('Error: seed and nonce required to generate HD keys')
+            exit(1)
+        if self.start < 0 or self.count < 1 or self.account < 0:
+            print('Error: -from and -account must be >= 0 and -count >= 1')
+            exit(1)
+
+        master = master_wallet(self.seed, self.nonce, self.network)
+        private = not self.output_file
+        for index, key_path, address, private_key in derive_keys(master, self.account, self.start, self.count, private):
+            line = {'index': index, 'path': key_path, 'address': address}
+            if private_key is not None:
+                line['private_key'] = private_key
+            print(json.dumps(line), flush=True)
+
+        if self.output_file:
+            write_to_file(self.output_file, account_manifest(master, self.network, self.account, self.start, self.count), True)
+
     def run(self):
         # generate parameter file from command line parameters
         if self.genparam:
             self.generate_parameters()
             exit(0)
 
+        # generate HD receive addresses from seed and nonce
+        elif self.hd:
+            self.generate_hd()
+            exit(0)
+
+        # generate many keys from a batch file
+        elif self.batch_file:
+            self.generate_batch()
+            exit(0)
+
         # generate key from parameter file
         elif self.param_file or (self.seed and self.nonce):
             self.generate_key()
@@ -1,8 +1,9 @@
 import hashlib
 import pprint
 import os
-from useful import network_to_key_type
-from time import sleep
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+from useful import network_to_key_type, print_balance
 
 # set directory path to the environment variable or default to /app/data
 if 'DATA_PATH' in os.environ:
@@ -10,17 +11,23 @@ if 'DATA_PATH' in os.environ:
 else:
     path = '/app/data'
 
-from tx_engine import interface_factory
 from tx_engine import Wallet, create_pem_from_wallet
-from useful import build_interface_config
+from interfaces import create_interface, BULK_ADDRESS_LIMIT
+from tx_cache import cached_raw_transaction, cached_raw_transactions
+from utxo_index import address_utxos, cached_balance, get_utxo_index
 
 
-def generate_key(nameSeed, nonce, network='testnet', pem=False):
-
+# derive the wallet for a seed and nonce (PBKDF2-HMAC-SHA256, 100000 rounds)
+def derive_wallet(nameSeed, nonce, network='testnet'):
     dk = hashlib.pbkdf2_hmac('sha256', nameSeed.encode('utf-8'), nonce.encode('utf-8'), 100000)
 
     key_type = network_to_key_type(network)
-    myPrivKey = Wallet.from_int(network=key_type, int_rep=int(dk.hex(), 16))
+    return Wallet.from_int(network=key_type, int_rep=int(dk.hex(), 16))
+
+
+def generate_key(nameSeed, nonce, network='testnet', pem=False):
+
+    myPrivKey = derive_wallet(nameSeed, nonce, network)
 
     if pem:
         return (create_pem_from_wallet(myPrivKey))
@@ -29,25 +36,45 @@ def generate_key(nameSeed, nonce, network='testnet', pem=False):
                 }
 
 
+# keys derived per task sent to a worker process by generate_keys
+KEY_CHUNK_SIZE = 32
+
+
+# (key as generate_key returns it, bitcoin address)
+def _generate_key_job(job: Tuple[str, str, str, bool]) -> Tuple[Any, str]:
+    seed, nonce, network, pem = job
+    key = derive_wallet(seed, nonce, network)
+    if pem:
+        return create_pem_from_wallet(key), key.get_address()
+    return {'key_info': {'private_key': Wallet.to_wif(key), 'bitcoin_address': key.get_address()}}, key.get_address()
+
+
+# generate the keys for many (seed, nonce) pairs across worker processes
+# (default: one per core), yielding (key, address) in the order of pairs
+# as they are ready
+def generate_keys(pairs: Iterable[Tuple[str, str]], network: str = 'testnet', pem: bool = False, workers: Optional[int] = None) -> Iterator[Tuple[Any, str]]:
+    jobs = [(seed, nonce, network, pem) for seed, nonce in pairs]
+    workers = workers or os.cpu_count() or 1
+    if workers <= 1 or len(jobs) <= 1:
+        yield from map(_generate_key_job, jobs)
+        return
+    with ProcessPoolExecutor(max_workers=min(workers, len(jobs))) as executor:
+        yield from executor.map(_generate_key_job, jobs, chunksize=KEY_CHUNK_SIZE)
+
+
 # get balance for address, network
 # return balance
 def balance(address, network):
-    config = build_interface_config(network)
-
-    interface = interface_factory.set_config(config)
+    interface = create_interface(network)
     test_balance = interface.get_balance(address)
-    print('\n------------------------------------------------------------------------------------')
-    print('PubKey: \t{}\nBalance: \t{}'.format(address, test_balance))
-    print('------------------------------------------------------------------------------------\n')
+    print_balance(address, test_balance)
     return test_balance
 
 
 # get utxo for address, network
 # return utxo
 def utxo(address, network):
-    config = build_interface_config(network)
-
-    bsv_client = interface_factory.set_config(config)
+    bsv_client = create_interface(network)
     unspent = bsv_client.get_utxo(address)
     print('\n<-------------------------------------------------------->\n')
     print(f"Unspent UTXOs: \t{unspent}")
@@ -57,12 +84,12 @@ def utxo(address, network):
     return unspent
 
 
-# get all utxo's for address, network
+# get all utxo's for address, network (and sync the local utxo index)
 # return vin
 def utxo_all(address, network):
-    config = build_interface_config(network)
-    bsv_client = interface_factory.set_config(config)
-    unspent = bsv_client.get_utxo(address)
+    bsv_client = create_interface(network)
+    unspent = address_utxos(address, network, bsv_client)
+    assert (unspent is not None)
 
     vin = []
     for utxo in unspent:
@@ -71,12 +98,93 @@ def utxo_all(address, network):
     return vin
 
 
-def get_full_tx(txid: str, network: str) -> str:
-    config = build_interface_config(network)
-    bsv_client = interface_factory.set_config(config)
-    full_tx = bsv_client.get_raw_transaction(txid)
+# get the full (raw) transaction for txid, network
+# confirmed transactions are served from the on-disk cache when possible;
+# downloads are paced by the shared rate limiter (see rate_limiter.py)
+def get_full_tx(txid: str, network: str) -> Optional[str]:
+    def download(txid: str) -> Optional[str]:
+        return create_interface(network).get_raw_transaction(txid)
+
+    full_tx = cached_raw_transaction(txid, network, download)
     print(f"TX ID {txid} -> Full TX: {full_tx}")
     print('\n<-------------------------------------------------------->\n')
-    print('Sleeping for 1 second to avoid rate limits...\n')
-    sleep(1)
     return full_tx
+
+
+# number of parent transactions downloaded at once; the shared rate limiter
+# still caps the request rate. The regtest RPC connection is not thread safe
+# (and the node is local), so regtest downloads stay serial.
+def fetch_workers(network: str) -> int:
+    if network == 'regtest':
+        return 1
+    return max(1, int(os.environ.get('WBT_FETCH_WORKERS', 8)))
+
+
+# fetch_many for an InputResolver: when the network's interface can get many
+# raw transactions in one request (the regtest node, in JSON-RPC batches),
+# a function that does so through the raw-tx cache; else None
+def raw_transactions_fetcher(network: str, interface=None) -> Optional[Callable[[List[str]], Dict[str, Optional[str]]]]:
+    get_many = getattr(interface or create_interface(network), 'get_raw_transactions', None)
+    if get_many is None:
+        return None
+    return lambda txids: cached_raw_transactions(txids, network, get_many)
+
+
+# download the raw transactions for txids concurrently using fetch(txid)
+# each distinct txid is fetched once; returns {txid: raw_tx} in first-seen order
+def fetch_raw_transactions(txids: Iterable[str], fetch: Callable[[str], Optional[str]], max_workers: int = 1) -> Dict[str, Optional[str]]:
+    distinct = list(dict.fromkeys(txids))
+    if max_workers <= 1 or len(distinct) <= 1:
+        return {txid: fetch(txid) for txid in distinct}
+
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(distinct))) as executor:
+        return dict(zip(distinct, executor.map(fetch, distinct)))
+
+
+# fetch one result per address: in chunks of BULK_ADDRESS_LIMIT through
+# bulk(addresses) -> {address: result} when the interface has a bulk
+# endpoint (WoC), then one fetch(address) call for each address the bulk
+# calls did not answer (all of them on RPC); chunks and single calls run
+# max_workers at a time. Returns {address: result or None} in first-seen order
+def fetch_by_address(addresses: Iterable[str], fetch: Callable[[str], Any], bulk: Optional[Callable[[List[str]], Dict[str, Any]]] = None, max_workers: int = 1) -> Dict[str, Any]:
+    distinct = list(dict.fromkeys(addresses))
+    results: Dict[str, Any] = {}
+    with ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+        if bulk is not None:
+            chunks = [distinct[i:i + BULK_ADDRESS_LIMIT] for i in range(0, len(distinct), BULK_ADDRESS_LIMIT)]
+            for answered in executor.map(bulk, chunks):
+                results.update(answered or {})
+        missing = [address for address in distinct if results.get(address) is None]
+        results.update(zip(missing, executor.map(fetch, missing)))
+    return {address: results.get(address) for address in distinct}
+
+
+# get the balance of many addresses, network (bulk requests on WoC)
+# return {address: balance or None}
+def balances_all(addresses: Iterable[str], network: str, cached: bool = False) -> Dict[str, Any]:
+    if cached:
+        return {address: cached_balance(address, network) for address in dict.fromkeys(addresses)}
+    interface = create_interface(network)
+    return fetch_by_address(addresses, interface.get_balance, getattr(interface, 'get_bulk_balance', None), fetch_workers(network))
+
+
+# get the transaction history of many addresses, network (bulk requests on
+# WoC, confirmed transactions only); return {address: history list or None}
+def histories_all(addresses: Iterable[str], network: str) -> Dict[str, Any]:
+    interface = create_interface(network)
+    return fetch_by_address(addresses, interface.get_addr_history, getattr(interface, 'get_bulk_history', None), fetch_workers(network))
+
+
+# get the utxos of many addresses, network (bulk requests on WoC) and sync
+# the local utxo index; return {address: utxo list or None}
+def utxos_all(addresses: Iterable[str], network: str, cached: bool = False) -> Dict[str, Any]:
+    interface = create_interface(network)
+    if cached:
+        return {address: address_utxos(address, network, interface, cached=True) for address in dict.fromkeys(addresses)}
+    unspent = fetch_by_address(addresses, interface.get_utxo, getattr(interface, 'get_bulk_utxo', None), fetch_workers(network))
+    index = get_utxo_index(network)
+    if index is not None:
+        for address, utxos in unspent.items():
+            if utxos is not None:
+                index.sync(address, utxos)
+    return unspent
@@ -0,0 +1,252 @@
+import os
+import sqlite3
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+
+import toml
+
+from useful import path, network_to_key_type
+
+# -------------------------------------------------------------------
+# Index of the key files (.key|.pem) in the data directory.
+#
+# Listing the keys used to parse every file: the TOML of each .key file, a
+# Wallet from its WIF to learn the network, and a full decode of each .pem.
+# The index (DATA_PATH/.key_index.db) remembers, per file name, the mtime and
+# size it was parsed at and what was found:
+#
+#   .key   network (mainnet / testnet) and bitcoin address, or nothing when
+#          the file holds no [key_info]
+#   .pem   the compressed public key; the address depends on the network
+#          asked for and is derived from it
+#
+# A listing stats the directory and only re-parses files that are new or
+# whose mtime or size changed; rows of deleted files are dropped. No private
+# key material is stored. A cold scan of a large directory parses the files
+# across worker processes. A file that cannot be read, or holds a key of an
+# unknown network, is reported and skipped rather than ending the scan.
+#
+# The receive addresses derived from the xpub of an HD account manifest
+# (.hd, see hd_wallet.py) are kept too, per xpub and index, so listing an
+# account derives only the indexes not seen before.
+#
+# WBT_KEY_INDEX=0 disables the index (every file is parsed, and every HD
+# address derived, every time).
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS keys (
+    filename TEXT PRIMARY KEY,
+    mtime_ns INTEGER NOT NULL,
+    size INTEGER NOT NULL,
+    network TEXT,
+    address TEXT,
+    public_key TEXT
+);
+CREATE TABLE IF NOT EXISTS hd_addresses (
+    xpub TEXT NOT NULL,
+    address_index INTEGER NOT NULL,
+    address TEXT NOT NULL,
+    PRIMARY KEY (xpub, address_index)
+);
+'''
+
+# cold scans of at least this many files are parsed in worker processes,
+# in chunks of PARSE_CHUNK_SIZE files
+PARALLEL_PARSE_THRESHOLD = 512
+PARSE_CHUNK_SIZE = 256
+
+# (network, address, public_key) found in a key file
+KeyInfo = Tuple[Optional[str], Optional[str], Optional[str]]
+
+
+# -------------------------------------------------------------------
+class KeyIndex:
+
+    def __init__(self, db_file: str):
+        self.db_file = db_file
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(db_file, check_same_thread=False)
+        self.db.executescript(SCHEMA)
+
+    def close(self) -> None:
+        self.db.close()
+
+    # {filename: (mtime_ns, size, (network, address, public_key))}
+    def entries(self) -> Dict[str, Tuple[int, int, KeyInfo]]:
+        with self.lock:
+            rows = self.db.execute('SELECT filename, mtime_ns, size, network, address, public_key FROM keys').fetchall()
+        return {row[0]: (row[1], row[2], (row[3], row[4], row[5])) for row in rows}
+
+    # store the parsed files and drop the rows of files that are gone
+    def update(self, parsed: Dict[str, Tuple[int, int, KeyInfo]], removed: List[str]) -> None:
+        with self.lock, self.db:
+            self.db.executemany(
+                'INSERT OR REPLACE INTO keys (filename, mtime_ns, size, network, address, public_key) VALUES (?, ?, ?, ?, ?, ?)',
+                [(filename, mtime_ns, size) + info for filename, (mtime_ns, size, info) in parsed.items()])
+            self.db.executemany('DELETE FROM keys WHERE filename = ?', [(filename,) for filename in removed])
+
+    # {index: address} of the known addresses of xpub in [start, start + count)
+    def hd_addresses(self, xpub: str, start: int, count: int) -> Dict[int, str]:
+        with self.lock:
+            rows = self.db.execute(
+                'SELECT address_index, address FROM hd_addresses WHERE xpub = ? AND address_index >= ? AND address_index < ?',
+                (xpub, start, start + count)).fetchall()
+        return dict(rows)
+
+    # remember addresses ({index: address}) derived from xpub
+    def add_hd_addresses(self, xpub: str, addresses: Dict[int, str]) -> None:
+        with self.lock, self.db:
+            self.db.executemany('INSERT OR REPLACE INTO hd_addresses (xpub, address_index, address) VALUES (?, ?, ?)',
+                                [(xpub, index, address) for index, address in addresses.items()])
+
+
+# -------------------------------------------------------------------
+_index: Dict[str, Optional[KeyIndex]] = {}
+_index_lock = threading.Lock()
+
+
+def get_key_index() -> Optional[KeyIndex]:
+    with _index_lock:
+        if path not in _index:
+            _index[path] = _open_index()
+        return _index[path]
+
+
+def _open_index() -> Optional[KeyIndex]:
+    if not os.path.isdir(path) or os.environ.get('WBT_KEY_INDEX', '1') == '0':
+        return None
+    try:
+        return KeyIndex(os.path.join(path, '.key_index.db'))
+    except (OSError, sqlite3.Error) as e:
+        print(f"Warning: key index disabled: {e}")
+        return None
+
+
+# -------------------------------------------------------------------
+# Helper functions to parse one key file in directory; a file that cannot
+# be used raises ValueError
+def parse_key_file(directory: str, filename: str) -> KeyInfo:
+    from tx_engine import Wallet
+
+    try:
+        with open(os.path.join(directory, filename), 'r') as file:
+            data_dict = toml.load(file)
+        if 'key_info' not in data_dict:
+            return None, None, None
+        # create a "Wallet" object to read the network of the key
+        key_network = Wallet(data_dict["key_info"]["private_key"]).get_network()
+        address = data_dict["key_info"]["bitcoin_address"]
+    except (OSError, toml.TomlDecodeError, KeyError) as e:
+        raise ValueError(f"cannot read {filename}: {e}")
+    except Exception as e:
+        raise ValueError(f"invalid key in {filename}: {e}")
+
+    if key_network == "BSV_Mainnet":
+        return "mainnet", address, None
+    if key_network == "BSV_Testnet":
+        return "testnet", address, None
+    raise ValueError(f"Invalid network type: {key_network} in {filename}")
+
+
+def parse_pem_file(directory: str, filename: str) -> KeyInfo:
+    from tx_engine import create_wallet_from_pem_bytes
+
+    try:
+        with open(os.path.join(directory, filename), 'rb') as file:
+            key_wallet = create_wallet_from_pem_bytes(file.read(), network='BSV_Testnet')
+    except Exception as e:
+        raise ValueError(f"invalid pem key in {filename}: {e}")
+    return None, None, key_wallet.get_public_key_as_hexstr()
+
+
+# parse filenames; (info, None) per usable file, (None, error) per bad one.
+# Runs in the worker processes of parse_files.
+def _parse_chunk(directory: str, filenames: List[str]) -> List[Tuple[Optional[KeyInfo], Optional[str]]]:
+    results: List[Tuple[Optional[KeyInfo], Optional[str]]] = []
+    for filename in filenames:
+        parse = parse_key_file if filename.endswith('.key') else parse_pem_file
+        try:
+            results.append((parse(directory, filename), None))
+        except ValueError as e:
+            results.append((None, str(e)))
+    return results
+
+
+# -------------------------------------------------------------------
+# Helper function to parse many key files, in order; from
+# PARALLEL_PARSE_THRESHOLD files on they are parsed in chunks of
+# PARSE_CHUNK_SIZE across worker processes (default: one per core)
+def parse_files(directory: str, filenames: List[str], workers: Optional[int] = None) -> List[Tuple[Optional[KeyInfo], Optional[str]]]:
+    workers = workers or os.cpu_count() or 1
+    if workers <= 1 or len(filenames) < PARALLEL_PARSE_THRESHOLD:
+        return _parse_chunk(directory, filenames)
+
+    chunks = [filenames[i:i + PARSE_CHUNK_SIZE] for i in range(0, len(filenames), PARSE_CHUNK_SIZE)]
+    results: List[Tuple[Optional[KeyInfo], Optional[str]]] = []
+    with ProcessPoolExecutor(max_workers=min(workers, len(chunks))) as executor:
+        for chunk_results in executor.map(_parse_chunk, [directory] * len(chunks), chunks):
+            results.extend(chunk_results)
+    return results
+
+
+# -------------------------------------------------------------------
+# Helper function to return (filename, info) for every usable .key and .pem
+# file in the data directory, in directory order, parsing only the files
+# the index does not already know in their current state. A file that
+# cannot be parsed is reported and skipped (and tried again next time).
+def scan_key_files(workers: Optional[int] = None) -> List[Tuple[str, KeyInfo]]:
+    index = get_key_index()
+    known = index.entries() if index is not None else {}
+
+    listing: List[Tuple[str, int, int]] = []
+    with os.scandir(path) as it:
+        for entry in it:
+            if entry.name.endswith(('.key', '.pem')) and entry.is_file():
+                stat = entry.stat()
+                listing.append((entry.name, stat.st_mtime_ns, stat.st_size))
+
+    to_parse = [name for name, mtime_ns, size in listing
+                if name not in known or known[name][:2] != (mtime_ns, size)]
+    results = dict(zip(to_parse, parse_files(path, to_parse, workers)))
+
+    found: List[Tuple[str, KeyInfo]] = []
+    parsed: Dict[str, Tuple[int, int, KeyInfo]] = {}
+    for name, mtime_ns, size in listing:
+        if name not in results:
+            found.append((name, known[name][2]))
+            continue
+        print(f"Checking file: {name}")
+        info, error = results[name]
+        if info is None:
+            print(f"Warning: skipping {name}: {error}")
+            continue
+        parsed[name] = (mtime_ns, size, info)
+        found.append((name, info))
+
+    if index is not None:
+        names = {name for name, _, _ in listing}
+        removed = [name for name in known if name not in names]
+        if parsed or removed:
+            index.update(parsed, removed)
+    return found
+
+
+# -------------------------------------------------------------------
+# Helper function to list the keys for network: ([(file, address)] of the
+# .key files of that network, [(file, address)] of all .pem files)
+def indexed_keys(network: str) -> Tuple[List[Tuple[str, Any]], List[Tuple[str, Any]]]:
+    from tx_engine import public_key_to_address
+
+    key_type = network_to_key_type(network)
+    if network == 'regtest':
+        network = 'testnet'
+
+    keys, pems = [], []
+    for filename, (key_network, address, public_key) in scan_key_files():
+        if filename.endswith('.key'):
+            if address is not None and key_network == network:
+                keys.append((filename, address))
+        elif public_key is not None:
+            pems.append((filename, public_key_to_address(bytes.fromhex(public_key), key_type)))
+    return keys, pems
@@ -5,7 +5,7 @@ from argument_handler import ArgumentHandler
 
 
 def main(argv):
-    ArgumentHandler()
+    ArgumentHandler(argv)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,162 @@
+import os
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from typing import Callable, Dict, Optional
+
+import requests
+
+# -------------------------------------------------------------------
+# Adaptive token-bucket rate limiting for WhatsOnChain (WoC) requests.
+#
+# Every WoC call in the tool takes a token from the bucket of its network
+# before it is sent, so concurrent callers share one request budget. The
+# rate is configured per network in requests per second:
+#
+#   WBT_RATE_LIMIT_TESTNET   (default 3, the WoC free-tier limit)
+#   WBT_RATE_LIMIT_MAINNET   (default 3)
+#
+# A rate of 0 disables limiting for that network. On HTTP 429 the bucket
+# halves its rate and pauses for the Retry-After period (or an exponential
+# backoff when the header is missing). Each successful request then
+# recovers the rate step by step back to the configured value.
+
+DEFAULT_RATE = 3.0
+MIN_RATE_DIVISOR = 8
+RECOVERY_STEPS = 20
+RETRY_STATUS = {429, 502, 503, 504}
+
+
+# -------------------------------------------------------------------
+class TokenBucket:
+
+    def __init__(self,
+                 rate: float,
+                 capacity: Optional[float] = None,
+                 clock: Callable[[], float] = time.monotonic,
+                 sleep: Callable[[float], None] = time.sleep):
+        self.base_rate = rate
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(1.0, rate)
+        self.tokens = self.capacity
+        self.clock = clock
+        self.sleep = sleep
+        self.updated = clock()
+        self.paused_until = 0.0
+        self.lock = threading.Lock()
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    # block until a token is available; returns the time spent waiting
+    def acquire(self) -> float:
+        if self.base_rate <= 0:
+            return 0.0
+        waited = 0.0
+        while True:
+            with self.lock:
+                now = self.clock()
+                if now < self.paused_until:
+                    delay = self.paused_until - now
+                else:
+                    self._refill(now)
+                    if self.tokens >= 1.0:
+                        self.tokens -= 1.0
+                        return waited
+                    delay = (1.0 - self.tokens) / self.rate
+            self.sleep(delay)
+            waited += delay
+
+    # the server asked us to slow down: pause everyone and halve the rate
+    def throttle(self, retry_after: float) -> None:
+        with self.lock:
+            now = self.clock()
+            self._refill(now)
+            self.tokens = 0.0
+            self.paused_until = max(self.paused_until, now + retry_after)
+            self.rate = max(self.base_rate / MIN_RATE_DIVISOR, self.rate / 2)
+
+    # a request went through: step the rate back towards the configured value
+    def relax(self) -> None:
+        with self.lock:
+            if self.rate < self.base_rate:
+                self._refill(self.clock())
+                self.rate = min(self.base_rate, self.rate + self.base_rate / RECOVERY_STEPS)
+
+
+# -------------------------------------------------------------------
+# One bucket per network, shared by every caller in the process
+_buckets: Dict[str, TokenBucket] = {}
+_buckets_lock = threading.Lock()
+
+
+def get_rate_limiter(network: str) -> TokenBucket:
+    with _buckets_lock:
+        if network not in _buckets:
+            rate = float(os.environ.get(f'WBT_RATE_LIMIT_{network.upper()}', DEFAULT_RATE))
+            _buckets[network] = TokenBucket(rate)
+        return _buckets[network]
+
+
+# -------------------------------------------------------------------
+# Helper function to turn a Retry-After header (seconds or HTTP date) into seconds
+def parse_retry_after(value: Optional[str], now: Optional[float] = None) -> Optional[float]:
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        when = parsedate_to_datetime(value).timestamp()
+    except (TypeError, ValueError):
+        return None
+    if now is None:
+        now = time.time()
+    return max(0.0, when - now)
+
+
+# -------------------------------------------------------------------
+# Send a request within the network's rate limit, retrying on 429 and
+# transient gateway errors. Returns the last response (which may still be
+# an error) or None if the connection failed. session, when given, sends
+# the request over its pooled keep-alive connections.
+#
+# A request that is not idempotent (by default anything but GET, e.g. a
+# broadcast) may have been carried out even when its answer was lost, so it
+# is only retried when the server cannot have acted on it: a connection
+# that was never made, or a 429. idempotent=True marks a POST that only
+# reads (the WoC bulk endpoints).
+def limited_request(network: str, method: str, url: str, max_retries: int = 5,
+                    session: Optional[requests.Session] = None, idempotent: Optional[bool] = None,
+                    **kwargs) -> Optional[requests.Response]:
+    bucket = get_rate_limiter(network)
+    send = session.request if session is not None else requests.request
+    kwargs.setdefault('timeout', 30)
+    if idempotent is None:
+        idempotent = method.upper() == 'GET'
+    retry_status = RETRY_STATUS if idempotent else {429}
+    response = None
+    for attempt in range(max_retries):
+        bucket.acquire()
+        try:
+            response = send(method, url, **kwargs)
+        except (requests.ConnectionError, requests.Timeout) as e:
+            print(f"Warning: request to {url} failed: {e}")
+            response = None
+            bucket.throttle(float(2 ** attempt))
+            if not idempotent and not isinstance(e, requests.ConnectTimeout):
+                return None
+            continue
+
+        if response.status_code not in retry_status or attempt + 1 >= max_retries:
+            if response.status_code < 400:
+                bucket.relax()
+            return response
+
+        retry_after = parse_retry_after(response.headers.get('Retry-After'))
+        if retry_after is None:
+            retry_after = float(2 ** attempt)
+        print(f"Warning: HTTP {response.status_code} from {url}, retrying in {retry_after:.1f}s ({attempt + 1}/{max_retries})")
+        bucket.throttle(retry_after)
+    return response
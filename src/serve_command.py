@@ -0,0 +1,93 @@
+import json
+import os
+import socketserver
+from typing import Optional
+
+from command_runner import run_command
+from useful import path
+
+# -------------------------------------------------------------------
+# wbt serve: keep one warm process and run commands sent to it.
+#
+# Starting a container and importing tx_engine and every command module
+# costs far more than most commands. The server pays that once. Clients
+# connect to a Unix socket (default DATA_PATH/wbt.sock, which the host sees
+# as ./data/wbt.sock through the volume mount) or to a TCP port, and send
+# one JSON object per line:
+#
+#   {"argv": ["balance", "-a", "<address>"]}
+#
+# Each request is answered with one JSON line:
+#
+#   {"argv": [...], "exit_code": 0, "output": "<everything the command printed>"}
+#
+# A connection may send any number of requests. There is no authentication:
+# keep the socket in a private directory and bind TCP to localhost only.
+
+DEFAULT_SOCKET = 'wbt.sock'
+
+
+class CommandRequestHandler(socketserver.StreamRequestHandler):
+
+    def handle(self):
+        for line in self.rfile:
+            if not line.strip():
+                continue
+            try:
+                request = json.loads(line)
+                argv = request['argv']
+                if not isinstance(argv, list) or not all(isinstance(arg, str) for arg in argv):
+                    raise ValueError("argv must be a list of strings")
+            except (ValueError, KeyError, TypeError) as e:
+                response = {'argv': None, 'exit_code': 2, 'output': f'Error: bad request: {e}\n'}
+            else:
+                response = run_command(argv)
+            self.wfile.write((json.dumps(response) + '\n').encode('utf-8'))
+            self.wfile.flush()
+
+
+class UnixCommandServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+class TCPCommandServer(socketserver.ThreadingMixIn, socketserver.TCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class ServeCommand:
+
+    def __init__(self,
+                 socket_path: Optional[str] = None,
+                 host: str = '127.0.0.1',
+                 port: Optional[int] = None):
+        self.socket_path = socket_path
+        self.host = host
+        self.port = port
+
+    # --------------------------------------------------------------
+    # Create the server: TCP when a port is given, else a Unix socket
+    def make_server(self) -> socketserver.BaseServer:
+        if self.port is not None:
+            return TCPCommandServer((self.host, self.port), CommandRequestHandler)
+
+        socket_path = self.socket_path or os.path.join(path, DEFAULT_SOCKET)
+        if os.path.exists(socket_path):
+            # left over from a server that did not shut down cleanly
+            os.remove(socket_path)
+        server = UnixCommandServer(socket_path, CommandRequestHandler)
+        os.chmod(socket_path, 0o600)
+        return server
+
+    def run(self):
+        server = self.make_server()
+        where = f'{self.host}:{self.port}' if self.port is not None else server.server_address
+        print(f'\n  -> Running bbt serve, listening on {where} (Ctrl-C to stop)', flush=True)
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+            if self.port is None and os.path.exists(str(server.server_address)):
+                os.remove(str(server.server_address))
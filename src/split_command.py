@@ -0,0 +1,198 @@
+from useful import add_interface_to_config, load_key_from_file, write_to_file, write_to_stdout, network_to_key_type, numbered_file_name, print_balance
+from key_functions import get_full_tx, fetch_workers, raw_transactions_fetcher
+from interfaces import create_interface, command_fee_rate
+from wallet_snapshot import wallet_snapshot
+from input_resolver import InputResolver
+from fee import DEFAULT_FEE_RATE, estimate_p2pkh_size, fee_for_size
+from transaction import build_tx_from_config, build_tx_in_worker, broadcast_all
+from tx_engine import Tx
+from concurrent.futures import ProcessPoolExecutor
+import os
+from typing import Dict, Any, List, Tuple
+
+# -------------------------------------------------------------------
+# wbt split: the reverse of consolidate. The whole balance of an address
+# becomes count outputs of equal value back to the address, so later
+# transactions can spend independent utxos in parallel instead of queueing
+# on one chain of unconfirmed change.
+#
+# Up to max_outputs outputs are made in one transaction. Above that a
+# two-level tree is built: a root transaction with one output per child,
+# and child transactions that each split one root output into at most
+# max_outputs outputs. The children spend the root before it is broadcast,
+# so the tree needs -sign; with -broadcast the root goes first.
+
+SPLIT_MAX_OUTPUTS = 1000
+
+
+# -------------------------------------------------------------------
+# Helper function to plan a split of total satoshis from n_inputs utxos into
+# count outputs at fee_rate. Returns the value of each final output, the
+# output amounts of the first transaction and the number of outputs of each
+# child transaction (none when one transaction is enough). What is left
+# over after the equal division (less than count satoshis) goes to the fee.
+def split_amounts(total: int, n_inputs: int, count: int, max_outputs: int, fee_rate: float) -> Tuple[int, List[int], List[int]]:
+    if count <= max_outputs:
+        fee = fee_for_size(estimate_p2pkh_size(n_inputs, count), fee_rate)
+        value = (total - fee) // count
+        return value, [value] * count, []
+
+    children = [max_outputs] * (count // max_outputs)
+    if count % max_outputs:
+        children.append(count % max_outputs)
+    if len(children) > max_outputs:
+        raise ValueError(f"{count} outputs need more than two levels of {max_outputs} outputs, raise -max_outputs")
+    child_fees = [fee_for_size(estimate_p2pkh_size(1, n), fee_rate) for n in children]
+    root_fee = fee_for_size(estimate_p2pkh_size(n_inputs, len(children)), fee_rate)
+    value = (total - root_fee - sum(child_fees)) // count
+    return value, [n * value + fee for n, fee in zip(children, child_fees)], children
+
+
+class SplitCommand:
+
+    def __init__(self,
+                 sender_key,
+                 sender,
+                 network,
+                 count,
+                 inform='toml',
+                 out=None,
+                 fee_rate=None,
+                 max_outputs=SPLIT_MAX_OUTPUTS,
+                 sign=False,
+                 workers=None,
+                 broadcast=False):
+
+        self.sender_key = sender_key
+        self.sender = sender
+        self.network = network
+        # number of equal outputs, at most max_outputs per transaction
+        self.count = count
+        self.max_outputs = max_outputs
+        self.inform = inform
+        self.out = out
+        # sat/byte (or 'node'), default DEFAULT_FEE_RATE
+        self.fee_rate = fee_rate
+        self.sign = sign
+        self.workers = workers
+        self.broadcast = broadcast
+        self.key_type = network_to_key_type(network)
+
+    # --------------------------------------------------------------
+    # parameters of one transaction paying each of amounts back to address
+    def split_parameters(self, address: str, inputs: List[Dict[str, Any]], amounts: List[int]) -> Dict[Any, Any]:
+        data_dict: Dict[Any, Any] = {}
+        add_interface_to_config(data_dict, self.network)
+        data_dict['transactioninput'] = inputs
+        data_dict['transactionoutput'] = [{
+            'public_key': address,
+            'amount': amount,
+            'op_return': False,
+            'data_to_encode': ''
+        } for amount in amounts]
+        size = estimate_p2pkh_size(len(inputs), len(amounts))
+        data_dict['tx_info'] = {
+            'create_change_output': False,
+            'tx_default_fee': fee_for_size(size, self.fee_rate),
+            'tx_fee_rate': self.fee_rate,
+            'tx_predicted_size': size
+        }
+        return data_dict
+
+    def run(self):
+        print(f'\n  -> Running bbt split,   count={self.count}, network={self.network}')
+        if self.count < 1 or self.max_outputs < 1:
+            print("Error: -count and -max_outputs must be >= 1")
+            exit(1)
+        if self.count > self.max_outputs and not self.sign:
+            print(f"Error: more than {self.max_outputs} outputs make a tree of transactions, which needs -sign")
+            exit(1)
+        if self.sign and not self.sender_key:
+            print("Error: -sign needs the -sender_key to sign with")
+            exit(1)
+
+        key_for_signing = "<key for signing>"
+        sender_address = self.sender or "<sender address>"
+        if self.sender_key:
+            key_for_signing, sender_address = load_key_from_file(self.sender_key, self.inform != 'pem', self.key_type)
+
+        self.fee_rate = command_fee_rate(self.fee_rate, lambda: create_interface(self.network), DEFAULT_FEE_RATE)
+
+        # get the sender's utxos (one request); the balance is derived from them
+        snapshot = wallet_snapshot(sender_address, self.network, create_interface(self.network))
+        if snapshot is None:
+            print(f"Error: failed to retrieve the utxos for {sender_address}.")
+            exit(1)
+        print_balance(sender_address, snapshot.balance())
+
+        try:
+            value, amounts, children = split_amounts(snapshot.total, len(snapshot.utxos), self.count, self.max_outputs, self.fee_rate)
+        except ValueError as e:
+            print(f"Error: {e}")
+            exit(1)
+        if not snapshot.utxos or value < 1:
+            print(f"Error: a balance of {snapshot.total} cannot make {self.count} outputs and pay the fees")
+            exit(1)
+        print(f"Number of utxo's: {len(snapshot.utxos)}, {self.count} outputs of {value}, "
+              f"number of transactions: {1 + len(children)}")
+
+        resolver = InputResolver(
+            lambda txid: get_full_tx(txid, self.network),
+            key_for_signing,
+            fetch_workers(self.network),
+            raw_transactions_fetcher(self.network))
+        params = [self.split_parameters(sender_address, resolver.resolve(snapshot.utxos), amounts)]
+
+        signed: List[str] = []
+        if self.sign:
+            # the children spend the outputs of the signed root
+            signed.append(build_tx_from_config(params[0]))
+            root_txid = Tx.parse_hexstr(signed[0]).id()
+            for n, (amount, n_outputs) in enumerate(zip(amounts, children)):
+                inputs = [{
+                    'tx_hash': root_txid,
+                    'tx_pos': n,
+                    'amount': amount,
+                    'input_tx_hash': signed[0],
+                    'private_key_for_signing': key_for_signing
+                }]
+                params.append(self.split_parameters(sender_address, inputs, [value] * n_outputs))
+
+        for i, data_dict in enumerate(params):
+            if self.out:
+                filename = numbered_file_name(self.out, i, len(params)) if len(params) > 1 else self.out
+                write_to_file(filename, data_dict)
+                print(f'Transaction {i + 1}/{len(params)} parameters generated, saved to file: {filename}')
+            else:
+                print(f'# transaction {i + 1}/{len(params)}')
+                write_to_stdout(data_dict)
+
+        if self.sign:
+            signed += self.sign_children(params[1:])
+            self.show_signed(signed)
+            if self.broadcast:
+                broadcast_all(signed, self.network)
+
+    # --------------------------------------------------------------
+    # build and sign the child transactions in parallel worker processes
+    def sign_children(self, children: List[Dict[Any, Any]]) -> List[str]:
+        if not children:
+            return []
+        signed: List[str] = []
+        with ProcessPoolExecutor(max_workers=self.workers) as executor:
+            for tx, output in executor.map(build_tx_in_worker, children):
+                print(output, end='')
+                signed.append(tx)
+        return signed
+
+    def show_signed(self, signed: List[str]) -> None:
+        for i, tx in enumerate(signed):
+            if self.out:
+                if len(signed) > 1:
+                    filename = numbered_file_name(self.out, i, len(signed), '.hex')
+                else:
+                    filename = os.path.splitext(self.out)[0] + '.hex'
+                write_to_file(filename, tx, is_toml=False)
+                print(f'Transaction {i + 1}/{len(signed)} signed, saved to file: {filename}')
+            else:
+                print(f'Transaction {i + 1}/{len(signed)} serialised transaction: \n\n{tx}\n')
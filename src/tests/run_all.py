@@ -4,6 +4,21 @@ import test_address as ta
 import test_pkeyformat as tpf
 import test_transaction as tt
 import test_interface_config as tic
+import test_tx_cache as ttc
+import test_rate_limiter as trl
+import test_input_resolver as tir
+import test_consolidate as tc
+import test_signing as tsg
+import test_utxo_index as tui
+import test_coin_selection as tcs
+import test_fee as tf
+import test_serve as tsv
+import test_batch as tbt
+import test_startup as tsu
+import test_key_index as tki
+import test_hd_wallet as thd
+import test_discover as tds
+import test_split as tsp
 
 # run all tests
 if __name__ == '__main__':
@@ -13,5 +28,20 @@ if __name__ == '__main__':
     tpf.run_tests(tpf.TestPkeyformatCommand)
     tt.run_tests(tt.TestTransactionCommand)
     tic.run_tests(tic.TestInterfaceConfig)
+    ttc.run_tests(ttc.TestRawTxCache)
+    trl.run_tests(trl.TestRateLimiter)
+    tir.run_tests(tir.TestInputResolver)
+    tc.run_tests(tc.TestConsolidateCommand)
+    tsg.run_tests(tsg.TestBatchSigner)
+    tui.run_tests(tui.TestUtxoIndex)
+    tcs.run_tests(tcs.TestCoinSelection)
+    tf.run_tests(tf.TestFee)
+    tsv.run_tests(tsv.TestServeCommand)
+    tbt.run_tests(tbt.TestBatchCommand)
+    tsu.run_tests(tsu.TestStartup)
+    tki.run_tests(tki.TestKeyIndex)
+    thd.run_tests(thd.TestHdWallet)
+    tds.run_tests(tds.TestDiscover)
+    tsp.run_tests(tsp.TestSplitCommand)
     print('End of test run.')
     print('Exiting.')
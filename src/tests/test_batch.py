@@ -0,0 +1,96 @@
+import io
+import json
+import os
+import sys
+import tempfile
+import unittest
+from unittest.mock import patch
+
+sys.path.append('../')
+from batch_command import BatchCommand, parse_script
+import useful
+
+
+def run_tests(test_class):
+    suite = unittest.TestLoader().loadTestsFromTestCase(test_class)
+    runner = unittest.TextTestRunner(verbosity=2)
+    runner.run(suite)
+
+
+WIF = 'cVoVmd5zY69LEevwGa5iq1Ba3oBc6J8xxUqdKuJCtuFWUJJngPPP'
+ADDRESS = 'mg7k4cWKZAH6dHFAk4GPjuWFvmFZBHKf7s'
+
+SCRIPT = f'''
+# derive the same address twice
+address -pkey {WIF}
+address -pkey "{WIF}"   # trailing comment
+
+address -pkey not_a_key
+batch other.txt
+address -pkey {WIF}
+'''
+
+
+class TestBatchCommand(unittest.TestCase):
+
+    def run_script(self, script, stop_on_error=False):
+        out = io.StringIO()
+        failed = BatchCommand('-', stop_on_error=stop_on_error).run_lines(io.StringIO(script), out)
+        return failed, [json.loads(line) for line in out.getvalue().splitlines()]
+
+    def test_parse_script(self):
+        parsed = list(parse_script(['', '# only a comment', 'key -s "a b" -n c', 'key -s "open']))
+        self.assertEqual(parsed[0], (3, ['key', '-s', 'a b', '-n', 'c'], ''))
+        self.assertEqual(parsed[1][:2], (4, None))
+        self.assertIn('cannot parse line 4', parsed[1][2])
+
+    # ------------------------------------------------------------------------------------
+    # one JSON result per command line, in order, with the script line numbers
+    def test_run_lines(self):
+        failed, results = self.run_script(SCRIPT)
+        self.assertEqual(failed, 2)
+        self.assertEqual([r['line'] for r in results], [3, 4, 6, 7, 8])
+        self.assertEqual([r['exit_code'] for r in results], [0, 0, 1, 2, 0])
+        self.assertIn(ADDRESS, results[0]['output'])
+        self.assertEqual(results[1]['argv'], ['address', '-pkey', WIF])
+        self.assertIn('cannot run inside a batch', results[3]['output'])
+
+    def test_stop_on_error(self):
+        failed, results = self.run_script(SCRIPT, stop_on_error=True)
+        self.assertEqual(failed, 1)
+        self.assertEqual([r['line'] for r in results], [3, 4, 6])
+
+    # a line that calls the builtin exit() (which closes sys.stdin) does not
+    # end a script read from stdin
+    @patch('sys.stdout', new_callable=io.StringIO)
+    def test_run_stdin(self, mock_stdout):
+        script = f'balance -in missing.key -n testnet\naddress -pkey {WIF}\n'
+        with patch('sys.stdin', io.StringIO(script)):
+            with self.assertRaises(SystemExit) as cm:
+                BatchCommand('-').run()
+        self.assertEqual(cm.exception.code, 1)
+        results = [json.loads(line) for line in mock_stdout.getvalue().splitlines()]
+        self.assertEqual([r['line'] for r in results], [1, 2])
+        self.assertEqual([r['exit_code'] for r in results], [1, 0])
+        self.assertIn(ADDRESS, results[1]['output'])
+
+    # ------------------------------------------------------------------------------------
+    # a key file is read once per process until it changes
+    def test_key_file_cache(self):
+        with tempfile.TemporaryDirectory() as tmp, patch.object(useful, 'path', tmp):
+            key_file = os.path.join(tmp, 'alice.key')
+            with open(key_file, 'w') as file:
+                file.write(f'[key_info]\nprivate_key = "{WIF}"\nbitcoin_address = "{ADDRESS}"\n')
+
+            with patch('useful.read_toml_file', wraps=useful.read_toml_file) as read:
+                self.assertEqual(useful.load_key_from_file('alice.key', True, 'BSV_Testnet'), (WIF, ADDRESS))
+                self.assertEqual(useful.load_key_from_file('alice.key', True, 'BSV_Testnet'), (WIF, ADDRESS))
+                self.assertEqual(read.call_count, 1)
+
+                os.utime(key_file, (0, 0))
+                useful.load_key_from_file('alice.key', True, 'BSV_Testnet')
+                self.assertEqual(read.call_count, 2)
+
+
+if __name__ == '__main__':
+    run_tests(TestBatchCommand)
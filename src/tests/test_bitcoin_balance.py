@@ -1,11 +1,13 @@
 import sys
 import unittest
-from unittest.mock import patch, mock_open
+from unittest.mock import patch, mock_open, MagicMock
 from io import StringIO
 from pathlib import Path
 
 sys.path.append('../')
-from balance_command import BalanceCommand
+from balance_command import BalanceCommand, BunchOfBalances
+from interfaces import create_interface
+from key_functions import fetch_by_address
 
 
 def run_tests(test_class):
@@ -75,3 +77,56 @@ class TestBalanceCommand(unittest.TestCase):
         mock_open_file.assert_called_once_with(Path('/app/data/input_file.txt'), 'r')
 
         assert self.bb.address == "mg7k4cWKZAH6dHFAk4GPjuWFvmFZBHKf7s"
+
+    # ------------------------------------------------------------------------------------
+    # addresses go out in bulk chunks of 20; the ones a chunk did not answer
+    # are fetched one by one
+    def test_fetch_by_address_chunks(self):
+        addresses = [f'address_{i}' for i in range(45)]
+        chunks = []
+
+        def bulk(chunk):
+            chunks.append(chunk)
+            return {address: 1 for address in chunk if address != 'address_7'}
+
+        fetch = MagicMock(return_value=2)
+        results = fetch_by_address(addresses + addresses[:5], fetch, bulk, max_workers=4)
+
+        self.assertEqual(sorted(len(chunk) for chunk in chunks), [5, 20, 20])
+        fetch.assert_called_once_with('address_7')
+        self.assertEqual(list(results), addresses)
+        self.assertEqual(results['address_7'], 2)
+        self.assertEqual(results['address_44'], 1)
+
+        # no bulk endpoint (RPC): one call per address
+        fetch = MagicMock(return_value=3)
+        self.assertEqual(fetch_by_address(addresses, fetch), {address: 3 for address in addresses})
+        self.assertEqual(fetch.call_count, 45)
+
+    # WoC answers the bulk endpoint with one entry (or an error) per address
+    @patch('interfaces.limited_request')
+    def test_woc_bulk_balance(self, mock_request):
+        mock_request.return_value = MagicMock(status_code=200)
+        mock_request.return_value.json.return_value = [
+            {'address': 'a1', 'balance': {'confirmed': 5, 'unconfirmed': 0}, 'error': ''},
+            {'address': 'a2', 'error': 'invalid address'},
+        ]
+        woc = create_interface('testnet')
+        self.assertEqual(woc.get_bulk_balance(['a1', 'a2']), {'a1': {'confirmed': 5, 'unconfirmed': 0}})
+        method, url = mock_request.call_args.args[1:]
+        self.assertEqual((method, url.endswith('/addresses/balance')), ('POST', True))
+        self.assertEqual(mock_request.call_args.kwargs['json'], {'addresses': ['a1', 'a2']})
+
+        mock_request.return_value.status_code = 500
+        self.assertEqual(woc.get_bulk_utxo(['a1']), {})
+
+    # balance --all asks for every balance in one go
+    @patch('balance_command.balances_all')
+    def test_check_balances(self, mock_balances):
+        mock_balances.return_value = {'addr_1': {'confirmed': 10, 'unconfirmed': 0}, 'addr_2': None}
+        bunch = BunchOfBalances([('a.key', 'addr_1')], [('b.pem', 'addr_2')], 'mock')
+        with patch('sys.stdout', new=StringIO()) as fake_out:
+            bunch.check_balances()
+        mock_balances.assert_called_once_with(['addr_1', 'addr_2'], 'mock', False)
+        self.assertIn("'confirmed': 10", fake_out.getvalue())
+        self.assertIn('Failed to retrieve balance for address addr_2', fake_out.getvalue())
@@ -0,0 +1,84 @@
+import random
+import sys
+import time
+import unittest
+
+sys.path.append('../')
+from coin_selection import select_coins, InsufficientFundsError, UtxoPool, bnb
+from fee import CHANGE_DUST_LIMIT
+
+
+def run_tests(test_class):
+    suite = unittest.TestLoader().loadTestsFromTestCase(test_class)
+    runner = unittest.TextTestRunner(verbosity=2)
+    runner.run(suite)
+
+
+def make_utxos(values):
+    return [{'height': 1, 'tx_pos': n, 'tx_hash': f'{n:064x}', 'value': v} for n, v in enumerate(values)]
+
+
+def values_of(selected):
+    return sorted(u['value'] for u in selected)
+
+
+class TestCoinSelection(unittest.TestCase):
+
+    def setUp(self):
+        self.utxos = make_utxos([1000, 5000, 200, 7000, 3000, 1500])
+
+    # ------------------------------------------------------------------------------------
+    # first_fit keeps the API order
+    def test_first_fit(self):
+        self.assertEqual(values_of(select_coins(self.utxos, 5500)), [1000, 5000])
+
+    def test_largest_first(self):
+        self.assertEqual(values_of(select_coins(self.utxos, 9000, 'largest_first')), [5000, 7000])
+
+    # ------------------------------------------------------------------------------------
+    # one utxo if any covers the target on its own
+    def test_smallest_sufficient(self):
+        self.assertEqual(values_of(select_coins(self.utxos, 2500, 'smallest_sufficient')), [3000])
+        self.assertEqual(values_of(select_coins(self.utxos, 9000, 'smallest_sufficient')), [5000, 7000])
+
+    # ------------------------------------------------------------------------------------
+    # as few inputs as largest_first, with less left over
+    def test_min_inputs(self):
+        selected = select_coins(self.utxos, 8500, 'min_inputs')
+        self.assertEqual(values_of(selected), [1500, 7000])
+
+    # ------------------------------------------------------------------------------------
+    # bnb finds a set that needs no change output, or falls back
+    def test_bnb_exact_match(self):
+        selected = select_coins(self.utxos, 9500, 'bnb')
+        self.assertEqual(sum(values_of(selected)), 9500)
+
+        # within the dust limit counts as a match
+        total = sum(values_of(select_coins(self.utxos, 6150, 'bnb')))
+        self.assertTrue(6150 <= total <= 6150 + CHANGE_DUST_LIMIT)
+
+        # no changeless set: the min_inputs selection
+        self.assertEqual(values_of(select_coins(make_utxos([1000, 1000]), 1500, 'bnb')), [1000, 1000])
+
+    # ------------------------------------------------------------------------------------
+    def test_insufficient_funds(self):
+        for strategy in ('first_fit', 'largest_first', 'smallest_sufficient', 'min_inputs', 'bnb'):
+            with self.assertRaises(InsufficientFundsError):
+                select_coins(self.utxos, 20000, strategy)
+
+    # ------------------------------------------------------------------------------------
+    # every strategy covers the target on a large random wallet, quickly
+    def test_large_wallet(self):
+        rng = random.Random(7)
+        utxos = make_utxos([rng.randint(546, 100000) for _ in range(100000)])
+        start = time.time()
+        pool = UtxoPool(utxos)
+        for target in (1000, 250000, 3000000):
+            self.assertGreaterEqual(sum(values_of(bnb(pool, target))), target)
+            for strategy in ('first_fit', 'largest_first', 'smallest_sufficient', 'min_inputs'):
+                self.assertGreaterEqual(sum(values_of(select_coins(utxos, target, strategy))), target)
+        self.assertLess(time.time() - start, 10)
+
+
+if __name__ == '__main__':
+    run_tests(TestCoinSelection)
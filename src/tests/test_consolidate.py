@@ -0,0 +1,142 @@
+import sys
+import unittest
+from unittest.mock import patch, MagicMock
+from io import StringIO
+
+sys.path.append('../')
+from consolidate_command import ConsolidateCommand
+from transaction import build_tx_from_config
+from fee import estimate_p2pkh_size
+
+
+def run_tests(test_class):
+    suite = unittest.TestLoader().loadTestsFromTestCase(test_class)
+    runner = unittest.TextTestRunner(verbosity=2)
+    runner.run(suite)
+
+
+# parent transaction with two outputs (1000 and 2100 sats) to mg7k4cWKZAH6dHFAk4GPjuWFvmFZBHKf7s
+PARENT_TXID = 'ba37f74000558e145f1e1789c642fb69d2384b39211f4943c46de016f791451e'
+PARENT_TX = '01000000015e0e47ce9c004147ca26a528edc09a2fd352e33bcb80b986685814580dba9840010000006b483045022100db2932276998523885af95f936f42c3465f15ec3449cf552b2e9f72a20a7cfa202200f530c5e6e4bd4bb1cee4f6faead4d33a5f7f3f37a9224889e93206517f609ce412103b4fb064ab28ec2daa9b162c6c4bcaf3cbacf5aa29e094c36fd9e302a9583f0eaffffffff02e8030000000000001976a9140694591e4bf16f2b2b64989192778e772d21f5d788ac34080000000000001976a9140694591e4bf16f2b2b64989192778e772d21f5d788ac00000000'
+SENDER = 'mg7k4cWKZAH6dHFAk4GPjuWFvmFZBHKf7s'
+SENDER_KEY = {'key_info': {'private_key': 'cVoVmd5zY69LEevwGa5iq1Ba3oBc6J8xxUqdKuJCtuFWUJJngPPP', 'bitcoin_address': SENDER}}
+
+
+def make_command(**kwargs):
+    args = dict(sender_key=None, sender=SENDER, network='mock', fee=300, inform='toml', out=None)
+    args.update(kwargs)
+    return ConsolidateCommand(**args)
+
+
+class TestConsolidateCommand(unittest.TestCase):
+
+    # ------------------------------------------------------------------------------------
+    # -batch_size splits the UTXO set in order
+    def test_split_batches(self):
+        cmd = make_command(batch_size=2)
+        utxos = [{'tx_hash': PARENT_TXID, 'tx_pos': n, 'value': 1000} for n in range(5)]
+        self.assertEqual([len(b) for b in cmd.split_batches(utxos)], [2, 2, 1])
+
+    # -max_bytes limits the inputs so each transaction stays within the size
+    def test_inputs_per_batch_from_max_bytes(self):
+        cmd = make_command(max_bytes=1000)
+        n = cmd.inputs_per_batch()
+        self.assertEqual(n, 6)
+        self.assertLessEqual(estimate_p2pkh_size(n, 1), 1000)
+        self.assertGreater(estimate_p2pkh_size(n + 1, 1), 1000)
+
+        # the smaller of the two limits wins
+        self.assertEqual(make_command(max_bytes=1000, batch_size=4).inputs_per_batch(), 4)
+
+    # ------------------------------------------------------------------------------------
+    # each batch pays a fee proportional to its size
+    def test_batch_fee_is_size_proportional(self):
+        cmd = make_command(batch_size=10, fee_rate=2)
+        inputs = [{'tx_hash': PARENT_TXID, 'tx_pos': n, 'amount': 1000} for n in range(3)]
+        params = cmd.batch_parameters(SENDER, inputs)
+
+        fee = 2 * estimate_p2pkh_size(3, 1)
+        self.assertEqual(params['tx_info'], {
+            'create_change_output': False,
+            'tx_default_fee': fee,
+            'tx_fee_rate': 2,
+            'tx_predicted_size': estimate_p2pkh_size(3, 1)
+        })
+        self.assertEqual(params['transactionoutput'][0]['amount'], 3000 - fee)
+        self.assertEqual(params['transactionoutput'][0]['public_key'], SENDER)
+
+    # ------------------------------------------------------------------------------------
+    # batches are built and signed in worker processes; the result matches a serial build
+    @patch('sys.stdout', new_callable=StringIO)
+    @patch('useful.read_toml_file', return_value=SENDER_KEY)
+    @patch('consolidate_command.get_full_tx', return_value=PARENT_TX)
+    @patch('consolidate_command.create_interface')
+    def test_batches_signed_in_parallel(self, mock_create_interface, mock_get_full_tx, mock_read_file, mock_stdout):
+        mock_create_interface.return_value.get_utxo.return_value = [
+            {'height': 1, 'tx_pos': 0, 'tx_hash': PARENT_TXID, 'value': 1000},
+            {'height': 1, 'tx_pos': 1, 'tx_hash': PARENT_TXID, 'value': 2100},
+        ]
+        cmd = make_command(sender=None, sender_key='alice.key', batch_size=1, sign=True, workers=2)
+        cmd.run()
+
+        # one download for the shared parent
+        mock_get_full_tx.assert_called_once_with(PARENT_TXID, 'mock')
+
+        # two batches, each signed exactly as a serial build would
+        output = mock_stdout.getvalue()
+        self.assertIn("number of batches: 2", output)
+        for utxo in mock_create_interface.return_value.get_utxo.return_value:
+            params = cmd.batch_parameters(SENDER, [{
+                'tx_hash': PARENT_TXID,
+                'tx_pos': utxo['tx_pos'],
+                'amount': utxo['value'],
+                'input_tx_hash': PARENT_TX,
+                'private_key_for_signing': SENDER_KEY['key_info']['private_key']
+            }])
+            self.assertIn(build_tx_from_config(params), output)
+
+    # -broadcast sends every signed batch in one broadcast_many call
+    @patch('sys.stdout', new_callable=StringIO)
+    @patch('useful.read_toml_file', return_value=SENDER_KEY)
+    @patch('transaction.broadcast_many', return_value=['txid_1', None])
+    @patch('consolidate_command.get_full_tx', return_value=PARENT_TX)
+    @patch('consolidate_command.create_interface')
+    def test_signed_batches_broadcast(self, mock_create_interface, mock_get_full_tx, mock_broadcast, mock_read_file, mock_stdout):
+        mock_create_interface.return_value.get_utxo.return_value = [
+            {'height': 1, 'tx_pos': 0, 'tx_hash': PARENT_TXID, 'value': 1000},
+            {'height': 1, 'tx_pos': 1, 'tx_hash': PARENT_TXID, 'value': 2100},
+        ]
+        cmd = make_command(sender=None, sender_key='alice.key', batch_size=1, sign=True, workers=1, broadcast=True)
+        with self.assertRaises(SystemExit):
+            cmd.run()
+
+        signed, network = mock_broadcast.call_args.args
+        self.assertEqual((len(signed), network), (2, 'mock'))
+        self.assertIn('Broadcast 1/2 batches', mock_stdout.getvalue())
+
+    # ------------------------------------------------------------------------------------
+    # the balance comes from the one utxo request, and must cover the fee
+    @patch('sys.stdout', new_callable=StringIO)
+    @patch('consolidate_command.create_interface')
+    def test_one_request_and_fee_check(self, mock_create_interface, mock_stdout):
+        interface = MagicMock()
+        interface.get_utxo.return_value = [{'height': 1, 'tx_pos': 0, 'tx_hash': PARENT_TXID, 'value': 250}]
+        mock_create_interface.return_value = interface
+
+        with self.assertRaises(SystemExit):
+            make_command(fee=300).run()
+        self.assertIn('Error: not enough funds to cover fee of 300', mock_stdout.getvalue())
+        interface.get_utxo.assert_called_once_with(SENDER)
+        interface.get_balance.assert_not_called()
+
+    # -sign needs a key
+    @patch('sys.stdout', new_callable=StringIO)
+    def test_sign_needs_sender_key(self, mock_stdout):
+        cmd = make_command(batch_size=1, sign=True)
+        with self.assertRaises(SystemExit):
+            cmd.run()
+        self.assertIn('Error: -sign needs the -sender_key', mock_stdout.getvalue())
+
+
+if __name__ == '__main__':
+    run_tests(TestConsolidateCommand)
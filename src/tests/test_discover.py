@@ -0,0 +1,113 @@
+import sys
+import tempfile
+import unittest
+from io import StringIO
+from unittest.mock import MagicMock, patch
+
+sys.path.append('../')
+import useful
+from discover_command import DiscoverCommand, discover
+from hd_wallet import master_wallet, account_manifest, account_addresses, read_manifest
+from interfaces import create_interface
+
+
+def run_tests(test_class):
+    suite = unittest.TestLoader().loadTestsFromTestCase(test_class)
+    runner = unittest.TextTestRunner(verbosity=2)
+    runner.run(suite)
+
+
+# a network where the addresses at used_indexes have history (or, for the
+# last one, only an unconfirmed balance)
+class FakeInterface:
+
+    def __init__(self, xpub, used_indexes):
+        addresses = account_addresses(xpub, 0, max(used_indexes) + 1)
+        self.used = [addresses[i] for i in used_indexes]
+        self.bulk_calls = 0
+
+    def get_bulk_history(self, addresses):
+        self.bulk_calls += 1
+        return {a: ([{'tx_hash': 'ab', 'height': 1}] if a in self.used[:-1] else []) for a in addresses}
+
+    def get_bulk_balance(self, addresses):
+        return {a: {'confirmed': 0, 'unconfirmed': 5 if a == self.used[-1] else 0} for a in addresses}
+
+    # single-address calls are only made for addresses the bulk calls miss
+    def get_addr_history(self, address):
+        raise AssertionError(address)
+
+    get_balance = get_addr_history
+
+
+class TestDiscover(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.manifest = account_manifest(master_wallet('my_seed', '123456'), 'testnet', 0, 0, 5)
+        self.xpub = self.manifest['hd_account']['xpub']
+        for patcher in (patch('hd_wallet.path', self.tmp.name),
+                        patch.object(useful, 'path', self.tmp.name),
+                        patch('sys.stdout', new=StringIO())):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        useful.write_to_file('shop.hd', self.manifest, True)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    # ------------------------------------------------------------------------------------
+    # windows are scanned until gap_limit addresses in a row are unused
+    def test_gap_limit(self):
+        fake = FakeInterface(self.xpub, [0, 3, 30])
+        with patch('key_functions.create_interface', return_value=fake):
+            last_used, found = discover(self.xpub, 'testnet', 0, -1, gap_limit=20, window=10)
+            self.assertEqual(last_used, 3)
+            self.assertEqual([i for i, _ in found], [0, 3])
+            self.assertEqual(fake.bulk_calls, 3)
+
+            last_used, found = discover(self.xpub, 'testnet', 0, -1, gap_limit=30, window=10)
+            self.assertEqual(last_used, 30)
+            self.assertEqual(found[-1], (30, fake.used[-1]))
+
+    # the manifest remembers the last used index and later scans resume after it
+    def test_resume(self):
+        fake = FakeInterface(self.xpub, [2, 12])
+        with patch('key_functions.create_interface', return_value=fake), \
+                patch('discover_command.discover', wraps=discover) as scan:
+            DiscoverCommand('shop.hd', gap_limit=10, window=10).run()
+            account = read_manifest('shop.hd')
+            self.assertEqual((account['last_used'], account['count']), (12, 13))
+
+            DiscoverCommand('shop.hd', gap_limit=10, window=10).run()
+            self.assertEqual(scan.call_args.args[2:4], (13, 12))
+            DiscoverCommand('shop.hd', gap_limit=10, window=10, rescan=True).run()
+            self.assertEqual(scan.call_args.args[2:4], (0, -1))
+
+    # an address neither query answers stops the scan
+    def test_unanswered(self):
+        fake = MagicMock(spec=['get_addr_history', 'get_balance'])
+        fake.get_addr_history.return_value = None
+        fake.get_balance.return_value = None
+        with patch('key_functions.create_interface', return_value=fake), \
+                patch('sys.stdout', new=StringIO()) as fake_out, self.assertRaises(SystemExit):
+            DiscoverCommand('shop.hd').run()
+        self.assertIn('could not get the history or balance', fake_out.getvalue())
+        self.assertNotIn('last_used', read_manifest('shop.hd'))
+
+    def test_wrong_network(self):
+        with patch('sys.stdout', new=StringIO()) as fake_out, self.assertRaises(SystemExit):
+            DiscoverCommand('shop.hd', network='mainnet').run()
+        self.assertIn('is a testnet account', fake_out.getvalue())
+
+    # WoC answers the bulk history endpoint under 'result'
+    @patch('interfaces.limited_request')
+    def test_woc_bulk_history(self, mock_request):
+        mock_request.return_value = MagicMock(status_code=200)
+        mock_request.return_value.json.return_value = [{'address': 'a1', 'result': [], 'error': ''}]
+        self.assertEqual(create_interface('testnet').get_bulk_history(['a1']), {'a1': []})
+        self.assertTrue(mock_request.call_args.args[2].endswith('/addresses/confirmed/history'))
+
+
+if __name__ == '__main__':
+    run_tests(TestDiscover)
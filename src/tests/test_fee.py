@@ -0,0 +1,149 @@
+import sys
+import unittest
+from unittest.mock import patch, MagicMock
+from io import StringIO
+
+sys.path.append('../')
+from tx_engine import Tx
+from fee import estimate_size, estimate_p2pkh_size, fee_for_size
+from transaction import build_tx_from_config
+from transaction_command import TransactionCommand
+from interfaces import resolve_fee_rate, command_fee_rate
+
+
+def run_tests(test_class):
+    suite = unittest.TestLoader().loadTestsFromTestCase(test_class)
+    runner = unittest.TextTestRunner(verbosity=2)
+    runner.run(suite)
+
+
+# parent transaction with two outputs (1000 and 2100 sats) to SENDER
+PARENT_TXID = 'ba37f74000558e145f1e1789c642fb69d2384b39211f4943c46de016f791451e'
+PARENT_TX = '01000000015e0e47ce9c004147ca26a528edc09a2fd352e33bcb80b986685814580dba9840010000006b483045022100db2932276998523885af95f936f42c3465f15ec3449cf552b2e9f72a20a7cfa202200f530c5e6e4bd4bb1cee4f6faead4d33a5f7f3f37a9224889e93206517f609ce412103b4fb064ab28ec2daa9b162c6c4bcaf3cbacf5aa29e094c36fd9e302a9583f0eaffffffff02e8030000000000001976a9140694591e4bf16f2b2b64989192778e772d21f5d788ac34080000000000001976a9140694591e4bf16f2b2b64989192778e772d21f5d788ac00000000'
+SENDER = 'mg7k4cWKZAH6dHFAk4GPjuWFvmFZBHKf7s'
+SENDER_WIF = 'cVoVmd5zY69LEevwGa5iq1Ba3oBc6J8xxUqdKuJCtuFWUJJngPPP'
+RECIPIENT = 'msJjhsacnGxvzFMHBXoqdr63DhVRXdPQjS'
+
+
+def make_config(amount, fee_rate, data=None):
+    output = {'public_key': RECIPIENT, 'amount': amount, 'op_return': data is not None, 'data_to_encode': data or ''}
+    if data is not None:
+        output['data_to_encode_file'] = False
+    return {
+        'interface': {'interface_type': 'mock', 'network_type': 'testnet'},
+        'transactioninput': [
+            {'tx_hash': PARENT_TXID, 'tx_pos': n, 'amount': amount_in, 'input_tx_hash': PARENT_TX, 'private_key_for_signing': SENDER_WIF}
+            for n, amount_in in enumerate([1000, 2100])],
+        'transactionoutput': [output],
+        'tx_info': {'create_change_output': True, 'change_output_public_key': SENDER, 'tx_default_fee': 300, 'tx_fee_rate': fee_rate},
+    }
+
+
+class TestFee(unittest.TestCase):
+
+    # ------------------------------------------------------------------------------------
+    def test_estimate_size(self):
+        self.assertEqual(estimate_size(3, [25, 25]), estimate_p2pkh_size(3, 2))
+        # an OP_RETURN script with 80 bytes of data: OP_FALSE OP_RETURN OP_PUSHDATA1 80 <data>
+        self.assertEqual(estimate_size(1, [84]) - estimate_size(1, []), 8 + 1 + 84)
+
+    # ------------------------------------------------------------------------------------
+    # build_tx pays tx_fee_rate on the predicted size, never less once signed
+    @patch('sys.stdout', new_callable=StringIO)
+    def test_build_tx_size_based_fee(self, mock_stdout):
+        for data in (None, 'x' * 200):
+            signed = Tx.parse_hexstr(build_tx_from_config(make_config(1500, 1, data)))
+            size = len(signed.serialize())
+            fee = 3100 - sum(out.amount for out in signed.tx_outs)
+            self.assertEqual(len(signed.tx_outs), 2)
+            self.assertGreaterEqual(fee, size)
+            self.assertLessEqual(fee - size, 2)
+
+    # no change output when the change would be dust, and an error when the inputs are short
+    @patch('sys.stdout', new_callable=StringIO)
+    def test_build_tx_dust_and_shortfall(self, mock_stdout):
+        signed = Tx.parse_hexstr(build_tx_from_config(make_config(2750, 0.5)))
+        self.assertEqual(len(signed.tx_outs), 1)
+
+        with self.assertRaises(ValueError):
+            build_tx_from_config(make_config(3000, 1))
+
+    # change above the dust limit before, but not after, paying for its own
+    # output bytes goes to the fee rather than into an unpaid change output
+    @patch('sys.stdout', new_callable=StringIO)
+    def test_build_tx_change_at_dust_boundary(self, mock_stdout):
+        for amount in (474, 490, 507):
+            config = make_config(amount, 1)
+            config['transactioninput'] = config['transactioninput'][:1]
+            signed = Tx.parse_hexstr(build_tx_from_config(config))
+            self.assertEqual(len(signed.tx_outs), 1)
+            self.assertGreaterEqual(1000 - amount, len(signed.serialize()))
+
+        config = make_config(473, 1)
+        config['transactioninput'] = config['transactioninput'][:1]
+        signed = Tx.parse_hexstr(build_tx_from_config(config))
+        self.assertEqual(len(signed.tx_outs), 2)
+        self.assertGreaterEqual(1000 - sum(out.amount for out in signed.tx_outs), len(signed.serialize()))
+
+    # ------------------------------------------------------------------------------------
+    # genparam writes the rate, the predicted size and the fee into tx_info
+    @patch('sys.stdout', new_callable=StringIO)
+    def test_genparam_fee_rate(self, mock_stdout):
+        cmd = TransactionCommand(genparam=True, network='mock', amount=1000, sender=SENDER, recipient=RECIPIENT,
+                                 fee_rate=2, coin_selection='largest_first')
+        cmd.interface.utxo = {SENDER: [
+            {'height': 1, 'tx_pos': 0, 'tx_hash': PARENT_TXID, 'value': 1000},
+            {'height': 1, 'tx_pos': 1, 'tx_hash': PARENT_TXID, 'value': 2100},
+        ]}
+        cmd.interface.transactions = {PARENT_TXID: PARENT_TX}
+        cmd.run()
+
+        size = estimate_p2pkh_size(1, 2)
+        output = mock_stdout.getvalue()
+        self.assertIn(f'tx_default_fee = {fee_for_size(size, 2)}\n', output)
+        self.assertIn('tx_fee_rate = 2\n', output)
+        self.assertIn(f'tx_predicted_size = {size}\n', output)
+
+    # the fee grows with the inputs: selection repeats until it covers its own fee
+    @patch('sys.stdout', new_callable=StringIO)
+    def test_genparam_reselects_for_fee(self, mock_stdout):
+        cmd = TransactionCommand(genparam=True, network='mock', amount=900, sender=SENDER, fee_rate=1)
+        cmd.interface.utxo = {SENDER: [
+            {'height': 1, 'tx_pos': 0, 'tx_hash': PARENT_TXID, 'value': 1000},
+            {'height': 1, 'tx_pos': 1, 'tx_hash': PARENT_TXID, 'value': 2100},
+        ]}
+        cmd.interface.transactions = {PARENT_TXID: PARENT_TX}
+        data_dict: dict = {}
+        cmd.find_inputs(data_dict)
+        self.assertEqual(len(data_dict['transactioninput']), 2)
+        self.assertEqual(cmd.predicted_size, estimate_p2pkh_size(2, 1))
+
+    # ------------------------------------------------------------------------------------
+    # 'node' reads the relay fee of the regtest node (BSV/kB)
+    def test_resolve_fee_rate(self):
+        self.assertEqual(resolve_fee_rate(0.25, MagicMock(side_effect=AssertionError)), 0.25)
+        self.assertIsNone(resolve_fee_rate(None, MagicMock(side_effect=AssertionError)))
+
+        rpc_interface = MagicMock()
+        rpc_interface.rpc_connection.getnetworkinfo.return_value = {'relayfee': 0.00000250}
+        fee_rate = resolve_fee_rate('node', lambda: rpc_interface)
+        assert fee_rate is not None
+        self.assertAlmostEqual(fee_rate, 0.25)
+
+        with self.assertRaises(ValueError):
+            resolve_fee_rate('node', object)
+
+    # the commands fall back to their default, and exit on a rate they cannot resolve
+    @patch('sys.stdout', new_callable=StringIO)
+    def test_command_fee_rate(self, mock_stdout):
+        self.assertEqual(command_fee_rate(2, MagicMock(side_effect=AssertionError), 0.5), 2)
+        self.assertEqual(command_fee_rate(None, MagicMock(side_effect=AssertionError), 0.5), 0.5)
+        self.assertIsNone(command_fee_rate(None, MagicMock(side_effect=AssertionError)))
+
+        with self.assertRaises(SystemExit):
+            command_fee_rate('node', object)
+        self.assertIn('Error: ', mock_stdout.getvalue())
+
+
+if __name__ == '__main__':
+    run_tests(TestFee)
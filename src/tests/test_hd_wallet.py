@@ -0,0 +1,96 @@
+import json
+import os
+import sys
+import tempfile
+import unittest
+from io import StringIO
+from unittest.mock import patch
+
+sys.path.append('../')
+import key_index
+import useful
+from hd_wallet import master_wallet, derive_keys, account_addresses, indexed_account_addresses, account_manifest, hd_keys
+from key_command import KeyCommand
+
+
+def run_tests(test_class):
+    suite = unittest.TestLoader().loadTestsFromTestCase(test_class)
+    runner = unittest.TextTestRunner(verbosity=2)
+    runner.run(suite)
+
+
+# receive addresses 0..2 of account 0 for seed "my_seed", nonce "123456"
+ADDRESSES = ['mz2VDaLhPWe7ko1X2WhzCW8AM71ZFn2BjK', 'mkDTcaMCnBQYHwcGmxgwv3FLKwVF8fyc9z', 'mq9KRS7rPG2NhFTnNf4iQo8DWf5aSPdZN8']
+FIRST_WIF = 'cRhSHBvbQowiLLrPaGniniXdg93wsPFwsX4tq4wUvPFV1Nuos3qc'
+
+
+class TestHdWallet(unittest.TestCase):
+
+    def setUp(self):
+        self.master = master_wallet('my_seed', '123456', 'testnet')
+        self.tmp = tempfile.TemporaryDirectory()
+        for patcher in (patch('hd_wallet.path', self.tmp.name),
+                        patch.object(key_index, 'path', self.tmp.name),
+                        patch.object(useful, 'path', self.tmp.name)):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        index = key_index._index.pop(self.tmp.name, None)
+        if index is not None:
+            index.close()
+        self.tmp.cleanup()
+
+    # ------------------------------------------------------------------------------------
+    # addresses from the xpub match the private derivation
+    def test_derive_keys(self):
+        keys = list(derive_keys(self.master, 0, 0, 3, private=True))
+        self.assertEqual([k[2] for k in keys], ADDRESSES)
+        self.assertEqual(keys[0][:2], (0, "m/0'/0/0"))
+        self.assertEqual(keys[0][3], FIRST_WIF)
+        self.assertEqual(self.master.wallet_at_path("m/0'/0/0").to_wif(), FIRST_WIF)
+
+        public = list(derive_keys(self.master, 0, 1, 2))
+        self.assertEqual(public, [(1, "m/0'/0/1", ADDRESSES[1], None), (2, "m/0'/0/2", ADDRESSES[2], None)])
+
+        xpub = account_manifest(self.master, 'regtest', 0, 0, 3)['hd_account']['xpub']
+        self.assertEqual(account_addresses(xpub, 0, 3), ADDRESSES)
+
+    # the manifest's addresses are listed with the .key files of its network
+    def test_manifest_listed(self):
+        with patch('sys.stdout', new=StringIO()) as fake_out:
+            KeyCommand(seed='my_seed', nonce='123456', hd=True, start=1, count=2, output_file='shop.hd').generate_hd()
+        lines = [json.loads(line) for line in fake_out.getvalue().splitlines()]
+        self.assertEqual([line['address'] for line in lines], ADDRESSES[1:])
+        self.assertNotIn('private_key', lines[0])
+
+        self.assertEqual(hd_keys('regtest'), [('shop.hd/1', ADDRESSES[1]), ('shop.hd/2', ADDRESSES[2])])
+        self.assertEqual(hd_keys('mainnet'), [])
+        with patch('sys.stdout', new=StringIO()):
+            keys, pems = useful.list_keys('testnet')
+        self.assertEqual(keys, hd_keys('testnet'))
+
+    # addresses derived once are read back from the key index; raising the
+    # count derives only the new indexes
+    def test_addresses_indexed(self):
+        xpub = account_manifest(self.master, 'testnet', 0, 0, 3)['hd_account']['xpub']
+        with patch('hd_wallet.account_addresses', wraps=account_addresses) as derive:
+            self.assertEqual(indexed_account_addresses(xpub, 1, 1), ADDRESSES[1:2])
+            self.assertEqual(indexed_account_addresses(xpub, 0, 3), ADDRESSES)
+            self.assertEqual(indexed_account_addresses(xpub, 0, 3), ADDRESSES)
+        self.assertEqual([c.args[1:] for c in derive.call_args_list], [(1, 1), (0, 3)])
+
+        with patch.dict(os.environ, {'WBT_KEY_INDEX': '0'}), patch.dict(key_index._index, clear=True):
+            self.assertEqual(indexed_account_addresses(xpub, 0, 3), ADDRESSES)
+
+    # without -out the private keys are in the JSON lines
+    def test_private_keys_to_stdout(self):
+        with patch('sys.stdout', new=StringIO()) as fake_out:
+            KeyCommand(seed='my_seed', nonce='123456', hd=True, count=1).generate_hd()
+        line = json.loads(fake_out.getvalue())
+        self.assertEqual((line['address'], line['private_key']), (ADDRESSES[0], FIRST_WIF))
+        self.assertEqual(os.listdir(self.tmp.name), [])
+
+
+if __name__ == '__main__':
+    run_tests(TestHdWallet)
@@ -0,0 +1,80 @@
+import sys
+import unittest
+
+sys.path.append('../')
+from input_resolver import InputResolver
+
+
+def run_tests(test_class):
+    suite = unittest.TestLoader().loadTestsFromTestCase(test_class)
+    runner = unittest.TextTestRunner(verbosity=2)
+    runner.run(suite)
+
+
+PARENT_A = 'aa' * 32
+PARENT_B = 'bb' * 32
+
+
+class TestInputResolver(unittest.TestCase):
+
+    def setUp(self):
+        self.fetched = []
+
+    def fetch(self, txid):
+        self.fetched.append(txid)
+        return f'raw_{txid[:2]}'
+
+    # ------------------------------------------------------------------------------------
+    # 500 outputs of one fan-out transaction cost a single download
+    def test_fan_out_parent_downloaded_once(self):
+        utxos = [{'tx_hash': PARENT_A, 'tx_pos': n, 'value': 1000} for n in range(500)]
+        resolver = InputResolver(self.fetch, 'wif', max_workers=8)
+
+        inputs = resolver.resolve(utxos)
+
+        self.assertEqual(self.fetched, [PARENT_A])
+        self.assertEqual(len(inputs), 500)
+        self.assertEqual([i['tx_pos'] for i in inputs], list(range(500)))
+
+    # ------------------------------------------------------------------------------------
+    # the entries match the [[transactioninput]] layout of the param files
+    def test_resolve_entries(self):
+        utxos = [
+            {'tx_hash': PARENT_B, 'tx_pos': 1, 'value': 2100},
+            {'tx_hash': PARENT_A, 'tx_pos': 0, 'value': 1000},
+        ]
+        inputs = InputResolver(self.fetch, 'wif', max_workers=2).resolve(utxos)
+
+        self.assertEqual(inputs, [
+            {'tx_hash': PARENT_B, 'tx_pos': 1, 'amount': 2100, 'input_tx_hash': 'raw_bb', 'private_key_for_signing': 'wif'},
+            {'tx_hash': PARENT_A, 'tx_pos': 0, 'amount': 1000, 'input_tx_hash': 'raw_aa', 'private_key_for_signing': 'wif'},
+        ])
+
+    # parents are remembered across resolve() calls
+    def test_parents_shared_between_calls(self):
+        resolver = InputResolver(self.fetch, 'wif')
+        resolver.resolve([{'tx_hash': PARENT_A, 'tx_pos': 0, 'value': 1}])
+        resolver.resolve([{'tx_hash': PARENT_A, 'tx_pos': 1, 'value': 1},
+                          {'tx_hash': PARENT_B, 'tx_pos': 0, 'value': 1}])
+        self.assertEqual(self.fetched, [PARENT_A, PARENT_B])
+
+    # with fetch_many the missing parents are fetched in one call
+    def test_fetch_many(self):
+        batches = []
+
+        def fetch_many(txids):
+            batches.append(txids)
+            return {txid: f'raw_{txid[:2]}' for txid in txids}
+
+        resolver = InputResolver(self.fetch, 'wif', fetch_many=fetch_many)
+        utxos = [{'tx_hash': parent, 'tx_pos': n, 'value': 1} for n in range(3) for parent in (PARENT_A, PARENT_B)]
+        inputs = resolver.resolve(utxos)
+        resolver.resolve(utxos[:2])
+
+        self.assertEqual(batches, [[PARENT_A, PARENT_B]])
+        self.assertEqual(self.fetched, [])
+        self.assertEqual(inputs[1]['input_tx_hash'], 'raw_bb')
+
+
+if __name__ == '__main__':
+    run_tests(TestInputResolver)
@@ -1,9 +1,13 @@
 import sys
 import unittest
-from unittest.mock import patch
+from unittest.mock import patch, MagicMock
+
+import requests
 
 sys.path.append('../')
 from useful import build_interface_config, add_interface_to_config
+import interfaces
+from interfaces import create_interface, BatchingRPCInterface
 
 
 def run_tests(test_class):
@@ -76,6 +80,63 @@ class TestInterfaceConfig(unittest.TestCase):
         self.assertNotIn('password', data['interface'])
         self.assertNotIn('address', data['interface'])
 
+    # ------------------------------------------------------------------------------------
+    # regtest calls go to the node in JSON-RPC batches, with one result or
+    # error per call
+    def test_rpc_batches(self):
+        node = {'aa' * 32: 'raw_a', 'bb' * 32: 'raw_b'}
+        posts = []
+
+        def post(url, json, auth, timeout):
+            posts.append(json)
+            response = MagicMock(status_code=200)
+            response.json.return_value = [
+                {'id': call['id'], 'result': node[call['params'][0]], 'error': None} if call['params'][0] in node
+                else {'id': call['id'], 'result': None, 'error': {'code': -5, 'message': 'No such mempool or blockchain transaction'}}
+                for call in json]
+            return response
+
+        rpc = create_interface('regtest')
+        self.assertIsInstance(rpc, BatchingRPCInterface)
+        with patch.object(rpc.session, 'post', side_effect=post), patch.object(interfaces, 'RPC_BATCH_SIZE', 2):
+            raw = rpc.get_raw_transactions(['aa' * 32, 'cc' * 32, 'bb' * 32, 'aa' * 32])
+        self.assertEqual(raw, {'aa' * 32: 'raw_a', 'cc' * 32: None, 'bb' * 32: 'raw_b'})
+        self.assertEqual([len(batch) for batch in posts], [2, 1])
+        self.assertEqual(posts[0][0]['method'], 'getrawtransaction')
+
+    def test_rpc_broadcast_many(self):
+        response = MagicMock(status_code=200)
+        response.json.return_value = [
+            {'id': 0, 'result': 'txid_1', 'error': None},
+            {'id': 1, 'result': None, 'error': {'code': -26, 'message': 'txn-mempool-conflict'}},
+        ]
+        rpc = create_interface('regtest')
+        with patch.object(rpc.session, 'post', return_value=response):
+            answers = rpc.broadcast_many(['tx_1', 'tx_2'])
+        self.assertEqual([(a.status_code, a.content) for a in answers], [(200, 'txid_1'), (-26, 'txn-mempool-conflict')])
+
+        # an HTTP error fails every call of the batch
+        response = MagicMock(status_code=401, text='Unauthorized')
+        response.json.side_effect = ValueError
+        with patch.object(rpc.session, 'post', return_value=response):
+            answers = rpc.broadcast_many(['tx_1', 'tx_2'])
+        self.assertEqual([a.status_code for a in answers], [401, 401])
+
+        # so does a single error object instead of a batch answer
+        response = MagicMock(status_code=500, text='{"error": "bad batch"}')
+        response.json.return_value = {'result': None, 'error': {'code': -32600, 'message': 'bad batch'}}
+        with patch.object(rpc.session, 'post', return_value=response):
+            answers = rpc.broadcast_many(['tx_1', 'tx_2'])
+        self.assertEqual([a.status_code for a in answers], [500, 500])
+
+        # a connection failure fails its batch only; earlier batches keep their results
+        response = MagicMock(status_code=200)
+        response.json.return_value = [{'id': 0, 'result': 'txid_1', 'error': None}]
+        with patch.object(rpc.session, 'post', side_effect=[response, requests.ConnectionError('node restarting')]), \
+                patch.object(interfaces, 'RPC_BATCH_SIZE', 1):
+            answers = rpc.broadcast_many(['tx_1', 'tx_2'])
+        self.assertEqual([(a.status_code, a.content) for a in answers], [(200, 'txid_1'), (-1, 'node restarting')])
+
 
 if __name__ == '__main__':
     run_tests(TestInterfaceConfig)
@@ -4,6 +4,7 @@ from unittest.mock import patch, mock_open
 import tempfile
 from io import StringIO
 import os
+import json
 
 sys.path.append('../')
 from key_command import KeyCommand
@@ -142,6 +143,44 @@ class TestKeyGenerator(unittest.TestCase):
             # Clean up the temporary file
             os.remove(temp_file_path)
 
+    # ------------------------------------------------------------------------------------
+    # a batch file of key_input entries and a nonce range, one JSON line per key in order
+    def test_generate_batch(self):
+        batch = ('[[key_input]]\nseed = "my_seed"\nnonce = "123456"\n\n'
+                 '[[key_range]]\nseed = "my_seed"\nnonce_prefix = "n"\nstart = 1\ncount = 3\n')
+        with tempfile.TemporaryDirectory() as tmp, patch('useful.path', tmp):
+            with open(os.path.join(tmp, 'batch.toml'), 'w') as file:
+                file.write(batch)
+
+            with patch('sys.stdout', new=StringIO()) as fake_out:
+                KeyCommand(batch_file='batch.toml', workers=1, show_seed=True).generate_batch()
+            lines = [json.loads(line) for line in fake_out.getvalue().splitlines()]
+            self.assertEqual([line['nonce'] for line in lines], ['123456', 'n1', 'n2', 'n3'])
+            self.assertEqual(lines[0]['private_key'], 'cQ8GHAKR2SVEktDFwRYT715itDzTKMxoio22mSJi5Bmcx9RMm7pa')
+            self.assertEqual(lines[0]['address'], 'mpunbTFKMq2aNkqnyE55bHNPixFay2GVNS')
+
+            # worker processes give the same keys, and -out writes one file per key
+            with patch('sys.stdout', new=StringIO()) as fake_out:
+                KeyCommand(batch_file='batch.toml', output_file='w.key', workers=2).generate_batch()
+            files = [json.loads(line) for line in fake_out.getvalue().splitlines()]
+            self.assertEqual([f['address'] for f in files], [line['address'] for line in lines])
+            self.assertEqual([f['file'] for f in files], ['w_001.key', 'w_002.key', 'w_003.key', 'w_004.key'])
+            # without -show_seed nothing in the lines reproduces the keys
+            self.assertEqual(set(files[0]), {'address', 'file'})
+            with open(os.path.join(tmp, 'w_001.key')) as file:
+                self.assertIn('mpunbTFKMq2aNkqnyE55bHNPixFay2GVNS', file.read())
+
+    # a batch file without entries is an error
+    def test_generate_batch_empty(self):
+        with tempfile.TemporaryDirectory() as tmp, patch('useful.path', tmp):
+            with open(os.path.join(tmp, 'batch.toml'), 'w') as file:
+                file.write('[other]\nx = 1\n')
+            with patch('sys.stdout', new=StringIO()) as fake_out, self.assertRaises(SystemExit) as cm:
+                KeyCommand(batch_file='batch.toml').generate_batch()
+            self.assertEqual(cm.exception.code, 1)
+            self.assertIn('no key_input or key_range', fake_out.getvalue())
+
+
 # Ideas for things to test:
 # -------------------------
 # - argument parsing
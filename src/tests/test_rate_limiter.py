@@ -0,0 +1,194 @@
+import sys
+import threading
+import unittest
+from unittest.mock import patch, MagicMock
+
+import requests
+
+sys.path.append('../')
+import rate_limiter
+from rate_limiter import TokenBucket, parse_retry_after, limited_request
+from interfaces import create_interface, clear_interfaces, network_from_interface, RateLimitedWoCInterface
+
+
+def run_tests(test_class):
+    suite = unittest.TestLoader().loadTestsFromTestCase(test_class)
+    runner = unittest.TextTestRunner(verbosity=2)
+    runner.run(suite)
+
+
+# a clock that only moves when the bucket sleeps
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+        self.sleeps = []
+
+    def time(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+def fake_response(status_code, headers=None):
+    response = MagicMock()
+    response.status_code = status_code
+    response.headers = headers or {}
+    return response
+
+
+class TestRateLimiter(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = FakeClock()
+
+    def bucket(self, rate, capacity=None):
+        return TokenBucket(rate, capacity, clock=self.clock.time, sleep=self.clock.sleep)
+
+    # ------------------------------------------------------------------------------------
+    # the burst is served immediately, then requests are spaced at the rate
+    def test_bucket_spacing(self):
+        bucket = self.bucket(rate=2, capacity=2)
+        for _ in range(6):
+            bucket.acquire()
+        self.assertAlmostEqual(self.clock.now, 2.0)
+
+    # a rate of zero means no limit
+    def test_bucket_unlimited(self):
+        bucket = self.bucket(rate=0)
+        for _ in range(100):
+            bucket.acquire()
+        self.assertEqual(self.clock.sleeps, [])
+
+    # ------------------------------------------------------------------------------------
+    # throttle pauses every caller for the Retry-After period and halves the rate
+    def test_throttle_and_relax(self):
+        bucket = self.bucket(rate=4)
+        bucket.throttle(10)
+        self.assertEqual(bucket.rate, 2)
+        bucket.acquire()
+        self.assertGreaterEqual(self.clock.now, 10)
+
+        for _ in range(rate_limiter.RECOVERY_STEPS):
+            bucket.relax()
+        self.assertEqual(bucket.rate, 4)
+
+    # the rate never drops below a fraction of the configured rate
+    def test_throttle_floor(self):
+        bucket = self.bucket(rate=8)
+        for _ in range(20):
+            bucket.throttle(0)
+        self.assertEqual(bucket.rate, 8 / rate_limiter.MIN_RATE_DIVISOR)
+
+    # ------------------------------------------------------------------------------------
+    def test_parse_retry_after(self):
+        self.assertEqual(parse_retry_after('7'), 7.0)
+        self.assertIsNone(parse_retry_after(None))
+        self.assertIsNone(parse_retry_after('soon'))
+        # HTTP date, 30 seconds after "now"
+        self.assertEqual(parse_retry_after('Thu, 01 Jan 1970 00:00:30 GMT', now=0), 30.0)
+
+    # ------------------------------------------------------------------------------------
+    # a 429 is retried after the Retry-After period
+    @patch('rate_limiter.requests.request')
+    def test_limited_request_honours_retry_after(self, mock_request):
+        mock_request.side_effect = [fake_response(429, {'Retry-After': '5'}), fake_response(200)]
+        bucket = self.bucket(rate=100)
+        with patch.object(rate_limiter, 'get_rate_limiter', return_value=bucket), \
+                patch('sys.stdout'):
+            response = limited_request('testnet', 'GET', 'https://example.invalid')
+
+        assert response is not None
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(mock_request.call_count, 2)
+        self.assertGreaterEqual(self.clock.now, 5)
+
+    # a non-retryable error is returned straight away
+    @patch('rate_limiter.requests.request')
+    def test_limited_request_no_retry_on_404(self, mock_request):
+        mock_request.return_value = fake_response(404)
+        bucket = self.bucket(rate=100)
+        with patch.object(rate_limiter, 'get_rate_limiter', return_value=bucket):
+            response = limited_request('testnet', 'GET', 'https://example.invalid')
+        assert response is not None
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(mock_request.call_count, 1)
+
+    # a broadcast whose answer was lost is not sent again; one that never
+    # reached the server, or got a 429, is
+    @patch('rate_limiter.requests.request')
+    def test_limited_request_post_retries(self, mock_request):
+        bucket = self.bucket(rate=100)
+        with patch.object(rate_limiter, 'get_rate_limiter', return_value=bucket), patch('sys.stdout'):
+            mock_request.side_effect = [requests.ReadTimeout('read timed out'), fake_response(200)]
+            self.assertIsNone(limited_request('testnet', 'POST', 'https://example.invalid'))
+            self.assertEqual(mock_request.call_count, 1)
+
+            mock_request.reset_mock()
+            mock_request.side_effect = [fake_response(503), fake_response(200)]
+            response = limited_request('testnet', 'POST', 'https://example.invalid')
+            assert response is not None
+            self.assertEqual(response.status_code, 503)
+
+            mock_request.reset_mock()
+            mock_request.side_effect = [requests.ConnectTimeout('connect timed out'), fake_response(429), fake_response(200)]
+            response = limited_request('testnet', 'POST', 'https://example.invalid')
+            assert response is not None
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(mock_request.call_count, 3)
+
+            # a read-only POST is retried like a GET
+            mock_request.reset_mock()
+            mock_request.side_effect = [requests.ReadTimeout('read timed out'), fake_response(200)]
+            response = limited_request('testnet', 'POST', 'https://example.invalid', idempotent=True)
+            assert response is not None
+            self.assertEqual(response.status_code, 200)
+
+    # ------------------------------------------------------------------------------------
+    # WoC networks get the rate limited interface; param files map back to their network
+    def test_create_interface(self):
+        self.assertIsInstance(create_interface('testnet'), RateLimitedWoCInterface)
+        self.assertNotIsInstance(create_interface('mock'), RateLimitedWoCInterface)
+        self.assertEqual(network_from_interface({'interface_type': 'woc', 'network_type': 'mainnet'}), 'mainnet')
+        self.assertEqual(network_from_interface({'interface_type': 'rpc', 'network_type': 'testnet'}), 'regtest')
+        self.assertEqual(network_from_interface({'interface_type': 'mock', 'network_type': 'testnet'}), 'mock')
+
+    # ------------------------------------------------------------------------------------
+    # one WoC interface (and HTTP session) per network, one RPC interface per
+    # thread, a new mock every time
+    def test_interface_registry(self):
+        clear_interfaces()
+        testnet = create_interface('testnet')
+        self.assertIs(create_interface('testnet'), testnet)
+        self.assertIsNot(create_interface('mainnet'), testnet)
+        self.assertIsNot(create_interface('mock'), create_interface('mock'))
+
+        regtest = create_interface('regtest')
+        self.assertIs(create_interface('regtest'), regtest)
+        other_thread = []
+        thread = threading.Thread(target=lambda: other_thread.append(create_interface('regtest')))
+        thread.start()
+        thread.join()
+        self.assertIsNot(other_thread[0], regtest)
+
+        # a different node config gets its own connection
+        with patch.dict('os.environ', {'RPC_HOST': 'node2:18332'}):
+            self.assertIsNot(create_interface('regtest'), regtest)
+
+        clear_interfaces()
+        self.assertIsNot(create_interface('testnet'), testnet)
+
+    # WoC requests go out over the interface's keep-alive session
+    def test_woc_uses_session(self):
+        woc = create_interface('testnet')
+        with patch.object(woc.session, 'request', return_value=fake_response(200)) as mock_request, \
+                patch('rate_limiter.requests.request') as plain_request:
+            woc.get_balance('mg7k4cWKZAH6dHFAk4GPjuWFvmFZBHKf7s')
+            woc.get_balance('mg7k4cWKZAH6dHFAk4GPjuWFvmFZBHKf7s')
+        self.assertEqual(mock_request.call_count, 2)
+        plain_request.assert_not_called()
+
+
+if __name__ == '__main__':
+    run_tests(TestRateLimiter)
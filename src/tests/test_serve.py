@@ -0,0 +1,70 @@
+import os
+import sys
+import tempfile
+import threading
+import unittest
+
+sys.path.append('../')
+from serve_command import ServeCommand
+from command_runner import run_command
+from wbt_client import send_command
+
+
+def run_tests(test_class):
+    suite = unittest.TestLoader().loadTestsFromTestCase(test_class)
+    runner = unittest.TextTestRunner(verbosity=2)
+    runner.run(suite)
+
+
+WIF = 'cVoVmd5zY69LEevwGa5iq1Ba3oBc6J8xxUqdKuJCtuFWUJJngPPP'
+ADDRESS = 'mg7k4cWKZAH6dHFAk4GPjuWFvmFZBHKf7s'
+
+
+class TestServeCommand(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.socket_path = os.path.join(self.tmp.name, 'wbt.sock')
+        self.server = ServeCommand(socket_path=self.socket_path).make_server()
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.tmp.cleanup()
+
+    # ------------------------------------------------------------------------------------
+    # run_command captures the output and turns exit() into an exit code
+    def test_run_command(self):
+        result = run_command(['address', '-pkey', WIF])
+        self.assertEqual(result['exit_code'], 0)
+        self.assertIn(ADDRESS, result['output'])
+
+        result = run_command(['no_such_command'])
+        self.assertEqual(result['exit_code'], 1)
+        self.assertIn('Unrecognized command', result['output'])
+
+        # argparse errors exit with 2 and print the usage
+        self.assertEqual(run_command(['balance', '-n', 'nowhere'])['exit_code'], 2)
+
+    # ------------------------------------------------------------------------------------
+    # commands sent over the socket run in the server process
+    def test_client_round_trip(self):
+        for _ in range(3):
+            response = send_command(self.socket_path, ['address', '-pkey', WIF])
+            self.assertEqual(response['exit_code'], 0)
+            self.assertIn(ADDRESS, response['output'])
+
+        response = send_command(self.socket_path, ['address', '-pkey', 'not a key'])
+        self.assertNotEqual(response['exit_code'], 0)
+
+    # a malformed request gets an error line, not a dropped connection
+    def test_bad_request(self):
+        response = send_command(self.socket_path, 'address')  # type: ignore[arg-type]
+        self.assertEqual(response['exit_code'], 2)
+        self.assertIn('bad request', response['output'])
+
+
+if __name__ == '__main__':
+    run_tests(TestServeCommand)
@@ -0,0 +1,93 @@
+import sys
+import unittest
+
+sys.path.append('../')
+from tx_engine import Tx, TxIn, TxOut, Wallet, p2pkh_script, address_to_public_key_hash
+from signing import BatchSigner, sign_inputs, BATCH_SIGN_THRESHOLD, MIN_INPUTS_PER_WORKER
+
+
+def run_tests(test_class):
+    suite = unittest.TestLoader().loadTestsFromTestCase(test_class)
+    runner = unittest.TextTestRunner(verbosity=2)
+    runner.run(suite)
+
+
+def p2pkh(address):
+    return p2pkh_script(address_to_public_key_hash(address))
+
+
+# build an unsigned spending tx over n_inputs outputs of n_parents parents,
+# paid to n_keys different keys; returns (tx, parents_hex, wifs)
+def make_spend(n_inputs, n_parents=3, n_keys=4):
+    wallets = [Wallet.from_int('BSV_Testnet', 1000 + k) for k in range(n_keys)]
+    outputs_per_parent = -(-n_inputs // n_parents)
+
+    parents = []
+    for p in range(n_parents):
+        tx_outs = [TxOut(amount=1000 + p * 100 + o, script_pubkey=p2pkh(wallets[(p + o) % n_keys].get_address()))
+                   for o in range(outputs_per_parent)]
+        funding = TxIn(prev_tx=f'{p:064x}', prev_index=0)
+        parents.append(Tx(version=1, tx_ins=[funding], tx_outs=tx_outs, locktime=0))
+
+    vins, parents_hex, wifs = [], [], []
+    for i in range(n_inputs):
+        p, o = i % n_parents, i // n_parents
+        vins.append(TxIn(prev_tx=parents[p].id(), prev_index=o))
+        parents_hex.append(parents[p].serialize().hex())
+        wifs.append(wallets[(p + o) % n_keys].to_wif())
+
+    vouts = [TxOut(amount=500, script_pubkey=p2pkh(wallets[0].get_address()))]
+    return Tx(version=1, tx_ins=vins, tx_outs=vouts, locktime=0), parents_hex, wifs
+
+
+# the reference: sign input by input with tx_engine
+def sign_serially(tx, parents_hex, wifs):
+    for i in range(len(tx.tx_ins)):
+        tx = Wallet(wifs[i]).sign_tx(i, Tx.parse_hexstr(parents_hex[i]), tx)
+    return tx.serialize().hex()
+
+
+class TestBatchSigner(unittest.TestCase):
+
+    # ------------------------------------------------------------------------------------
+    # single pass signing is byte-identical to Wallet.sign_tx, input by input
+    def test_matches_wallet_sign_tx(self):
+        tx, parents_hex, wifs = make_spend(24)
+        self.assertEqual(BatchSigner(tx).sign_all(parents_hex, wifs), sign_serially(tx, parents_hex, wifs))
+
+    # the signed transaction parses back and keeps its inputs and outputs
+    def test_signed_tx_parses(self):
+        tx, parents_hex, wifs = make_spend(5)
+        signed = Tx.parse_hexstr(BatchSigner(tx).sign_all(parents_hex, wifs))
+        self.assertEqual(signed.id(), Tx.parse_hexstr(sign_serially(tx, parents_hex, wifs)).id())
+        self.assertEqual(len(signed.tx_ins), 5)
+        self.assertEqual(signed.tx_outs[0].amount, 500)
+
+    # ------------------------------------------------------------------------------------
+    # shared parents and keys are parsed / decoded once
+    def test_parents_and_keys_cached(self):
+        tx, parents_hex, wifs = make_spend(12, n_parents=2, n_keys=3)
+        signer = BatchSigner(tx)
+        signer.sign_all(parents_hex, wifs)
+        self.assertEqual(len(signer.parents), 2)
+        self.assertEqual(len(signer.keys), 3)
+
+    # ------------------------------------------------------------------------------------
+    # both sides of the threshold give the same bytes
+    def test_sign_inputs_either_path(self):
+        for n in (3, BATCH_SIGN_THRESHOLD):
+            tx, parents_hex, wifs = make_spend(n, n_parents=8)
+            self.assertEqual(sign_inputs(tx, parents_hex, wifs), BatchSigner(tx).sign_all(parents_hex, wifs))
+
+    # ------------------------------------------------------------------------------------
+    # inputs signed across worker processes are spliced back byte-identically
+    def test_parallel_matches_serial(self):
+        tx, parents_hex, wifs = make_spend(MIN_INPUTS_PER_WORKER * 3 + 7, n_parents=8)
+        serial = BatchSigner(tx).sign_all(parents_hex, wifs)
+        self.assertEqual(sign_inputs(tx, parents_hex, wifs, workers=3), serial)
+        # uneven chunk sizes
+        self.assertEqual(BatchSigner(tx).sign_all_parallel(tx.serialize().hex(), parents_hex, wifs, 5), serial)
+
+
+if __name__ == '__main__':
+    run_tests(TestBatchSigner)
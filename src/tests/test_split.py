@@ -0,0 +1,98 @@
+import sys
+import unittest
+from unittest.mock import patch
+from io import StringIO
+
+sys.path.append('../')
+from split_command import SplitCommand, split_amounts
+from fee import estimate_p2pkh_size, fee_for_size
+from tx_engine import Tx
+
+
+def run_tests(test_class):
+    suite = unittest.TestLoader().loadTestsFromTestCase(test_class)
+    runner = unittest.TextTestRunner(verbosity=2)
+    runner.run(suite)
+
+
+# parent transaction with two outputs (1000 and 2100 sats) to mg7k4cWKZAH6dHFAk4GPjuWFvmFZBHKf7s
+PARENT_TXID = 'ba37f74000558e145f1e1789c642fb69d2384b39211f4943c46de016f791451e'
+PARENT_TX = '01000000015e0e47ce9c004147ca26a528edc09a2fd352e33bcb80b986685814580dba9840010000006b483045022100db2932276998523885af95f936f42c3465f15ec3449cf552b2e9f72a20a7cfa202200f530c5e6e4bd4bb1cee4f6faead4d33a5f7f3f37a9224889e93206517f609ce412103b4fb064ab28ec2daa9b162c6c4bcaf3cbacf5aa29e094c36fd9e302a9583f0eaffffffff02e8030000000000001976a9140694591e4bf16f2b2b64989192778e772d21f5d788ac34080000000000001976a9140694591e4bf16f2b2b64989192778e772d21f5d788ac00000000'
+SENDER = 'mg7k4cWKZAH6dHFAk4GPjuWFvmFZBHKf7s'
+SENDER_KEY = {'key_info': {'private_key': 'cVoVmd5zY69LEevwGa5iq1Ba3oBc6J8xxUqdKuJCtuFWUJJngPPP', 'bitcoin_address': SENDER}}
+UTXOS = [
+    {'height': 1, 'tx_pos': 0, 'tx_hash': PARENT_TXID, 'value': 1000},
+    {'height': 1, 'tx_pos': 1, 'tx_hash': PARENT_TXID, 'value': 2100},
+]
+
+
+def make_command(**kwargs):
+    args = dict(sender_key='alice.key', sender=None, network='mock', count=3, sign=True, workers=1)
+    args.update(kwargs)
+    return SplitCommand(**args)
+
+
+@patch('sys.stdout', new_callable=StringIO)
+@patch('useful.read_toml_file', return_value=SENDER_KEY)
+@patch('split_command.get_full_tx', return_value=PARENT_TX)
+@patch('split_command.create_interface')
+class TestSplitCommand(unittest.TestCase):
+
+    # ------------------------------------------------------------------------------------
+    # equal outputs; the fees of every transaction come out of the balance
+    def test_split_amounts(self, *mocks):
+        value, amounts, children = split_amounts(3100, 2, 3, 1000, 0.5)
+        self.assertEqual((value, amounts, children), (965, [965] * 3, []))
+
+        value, amounts, children = split_amounts(3100, 2, 5, 3, 0.5)
+        self.assertEqual((value, children), (534, [3, 2]))
+        child_fees = [fee_for_size(estimate_p2pkh_size(1, n), 0.5) for n in children]
+        self.assertEqual(amounts, [n * value + fee for n, fee in zip(children, child_fees)])
+        self.assertLessEqual(sum(amounts) + fee_for_size(estimate_p2pkh_size(2, 2), 0.5), 3100)
+
+        with self.assertRaises(ValueError):
+            split_amounts(10 ** 8, 1, 10, 3, 0.5)
+
+    # one transaction: the whole balance to count equal outputs
+    def test_single_transaction(self, mock_create_interface, mock_get_full_tx, mock_read_file, mock_stdout):
+        mock_create_interface.return_value.get_utxo.return_value = UTXOS
+        make_command().run()
+
+        signed = mock_stdout.getvalue().split('serialised transaction: \n\n')[1].split()[0]
+        tx = Tx.parse_hexstr(signed)
+        self.assertEqual(len(tx.tx_ins), 2)
+        self.assertEqual([o.amount for o in tx.tx_outs], [965] * 3)
+
+    # a tree: the children spend the root's outputs, signed before any broadcast
+    @patch('transaction.broadcast_many', return_value=['t1', 't2', 't3'])
+    def test_tree(self, mock_broadcast, mock_create_interface, mock_get_full_tx, mock_read_file, mock_stdout):
+        mock_create_interface.return_value.get_utxo.return_value = UTXOS
+        make_command(count=5, max_outputs=3, broadcast=True).run()
+
+        signed, network = mock_broadcast.call_args.args
+        txs = [Tx.parse_hexstr(tx) for tx in signed]
+        self.assertEqual([len(tx.tx_outs) for tx in txs], [2, 3, 2])
+        for n, child in enumerate(txs[1:]):
+            self.assertEqual((child.tx_ins[0].prev_tx, child.tx_ins[0].prev_index), (txs[0].id(), n))
+            self.assertEqual({o.amount for o in child.tx_outs}, {534})
+        mock_get_full_tx.assert_called_once_with(PARENT_TXID, 'mock')
+        # what the workers print while building the children reaches our stdout
+        self.assertEqual(mock_stdout.getvalue().count('Amounts:'), 3)
+
+    # a tree cannot be written as unsigned param files
+    def test_tree_needs_sign(self, mock_create_interface, mock_get_full_tx, mock_read_file, mock_stdout):
+        with self.assertRaises(SystemExit):
+            make_command(count=5, max_outputs=3, sign=False).run()
+        self.assertIn('which needs -sign', mock_stdout.getvalue())
+        mock_create_interface.assert_not_called()
+
+    # the balance must pay for the fees and leave something in every output
+    def test_not_enough(self, mock_create_interface, mock_get_full_tx, mock_read_file, mock_stdout):
+        mock_create_interface.return_value.get_utxo.return_value = UTXOS
+        with self.assertRaises(SystemExit):
+            make_command(count=10000, max_outputs=10000).run()
+        self.assertIn('cannot make 10000 outputs', mock_stdout.getvalue())
+
+
+if __name__ == '__main__':
+    run_tests(TestSplitCommand)
@@ -0,0 +1,85 @@
+import os
+import statistics
+import subprocess
+import sys
+import time
+import unittest
+from io import StringIO
+from unittest.mock import patch
+
+sys.path.append('../')
+from transaction_command import TransactionCommand
+
+
+def run_tests(test_class):
+    suite = unittest.TestLoader().loadTestsFromTestCase(test_class)
+    runner = unittest.TextTestRunner(verbosity=2)
+    runner.run(suite)
+
+
+SRC = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+WIF = 'cVoVmd5zY69LEevwGa5iq1Ba3oBc6J8xxUqdKuJCtuFWUJJngPPP'
+
+# modules that only network / signing / index commands need
+NETWORK_MODULES = ['interfaces', 'rate_limiter', 'signing', 'utxo_index', 'sqlite3', 'transaction_command']
+
+
+# Helper function to run python code in a fresh interpreter from src/ and
+# return which of modules it ended up importing
+def imported_modules(code, modules):
+    check = f"{code}\nimport sys\nprint(','.join(m for m in {modules!r} if m in sys.modules))"
+    out = subprocess.run([sys.executable, '-c', check], cwd=SRC, capture_output=True, text=True, check=True)
+    last = out.stdout.strip().splitlines()[-1] if out.stdout.strip() else ''
+    return [m for m in last.split(',') if m]
+
+
+# -------------------------------------------------------------------
+# Startup benchmark: median wall time of './wbt.sh <command>' without docker.
+#   python test_startup.py --benchmark
+def benchmark(commands=None, repeat=7):
+    commands = commands or [['-h'], ['pkeyformat', '-h'], ['address', '-pkey', WIF], ['transaction', '-h']]
+    for argv in commands:
+        times = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            subprocess.run([sys.executable, 'main.py'] + argv, cwd=SRC, capture_output=True)
+            times.append(time.perf_counter() - start)
+        print(f"{statistics.median(times) * 1000:8.1f} ms  {' '.join(argv)[:60]}")
+
+
+class TestStartup(unittest.TestCase):
+
+    # ------------------------------------------------------------------------------------
+    # parsing the command line loads no command module and not tx_engine
+    def test_argument_handler_is_light(self):
+        modules = ['tx_engine', 'requests', 'key_command', 'address_command', 'pkeyformat_command'] + NETWORK_MODULES
+        self.assertEqual(imported_modules('import argument_handler', modules), [])
+
+    # offline commands do not load the network, signing or index modules
+    def test_offline_commands(self):
+        for argv in (['address', '-pkey', WIF], ['pkeyformat', '-h']):
+            code = f"from command_runner import run_command\nrun_command({argv!r})"
+            self.assertEqual(imported_modules(code, NETWORK_MODULES), [], argv)
+
+    # the transaction interface is created on first use
+    def test_transaction_interface_is_lazy(self):
+        cmd = TransactionCommand(paramfile='tx.toml', network='mock')
+        self.assertIsNone(cmd._interface)
+        self.assertIs(cmd.interface, cmd.interface)
+
+    # a numeric -fee_rate needs no interface: genparam with a placeholder
+    # input never creates one
+    @patch('sys.stdout', new_callable=StringIO)
+    @patch('transaction_command.create_interface')
+    def test_genparam_fee_rate_is_lazy(self, mock_create_interface, mock_stdout):
+        cmd = TransactionCommand(genparam=True, network='testnet', op_return_data='hello', op_return_only=True, fee_rate=1)
+        cmd.run()
+        mock_create_interface.assert_not_called()
+        self.assertIn('tx_fee_rate = 1', mock_stdout.getvalue())
+
+
+if __name__ == '__main__':
+    if '--benchmark' in sys.argv:
+        benchmark()
+    else:
+        run_tests(TestStartup)
@@ -1,10 +1,16 @@
+import os
 import sys
+import tempfile
 import unittest
-from unittest.mock import patch, mock_open
+from unittest.mock import patch, mock_open, MagicMock
 from io import StringIO
 
+import toml
+
 sys.path.append('../')
-from transaction_command import TransactionCommand
+from transaction_command import TransactionCommand, read_payouts
+from transaction import broadcast_tx, broadcast_many, build_chain
+from tx_engine import Tx
 
 
 def run_tests(test_class):
@@ -13,6 +19,14 @@ def run_tests(test_class):
     runner.run(suite)
 
 
+ALICE = 'mg7k4cWKZAH6dHFAk4GPjuWFvmFZBHKf7s'
+BOB = 'mpunbTFKMq2aNkqnyE55bHNPixFay2GVNS'
+# parent transaction with two outputs (1000 and 2100 sats) to ALICE
+PARENT_TXID = 'ba37f74000558e145f1e1789c642fb69d2384b39211f4943c46de016f791451e'
+PARENT_TX = '01000000015e0e47ce9c004147ca26a528edc09a2fd352e33bcb80b986685814580dba9840010000006b483045022100db2932276998523885af95f936f42c3465f15ec3449cf552b2e9f72a20a7cfa202200f530c5e6e4bd4bb1cee4f6faead4d33a5f7f3f37a9224889e93206517f609ce412103b4fb064ab28ec2daa9b162c6c4bcaf3cbacf5aa29e094c36fd9e302a9583f0eaffffffff02e8030000000000001976a9140694591e4bf16f2b2b64989192778e772d21f5d788ac34080000000000001976a9140694591e4bf16f2b2b64989192778e772d21f5d788ac00000000'
+ALICE_KEY = {'key_info': {'private_key': 'cVoVmd5zY69LEevwGa5iq1Ba3oBc6J8xxUqdKuJCtuFWUJJngPPP', 'bitcoin_address': ALICE}}
+
+
 class TestTransactionCommand(unittest.TestCase):
 
     def setUp(self):
@@ -225,6 +239,65 @@ tx_default_fee = 300
         # # Check if the expected output is in the printed output
         self.assertIn(expected_output, output)
 
+    # ------------------------------------------------------------------------------------
+    # Test genparam downloads parents concurrently: each distinct parent once,
+    # and the inputs keep the UTXO order
+    @patch.dict('os.environ', {'WBT_FETCH_WORKERS': '4'})
+    @patch('sys.stdout', new_callable=StringIO)
+    def test_genparam_concurrent_parent_fetch(self, mock_stdout):
+        cmd = TransactionCommand(
+            genparam=True,
+            network='mock',
+            fee=300,
+            amount=2500,
+            sender='mg7k4cWKZAH6dHFAk4GPjuWFvmFZBHKf7s'
+        )
+        cmd.interface.balance = {'confirmed': 3000, 'unconfirmed': 0}
+        cmd.interface.utxo = {'mg7k4cWKZAH6dHFAk4GPjuWFvmFZBHKf7s': [
+            {'height': 1, 'tx_pos': 0, 'tx_hash': 'aa' * 32, 'value': 1000},
+            {'height': 1, 'tx_pos': 0, 'tx_hash': 'bb' * 32, 'value': 1000},
+            {'height': 1, 'tx_pos': 1, 'tx_hash': 'aa' * 32, 'value': 1000},
+        ]}
+        cmd.interface.transactions = {'aa' * 32: 'parent_a', 'bb' * 32: 'parent_b'}
+
+        fetched = []
+        get_raw_transaction = cmd.interface.get_raw_transaction
+
+        def counting_fetch(txid):
+            fetched.append(txid)
+            return get_raw_transaction(txid)
+
+        cmd.interface.get_raw_transaction = counting_fetch
+        data_dict: dict = {}
+        cmd.find_inputs(data_dict)
+
+        self.assertEqual(sorted(fetched), ['aa' * 32, 'bb' * 32])
+        self.assertEqual(
+            [(i['tx_hash'], i['tx_pos'], i['input_tx_hash']) for i in data_dict['transactioninput']],
+            [('aa' * 32, 0, 'parent_a'), ('bb' * 32, 0, 'parent_b'), ('aa' * 32, 1, 'parent_a')])
+
+    # ------------------------------------------------------------------------------------
+    # Test genparam takes the balance from the utxo list: no get_balance call
+    @patch('sys.stdout', new_callable=StringIO)
+    def test_genparam_balance_from_utxos(self, mock_stdout):
+        cmd = TransactionCommand(
+            genparam=True,
+            network='mock',
+            fee=300,
+            amount=1000,
+            sender='mg7k4cWKZAH6dHFAk4GPjuWFvmFZBHKf7s'
+        )
+        cmd.interface.get_balance = MagicMock()
+        cmd.interface.utxo = {'mg7k4cWKZAH6dHFAk4GPjuWFvmFZBHKf7s': [
+            {'height': 1, 'tx_pos': 0, 'tx_hash': 'aa' * 32, 'value': 800},
+            {'height': 0, 'tx_pos': 0, 'tx_hash': 'bb' * 32, 'value': 400},
+        ]}
+
+        with self.assertRaises(SystemExit):
+            cmd.find_inputs({})
+        self.assertIn('Error: sender balance: 1200 is less than amount + fee: 1300', mock_stdout.getvalue())
+        cmd.interface.get_balance.assert_not_called()
+
     # ------------------------------------------------------------------------------------
     # Test genparam with amount flag and sender_key flag
     # bbt transaction -genparam --amount 1000 -sender_key alice.key
@@ -698,3 +771,172 @@ tx_default_fee = 300
 
         # Check if the expected error message is in the printed output
         self.assertIn(expected_error_message, output)
+
+    # ------------------------------------------------------------------------------------
+    # a broadcast that gets no response (connection failure) is reported, not recorded
+    @patch('sys.stdout', new_callable=StringIO)
+    @patch('transaction.record_broadcast')
+    @patch('transaction.create_interface')
+    @patch('transaction.read_toml_file', return_value={'interface': {'interface_type': 'woc', 'network_type': 'testnet'}})
+    def test_broadcast_tx_no_response(self, mock_read_file, mock_create_interface, mock_record, mock_stdout):
+        mock_create_interface.return_value.broadcast_tx.return_value = None
+        with self.assertRaises(ConnectionError):
+            broadcast_tx('tx_1', 'spend.toml')
+        mock_record.assert_not_called()
+        self.assertIn('Error -> no response', mock_stdout.getvalue())
+
+    # ------------------------------------------------------------------------------------
+    # broadcast_many: one broadcast_tx per transaction when the interface
+    # cannot batch; only accepted transactions are recorded
+    @patch('sys.stdout', new_callable=StringIO)
+    @patch('transaction.record_broadcast')
+    @patch('transaction.create_interface')
+    def test_broadcast_many_without_batching(self, mock_create_interface, mock_record, mock_stdout):
+        interface = MagicMock(spec=['broadcast_tx'])
+        interface.broadcast_tx.side_effect = [MagicMock(status_code=200, content='txid_1'),
+                                              MagicMock(status_code=400, content='bad-txns')]
+        mock_create_interface.return_value = interface
+
+        self.assertEqual(broadcast_many(['tx_1', 'tx_2'], 'testnet'), ['txid_1', None])
+        mock_record.assert_called_once_with('testnet', 'tx_1')
+        self.assertIn('Error -> transaction 2/2: bad-txns', mock_stdout.getvalue())
+
+    # a chain stops at its first rejected transaction: the rest spend it
+    @patch('sys.stdout', new_callable=StringIO)
+    @patch('transaction.record_broadcast')
+    @patch('transaction.create_interface')
+    def test_broadcast_many_stop_on_error(self, mock_create_interface, mock_record, mock_stdout):
+        interface = MagicMock(spec=['broadcast_tx'])
+        interface.broadcast_tx.side_effect = [MagicMock(status_code=200, content='txid_1'),
+                                              MagicMock(status_code=400, content='bad-txns'),
+                                              MagicMock(status_code=200, content='txid_3')]
+        mock_create_interface.return_value = interface
+
+        self.assertEqual(broadcast_many(['tx_1', 'tx_2', 'tx_3', 'tx_4'], 'testnet', stop_on_error=True), ['txid_1', None, None, None])
+        self.assertEqual(interface.broadcast_tx.call_count, 2)
+        self.assertIn('Skipped transactions 3 to 4 of 4', mock_stdout.getvalue())
+        mock_record.assert_called_once_with('testnet', 'tx_1')
+
+    # ------------------------------------------------------------------------------------
+    # -recipients: rows of 'address,amount', with an optional header and comments
+    def test_read_payouts(self):
+        with tempfile.TemporaryDirectory() as tmp, patch('transaction_command.path', tmp):
+            with open(os.path.join(tmp, 'payouts.csv'), 'w') as file:
+                file.write(f'address,amount\n# first batch\n{ALICE}, 1000\n\n{BOB},2000\n')
+            self.assertEqual(list(read_payouts('payouts.csv')), [(ALICE, 1000), (BOB, 2000)])
+
+            with open(os.path.join(tmp, 'bad.csv'), 'w') as file:
+                file.write(f'{ALICE},1000\n{BOB},-5\n')
+            with self.assertRaisesRegex(ValueError, 'bad.csv line 2: invalid payout'):
+                list(read_payouts('bad.csv'))
+
+    # payouts are packed into transactions with disjoint inputs from one
+    # utxo snapshot; every parent is downloaded once
+    @patch('sys.stdout', new_callable=StringIO)
+    def test_genparam_recipients(self, mock_stdout):
+        with tempfile.TemporaryDirectory() as tmp, patch('transaction_command.path', tmp), patch('useful.path', tmp):
+            with open(os.path.join(tmp, 'payouts.csv'), 'w') as file:
+                file.write(''.join(f'{BOB},{1000 * (i + 1)}\n' for i in range(5)))
+
+            cmd = TransactionCommand(genparam=True, network='mock', sender=ALICE, recipients='payouts.csv',
+                                     max_outputs=2, out='payout.toml', coin_selection='largest_first')
+            cmd.interface.utxo = {ALICE: [{'height': 1, 'tx_pos': i, 'tx_hash': 'aa' * 32, 'value': 4000} for i in range(5)]}
+            cmd.interface.transactions = {'aa' * 32: 'parent_a'}
+            cmd.interface.get_raw_transaction = MagicMock(side_effect=cmd.interface.transactions.get)
+            cmd.run()
+
+            cmd.interface.get_raw_transaction.assert_called_once_with('aa' * 32)
+            params = [toml.load(os.path.join(tmp, f'payout_00{i}.toml')) for i in (1, 2, 3)]
+            self.assertEqual([[o['amount'] for o in p['transactionoutput']] for p in params], [[1000, 2000], [3000, 4000], [5000]])
+            spent = [(i['tx_hash'], i['tx_pos']) for p in params for i in p['transactioninput']]
+            self.assertEqual(len(spent), len(set(spent)))
+            for p in params:
+                paid = sum(o['amount'] for o in p['transactionoutput']) + p['tx_info']['tx_default_fee']
+                self.assertGreaterEqual(sum(i['amount'] for i in p['transactioninput']), paid)
+                self.assertEqual(p['tx_info']['change_output_public_key'], ALICE)
+
+            # not enough left for the last payout
+            cmd.interface.utxo[ALICE].pop()
+            cmd.fee_rate = None
+            with self.assertRaises(SystemExit) as cm:
+                cmd.run()
+            self.assertEqual(cm.exception.code, 1)
+            self.assertIn('cannot pay 5 payouts worth 15000', mock_stdout.getvalue())
+
+    # payouts are read as the transactions are packed, and a payout that
+    # needs more inputs than fit in -max_bytes is an error
+    def test_pack_payouts_streams(self):
+        cmd = TransactionCommand(genparam=True, network='mock', max_outputs=2, fee_rate=0.5)
+        utxos = [{'height': 1, 'tx_pos': i, 'tx_hash': 'aa' * 32, 'value': 4000} for i in range(5)]
+        read = []
+
+        def payouts():
+            for i in range(5):
+                read.append(i)
+                yield BOB, 1000
+
+        packed = cmd.pack_payouts(payouts(), utxos)
+        self.assertEqual(len(next(packed)[1]), 2)
+        self.assertEqual(len(read), 2)
+        self.assertEqual([len(outputs) for _, outputs, _ in packed], [2, 1])
+
+        cmd.max_bytes = 300
+        with self.assertRaisesRegex(ValueError, 'needs 3 inputs, .* over -max_bytes 300'):
+            list(cmd.pack_payouts([(BOB, 9000)], utxos))
+
+    # ------------------------------------------------------------------------------------
+    # -chain: one transaction per payment, each spending the change of the
+    # one before, built without the network and broadcast in order
+    @patch('sys.stdout', new_callable=StringIO)
+    @patch('useful.read_toml_file', return_value=ALICE_KEY)
+    @patch('transaction.broadcast_many', return_value=['t1', 't2', 't3'])
+    def test_chain(self, mock_broadcast, mock_read_file, mock_stdout):
+        with tempfile.TemporaryDirectory() as tmp, patch('transaction_command.path', tmp):
+            with open(os.path.join(tmp, 'payments.csv'), 'w') as file:
+                file.write(f'{BOB},300\n{BOB},400\n{BOB},500\n')
+
+            cmd = TransactionCommand(network='mock', sender_key='alice.key', chain='payments.csv')
+            cmd.interface.utxo = {ALICE: [{'height': 1, 'tx_pos': 1, 'tx_hash': PARENT_TXID, 'value': 2100}]}
+            cmd.interface.get_raw_transaction = MagicMock(return_value=PARENT_TX)
+            cmd.run()
+
+            cmd.interface.get_raw_transaction.assert_called_once_with(PARENT_TXID)
+            chain, network = mock_broadcast.call_args.args
+            self.assertEqual(mock_broadcast.call_args.kwargs, {'stop_on_error': True})
+            txs = [Tx.parse_hexstr(tx) for tx in chain]
+            self.assertEqual([tx.tx_outs[0].amount for tx in txs], [300, 400, 500])
+            self.assertEqual((txs[0].tx_ins[0].prev_tx, txs[0].tx_ins[0].prev_index), (PARENT_TXID, 1))
+            for parent, child in zip(txs, txs[1:]):
+                self.assertEqual((child.tx_ins[0].prev_tx, child.tx_ins[0].prev_index), (parent.id(), 1))
+                self.assertGreater(parent.tx_outs[1].amount, child.tx_outs[1].amount)
+
+            # the change runs out before the last payment
+            with open(os.path.join(tmp, 'payments.csv'), 'w') as file:
+                file.write(f'{BOB},1000\n{BOB},1100\n')
+            with self.assertRaises(SystemExit):
+                cmd.run()
+            self.assertIn('cannot pay 2 chained payments worth 2100', mock_stdout.getvalue())
+
+    # no change left after a step ends the chain
+    @patch('sys.stdout', new_callable=StringIO)
+    def test_build_chain_runs_out(self, mock_stdout):
+        inputs = [{'tx_hash': PARENT_TXID, 'tx_pos': 0, 'amount': 1000, 'input_tx_hash': PARENT_TX,
+                   'private_key_for_signing': ALICE_KEY['key_info']['private_key']}]
+        steps = [[{'public_key': BOB, 'amount': amount, 'op_return': False, 'data_to_encode': ''}] for amount in (887, 100)]
+        tx_info = {'create_change_output': True, 'change_output_public_key': ALICE, 'tx_default_fee': 113, 'tx_fee_rate': 0.5}
+        with self.assertRaisesRegex(ValueError, 'No change left to fund transaction 2 of 2'):
+            build_chain(inputs, steps, tx_info)
+
+    # change at or below the dust limit still funds a small trailing payment
+    @patch('sys.stdout', new_callable=StringIO)
+    def test_build_chain_small_change(self, mock_stdout):
+        inputs = [{'tx_hash': PARENT_TXID, 'tx_pos': 1, 'amount': 2100, 'input_tx_hash': PARENT_TX,
+                   'private_key_for_signing': ALICE_KEY['key_info']['private_key']}]
+        steps = [[{'public_key': BOB, 'amount': amount, 'op_return': False, 'data_to_encode': ''}] for amount in (1824, 50)]
+        tx_info = {'create_change_output': True, 'change_output_public_key': ALICE, 'tx_default_fee': 113, 'tx_fee_rate': 0.5}
+        txs = [Tx.parse_hexstr(tx) for tx in build_chain(inputs, steps, tx_info)]
+        self.assertEqual([len(tx.tx_outs) for tx in txs], [2, 1])
+        self.assertEqual((txs[1].tx_ins[0].prev_tx, txs[1].tx_ins[0].prev_index), (txs[0].id(), 1))
+        self.assertLessEqual(txs[0].tx_outs[1].amount, 300)
+        self.assertGreaterEqual(2100 - 1824 - txs[0].tx_outs[1].amount, len(txs[0].serialize()) // 2)
+        self.assertGreaterEqual(txs[0].tx_outs[1].amount - 50, len(txs[1].serialize()) // 2)
@@ -0,0 +1,128 @@
+import os
+import sys
+import tempfile
+import unittest
+from unittest.mock import patch
+from io import StringIO
+
+sys.path.append('../')
+import tx_cache
+from tx_cache import RawTxCache, txid_of, cached_raw_transaction, cached_raw_transactions
+
+
+def run_tests(test_class):
+    suite = unittest.TestLoader().loadTestsFromTestCase(test_class)
+    runner = unittest.TextTestRunner(verbosity=2)
+    runner.run(suite)
+
+
+# a real testnet transaction and its txid
+RAW_TX = "01000000015e0e47ce9c004147ca26a528edc09a2fd352e33bcb80b986685814580dba9840010000006b483045022100db2932276998523885af95f936f42c3465f15ec3449cf552b2e9f72a20a7cfa202200f530c5e6e4bd4bb1cee4f6faead4d33a5f7f3f37a9224889e93206517f609ce412103b4fb064ab28ec2daa9b162c6c4bcaf3cbacf5aa29e094c36fd9e302a9583f0eaffffffff02e8030000000000001976a9140694591e4bf16f2b2b64989192778e772d21f5d788ac34080000000000001976a9140694591e4bf16f2b2b64989192778e772d21f5d788ac00000000"
+TXID = "ba37f74000558e145f1e1789c642fb69d2384b39211f4943c46de016f791451e"
+
+
+class TestRawTxCache(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.cache = RawTxCache(os.path.join(self.tmp.name, 'testnet'))
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    # ------------------------------------------------------------------------------------
+    # the txid is the reversed double-SHA256 of the raw tx
+    def test_txid_of(self):
+        self.assertEqual(txid_of(RAW_TX), TXID)
+
+    # ------------------------------------------------------------------------------------
+    def test_put_then_get(self):
+        self.assertIsNone(self.cache.get(TXID))
+        self.assertTrue(self.cache.put(TXID, RAW_TX))
+        self.assertEqual(self.cache.get(TXID), RAW_TX)
+        # stored as raw bytes, half the size of the hex
+        self.assertEqual(self.cache.total_bytes, len(RAW_TX) // 2)
+
+    # content that does not hash to the txid is never stored
+    def test_put_rejects_mismatched_content(self):
+        self.assertFalse(self.cache.put(TXID, 'deadbeef'))
+        self.assertFalse(self.cache.put(TXID, None))
+        self.assertFalse(self.cache.put(TXID, 'not hex'))
+        self.assertIsNone(self.cache.get(TXID))
+
+    # a corrupted file is treated as a miss and removed
+    def test_get_drops_corrupt_entry(self):
+        self.cache.put(TXID, RAW_TX)
+        the_file = os.path.join(self.cache.directory, f'{TXID}.tx')
+        with open(the_file, 'wb') as file:
+            file.write(b'\x00\x01')
+        self.assertIsNone(self.cache.get(TXID))
+        self.assertFalse(os.path.exists(the_file))
+
+    # ------------------------------------------------------------------------------------
+    # the least recently used entries go first when the cap is exceeded
+    def test_lru_eviction(self):
+        size = len(RAW_TX) // 2
+        cache = RawTxCache(os.path.join(self.tmp.name, 'small'), max_bytes=size * 3 - 1)
+
+        # three distinct entries: vary the locktime of the same transaction
+        raws = [RAW_TX[:-8] + f'{n:08x}' for n in range(3)]
+        txids = [txid_of(raw) for raw in raws]
+
+        cache.put(txids[0], raws[0])
+        cache.put(txids[1], raws[1])
+        os.utime(os.path.join(cache.directory, f'{txids[0]}.tx'), ns=(1, 1))
+        os.utime(os.path.join(cache.directory, f'{txids[1]}.tx'), ns=(2, 2))
+        # touch entry 0 so entry 1 is now the least recently used
+        self.assertEqual(cache.get(txids[0]), raws[0])
+
+        cache.put(txids[2], raws[2])
+        self.assertEqual(cache.total_bytes, size * 2)
+        self.assertIsNone(cache.get(txids[1]))
+        self.assertEqual(cache.get(txids[0]), raws[0])
+        self.assertEqual(cache.get(txids[2]), raws[2])
+
+    # ------------------------------------------------------------------------------------
+    # a cache hit does not touch the network
+    def test_cached_raw_transaction(self):
+        calls = []
+
+        def fetch(txid):
+            calls.append(txid)
+            return RAW_TX
+
+        with patch.object(tx_cache, 'get_tx_cache', return_value=self.cache):
+            self.assertEqual(cached_raw_transaction(TXID, 'testnet', fetch), RAW_TX)
+            self.assertEqual(cached_raw_transaction(TXID, 'testnet', fetch), RAW_TX)
+        self.assertEqual(calls, [TXID])
+
+    # only the txids missing from the cache go to fetch_many, in one call
+    def test_cached_raw_transactions(self):
+        calls = []
+
+        def fetch_many(txids):
+            calls.append(txids)
+            return {TXID: RAW_TX}
+
+        missing = 'ff' * 32
+        with patch.object(tx_cache, 'get_tx_cache', return_value=self.cache):
+            self.assertEqual(cached_raw_transactions([TXID, missing, TXID], 'testnet', fetch_many), {TXID: RAW_TX, missing: None})
+            self.assertEqual(cached_raw_transactions([TXID], 'testnet', fetch_many), {TXID: RAW_TX})
+        self.assertEqual(calls, [[TXID, missing]])
+
+    # the mock network is never cached
+    def test_mock_network_not_cached(self):
+        self.assertIsNone(tx_cache.get_tx_cache('mock'))
+
+    # a malformed WBT_TX_CACHE_MAX_BYTES warns and keeps the default size
+    @patch('sys.stdout', new_callable=StringIO)
+    def test_bad_max_bytes(self, mock_stdout):
+        with patch.object(tx_cache, 'path', self.tmp.name), patch.dict(os.environ, {'WBT_TX_CACHE_MAX_BYTES': '256M'}):
+            cache = tx_cache._open_cache('testnet')
+        assert cache is not None
+        self.assertEqual(cache.max_bytes, tx_cache.DEFAULT_MAX_BYTES)
+        self.assertIn('Warning: WBT_TX_CACHE_MAX_BYTES', mock_stdout.getvalue())
+
+
+if __name__ == '__main__':
+    run_tests(TestRawTxCache)
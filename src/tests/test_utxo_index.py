@@ -0,0 +1,117 @@
+import os
+import sys
+import tempfile
+import time
+import unittest
+from unittest.mock import patch, MagicMock
+from io import StringIO
+
+sys.path.append('../')
+from utxo_index import UtxoIndex, SPENT_GRACE, address_utxos, cached_balance
+from balance_command import BalanceCommand
+
+
+def run_tests(test_class):
+    suite = unittest.TestLoader().loadTestsFromTestCase(test_class)
+    runner = unittest.TextTestRunner(verbosity=2)
+    runner.run(suite)
+
+
+ADDRESS = 'mg7k4cWKZAH6dHFAk4GPjuWFvmFZBHKf7s'
+# spends 4098ba0d...0e5e:1 and pays 1000 and 2100 sats back to ADDRESS
+RAW_TX = "01000000015e0e47ce9c004147ca26a528edc09a2fd352e33bcb80b986685814580dba9840010000006b483045022100db2932276998523885af95f936f42c3465f15ec3449cf552b2e9f72a20a7cfa202200f530c5e6e4bd4bb1cee4f6faead4d33a5f7f3f37a9224889e93206517f609ce412103b4fb064ab28ec2daa9b162c6c4bcaf3cbacf5aa29e094c36fd9e302a9583f0eaffffffff02e8030000000000001976a9140694591e4bf16f2b2b64989192778e772d21f5d788ac34080000000000001976a9140694591e4bf16f2b2b64989192778e772d21f5d788ac00000000"
+TXID = "ba37f74000558e145f1e1789c642fb69d2384b39211f4943c46de016f791451e"
+SPENT_TXID = "4098ba0d5814586886b980cb3be352d32f9ac0ed28a526ca4741009cce470e5e"
+
+
+def utxo(txid, pos, value, height):
+    return {'height': height, 'tx_pos': pos, 'tx_hash': txid, 'value': value}
+
+
+class TestUtxoIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.index = UtxoIndex(os.path.join(self.tmp.name, 'testnet.db'))
+
+    def tearDown(self):
+        self.index.close()
+        self.tmp.cleanup()
+
+    # ------------------------------------------------------------------------------------
+    # the first sync stores everything, later syncs only apply the difference
+    def test_incremental_sync(self):
+        self.assertFalse(self.index.is_synced(ADDRESS))
+        first = [utxo('aa' * 32, 0, 500, 100), utxo('bb' * 32, 1, 700, 0)]
+        self.assertEqual(self.index.sync(ADDRESS, first), {'written': 2, 'deleted': 0})
+        self.assertEqual(self.index.synced_height(ADDRESS), 100)
+
+        # aa:0 spent elsewhere, bb:1 mined, cc:0 new
+        second = [utxo('bb' * 32, 1, 700, 105), utxo('cc' * 32, 0, 900, 106)]
+        self.assertEqual(self.index.sync(ADDRESS, second), {'written': 2, 'deleted': 1})
+        self.assertEqual(self.index.unspent(ADDRESS), second)
+        self.assertEqual(self.index.synced_height(ADDRESS), 106)
+
+        # nothing changed, nothing written
+        self.assertEqual(self.index.sync(ADDRESS, second), {'written': 0, 'deleted': 0})
+
+    # ------------------------------------------------------------------------------------
+    # confirmed / unconfirmed totals match the get_balance shape
+    def test_balance(self):
+        self.index.sync(ADDRESS, [utxo('aa' * 32, 0, 500, 100), utxo('bb' * 32, 1, 700, 0)])
+        self.assertEqual(self.index.balance(ADDRESS), {'confirmed': 500, 'unconfirmed': 700})
+
+    # ------------------------------------------------------------------------------------
+    # our own broadcast marks its inputs spent and records the change
+    def test_record_broadcast(self):
+        self.index.sync(ADDRESS, [utxo(SPENT_TXID, 1, 3400, 100), utxo('aa' * 32, 0, 500, 100)])
+        self.index.record_broadcast(RAW_TX)
+
+        self.assertEqual(self.index.unspent(ADDRESS), [
+            utxo(TXID, 0, 1000, 0),
+            utxo(TXID, 1, 2100, 0),
+            utxo('aa' * 32, 0, 500, 100)
+        ])
+
+        # a network that has not seen the spend yet does not resurrect the input
+        self.index.sync(ADDRESS, [utxo(SPENT_TXID, 1, 3400, 100), utxo('aa' * 32, 0, 500, 100)])
+        self.assertNotIn(SPENT_TXID, [u['tx_hash'] for u in self.index.unspent(ADDRESS)])
+
+        # unless it still has not after SPENT_GRACE: the broadcast was dropped
+        with patch('utxo_index.time.time', return_value=time.time() + SPENT_GRACE + 1):
+            self.index.sync(ADDRESS, [utxo(SPENT_TXID, 1, 3400, 100), utxo('aa' * 32, 0, 500, 100)])
+        self.assertEqual(self.index.unspent(ADDRESS), [utxo(SPENT_TXID, 1, 3400, 100), utxo('aa' * 32, 0, 500, 100)])
+
+    # ------------------------------------------------------------------------------------
+    # online reads sync the index, cached reads never touch the interface
+    def test_address_utxos(self):
+        interface = MagicMock()
+        interface.get_utxo.return_value = [utxo('aa' * 32, 0, 500, 100)]
+        with patch('utxo_index.get_utxo_index', return_value=self.index):
+            self.assertIsNone(address_utxos(ADDRESS, 'testnet', interface, cached=True))
+            self.assertIsNone(cached_balance(ADDRESS, 'testnet'))
+
+            self.assertEqual(address_utxos(ADDRESS, 'testnet', interface), interface.get_utxo.return_value)
+            interface.get_utxo.reset_mock()
+
+            self.assertEqual(address_utxos(ADDRESS, 'testnet', interface, cached=True), [utxo('aa' * 32, 0, 500, 100)])
+            self.assertEqual(cached_balance(ADDRESS, 'testnet'), {'confirmed': 500, 'unconfirmed': 0})
+            interface.get_utxo.assert_not_called()
+
+    # ------------------------------------------------------------------------------------
+    # balance --cached reads the index, and says so when the address is unknown
+    @patch('balance_command.create_interface')
+    def test_balance_command_cached(self, mock_create_interface):
+        bb = BalanceCommand(address=ADDRESS, network='testnet', cached=True)
+        with patch('utxo_index.get_utxo_index', return_value=self.index):
+            with patch('sys.stdout', new=StringIO()) as fake_out:
+                self.assertIsNone(bb.get_balance())
+                self.assertIn('run once without --cached first', fake_out.getvalue())
+
+            self.index.sync(ADDRESS, [utxo('aa' * 32, 0, 500, 100)])
+            self.assertEqual(bb.get_balance(), {'confirmed': 500, 'unconfirmed': 0})
+        mock_create_interface.assert_not_called()
+
+
+if __name__ == '__main__':
+    run_tests(TestUtxoIndex)
@@ -1,28 +1,33 @@
 # from tx_engine.tx.bsv_factory import bsv_factory
 from tx_engine import Tx, TxIn, TxOut, p2pkh_script, Script, address_to_public_key_hash
-from tx_engine import Wallet, interface_factory
+from signing import sign_inputs
 
-from useful import read_toml_file, print_amounts, build_interface_config, path
+from useful import read_toml_file, print_amounts, path
+from interfaces import create_interface, network_from_interface
+from utxo_index import record_broadcast
+from fee import CHANGE_DUST_LIMIT, P2PKH_OUTPUT_SIZE, fee_for_size, predict_signed_size, varint_size
 from pathlib import Path
+import contextlib
+import io
 import os
+from typing import Any, Dict, List, MutableMapping, Tuple
 
 # -------------------------------------------------------------------
 # -------------------------------------------------------------------
 
 
 # Build the transaction from the toml file
-def build_tx(filename: str) -> str:
+def build_tx(filename: str, sign_workers: int = 1) -> str:
+    return build_tx_from_config(read_toml_file(filename), sign_workers)
 
-    config = read_toml_file(filename)
+
+# -------------------------------------------------------------------
+# Build the transaction outputs from the [[transactionoutput]] entries
+# return the outputs and the total amount they pay
+def build_outputs(outputs: List[Dict[str, Any]]) -> Tuple[List[TxOut], int]:
     vouts = []
-    vins = []
     amt_total_out: int = 0
-
-    # Validate that 'transactionoutput' key exists
-    if "transactionoutput" not in config:
-        raise KeyError("transactionoutput")
-
-    for outs in config["transactionoutput"]:
+    for outs in outputs:
         if not outs["op_return"]:
             payment_addr: str = outs["public_key"]
             amt: int = outs["amount"]
@@ -48,6 +53,44 @@ def build_tx(filename: str) -> str:
                 op_return_script = Script.parse_string(f'OP_FALSE OP_RETURN 0x{data_val}')
                 locking_script = p2pkh_script(address_to_public_key_hash(payment_addr)) + op_return_script
                 vouts.append(TxOut(amount=amt, script_pubkey=locking_script))
+                amt_total_out += amt
+    return vouts, amt_total_out
+
+
+# -------------------------------------------------------------------
+# Fee for tx_fee_rate sat/byte of the predicted signed size, and whether
+# the transaction has a change output. It has one when there is change left
+# above dust_limit after paying for the bytes of the change output too;
+# otherwise the change goes to the fee.
+def size_based_fee(vins: List[TxIn], vouts: List[TxOut], available: int, tx_info: MutableMapping[str, Any],
+                   dust_limit: int = CHANGE_DUST_LIMIT) -> Tuple[int, bool]:
+    fee_rate: float = tx_info["tx_fee_rate"]
+    size = predict_signed_size(Tx(version=1, tx_ins=vins, tx_outs=vouts, locktime=0))
+    has_change = False
+    if tx_info["create_change_output"]:
+        with_change = size + P2PKH_OUTPUT_SIZE + varint_size(len(vouts) + 1) - varint_size(len(vouts))
+        if available - fee_for_size(with_change, fee_rate) > dust_limit:
+            size = with_change
+            has_change = True
+
+    fee = fee_for_size(size, fee_rate)
+    if available < fee:
+        raise ValueError(f"The inputs do not cover the outputs plus a fee of {fee} ({size} bytes at {fee_rate} sat/byte).")
+    return fee, has_change
+
+
+# -------------------------------------------------------------------
+# Build the transaction from an already loaded parameter dictionary;
+# keep_change keeps any change above zero (for a change output that is
+# spent next) instead of giving change at or below the dust limit to the fee
+def build_tx_from_config(config: MutableMapping[str, Any], sign_workers: int = 1, keep_change: bool = False) -> str:
+    vins = []
+
+    # Validate that 'transactionoutput' key exists
+    if "transactionoutput" not in config:
+        raise KeyError("transactionoutput")
+
+    vouts, amt_total_out = build_outputs(config["transactionoutput"])
 
     # Validate that 'transactionoutput' key exists
     if "transactioninput" not in config:
@@ -59,6 +102,10 @@ def build_tx(filename: str) -> str:
 
     ret_amt: int = 0
     fee: int = config["tx_info"]["tx_default_fee"]
+    dust_limit = 0 if keep_change else CHANGE_DUST_LIMIT
+    has_change = amt_total_in - amt_total_out - fee > dust_limit
+    if "tx_fee_rate" in config["tx_info"]:
+        fee, has_change = size_based_fee(vins, vouts, amt_total_in - amt_total_out, config["tx_info"], dust_limit)
     # determine any change to be paid
     if config["tx_info"]["create_change_output"]:
         if amt_total_in > amt_total_out + fee:
@@ -70,7 +117,7 @@ def build_tx(filename: str) -> str:
                 raise ValueError("Invalid change_output_public_key: <sender address> is not a real address.")
             amt_to_pay: int = amt_total_out + fee
             ret_amt = amt_total_in - amt_to_pay
-            if ret_amt > 300:
+            if has_change:
                 locking_script = p2pkh_script(address_to_public_key_hash(change_addr))
                 vouts.append(TxOut(amount=ret_amt, script_pubkey=locking_script))
     print_amounts(amt_total_out, amt_total_in, fee, ret_amt)
@@ -80,15 +127,60 @@ def build_tx(filename: str) -> str:
             tx_outs=vouts,
             locktime=0)
 
-    for i in range(len(tx.tx_ins)):
-        wif_key: str = config["transactioninput"][i]["private_key_for_signing"]
-        input_tx_hash: str = config["transactioninput"][i]["input_tx_hash"]
-        assert (input_tx_hash is not None)
-        input_tx = Tx.parse_hexstr(input_tx_hash)
-        bitcoin_priv_key: Wallet = Wallet(wif_key)
-        tx = bitcoin_priv_key.sign_tx(i, input_tx, tx)
+    # sign every input (cached parents and keys; one pass over shared
+    # sighash parts for large transactions, across sign_workers processes)
+    parents: List[str] = []
+    wifs: List[str] = []
+    for ins in config["transactioninput"]:
+        assert (ins["input_tx_hash"] is not None)
+        parents.append(ins["input_tx_hash"])
+        wifs.append(ins["private_key_for_signing"])
+
+    return sign_inputs(tx, parents, wifs, sign_workers)
+
+
+# -------------------------------------------------------------------
+# Build the transaction in a worker process; returns it with what building
+# printed, for the parent to print (a worker's stdout is not the parent's,
+# e.g. when serve captures the output of a command)
+def build_tx_in_worker(config: MutableMapping[str, Any]) -> Tuple[str, str]:
+    output = io.StringIO()
+    with contextlib.redirect_stdout(output):
+        tx_hex = build_tx_from_config(config)
+    return tx_hex, output.getvalue()
+
+
+# -------------------------------------------------------------------
+# Build and sign a chain of transactions offline: the first spends inputs,
+# each later one spends the change output of the one before, with that
+# parent taken from memory instead of the network. steps holds the
+# [[transactionoutput]] entries of each transaction; tx_info (which must
+# create a change output back to the signing key) applies to all of them.
+# Every step but the last keeps its change, however small, for the next.
+# Returns the signed transactions in order; raises ValueError when the
+# change runs out before the last step.
+def build_chain(inputs: List[Dict[str, Any]], steps: List[List[Dict[str, Any]]], tx_info: Dict[str, Any], sign_workers: int = 1) -> List[str]:
+    chain: List[str] = []
+    wif = inputs[0]['private_key_for_signing'] if inputs else None
+    for n, outputs in enumerate(steps):
+        if not inputs:
+            raise ValueError(f"No change left to fund transaction {n + 1} of {len(steps)}.")
+        tx_hex = build_tx_from_config({'transactioninput': inputs, 'transactionoutput': outputs, 'tx_info': tx_info},
+                                      sign_workers, keep_change=n < len(steps) - 1)
+        chain.append(tx_hex)
 
-    return tx.serialize().hex()
+        tx = Tx.parse_hexstr(tx_hex)
+        change_pos = len(outputs)
+        inputs = []
+        if len(tx.tx_outs) > change_pos:
+            inputs = [{
+                'tx_hash': tx.id(),
+                'tx_pos': change_pos,
+                'amount': tx.tx_outs[change_pos].amount,
+                'input_tx_hash': tx_hex,
+                'private_key_for_signing': wif
+            }]
+    return chain
 
 
 # -------------------------------------------------------------------
@@ -97,20 +189,68 @@ def broadcast_tx(tx_hex: str, filename: str) -> str:
     params = read_toml_file(filename)
     iface = params['interface']
     # The param file stores only non-secret routing (interface_type +
-    # network_type). For the local RPC node, rebuild the full config so
+    # network_type). Rebuild the full config from the network so RPC
     # credentials are injected from the environment rather than the file.
-    if iface.get('interface_type') == 'rpc':
-        config = build_interface_config('regtest')
-    else:
-        config = iface
-
-    bsv_client = interface_factory.set_config(config)
+    network = network_from_interface(iface)
+    bsv_client = create_interface(network)
 
     # send it
     response = bsv_client.broadcast_tx(tx_hex)
+    if response is None:
+        print('Error -> no response from the network')
+        raise ConnectionError(f"Failed to broadcast the transaction on {network}: no response")
     if response.status_code != 200:
         print(f'Error -> {response.content}')
         raise ValueError(response.content)
     else:
         print(f'{response.content}')
+        # mark the spent utxos (and add our change) in the local utxo index
+        record_broadcast(network, tx_hex)
         return response.content
+
+
+# -------------------------------------------------------------------
+# Broadcast several transactions, in order, to network. The regtest node
+# takes them all in JSON-RPC batches; other interfaces get one request per
+# transaction. Returns the txids (None for a rejected or unsent
+# transaction). stop_on_error is for transactions that each spend the one
+# before: the first rejection ends the broadcast, and the rest are not sent
+# (the regtest node has them in the same batch and rejects them itself).
+def broadcast_many(tx_hexes: List[str], network: str, stop_on_error: bool = False) -> List[Any]:
+    bsv_client = create_interface(network)
+    responses: List[Any]
+    if hasattr(bsv_client, 'broadcast_many'):
+        responses = bsv_client.broadcast_many(tx_hexes)
+    else:
+        responses = []
+        for tx_hex in tx_hexes:
+            responses.append(bsv_client.broadcast_tx(tx_hex))
+            if stop_on_error and (responses[-1] is None or responses[-1].status_code != 200):
+                break
+
+    txids: List[Any] = []
+    for i, (tx_hex, response) in enumerate(zip(tx_hexes, responses)):
+        if response is None or response.status_code != 200:
+            print(f'Error -> transaction {i + 1}/{len(tx_hexes)}: {response.content if response is not None else "no response"}')
+            txids.append(None)
+            if stop_on_error:
+                break
+            continue
+        print(f'Transaction {i + 1}/{len(tx_hexes)} accepted: {response.content}')
+        record_broadcast(network, tx_hex)
+        txids.append(response.content)
+    if len(txids) < len(tx_hexes):
+        print(f'Skipped transactions {len(txids) + 1} to {len(tx_hexes)} of {len(tx_hexes)}: they spend a rejected transaction')
+        txids += [None] * (len(tx_hexes) - len(txids))
+    return txids
+
+
+# Helper function for the commands: broadcast_many, then report how many of
+# the transactions (what) were accepted and exit 1 if any was not
+def broadcast_all(tx_hexes: List[str], network: str, what: str = 'transactions', stop_on_error: bool = False) -> List[Any]:
+    txids = broadcast_many(tx_hexes, network, stop_on_error=stop_on_error)
+    rejected = sum(txid is None for txid in txids)
+    print(f'Broadcast {len(txids) - rejected}/{len(txids)} {what}')
+    if rejected:
+        exit(1)
+    return txids
@@ -1,12 +1,48 @@
-from useful import network_to_key_type, load_key_from_file
-from transaction import build_tx, broadcast_tx
-
-from useful import write_to_file, write_to_stdout, add_interface_to_config, build_interface_config
-
-from tx_engine import interface_factory
-from typing import Any, Dict
+from useful import network_to_key_type, load_key_from_file, numbered_file_name
+from transaction import build_tx, broadcast_tx, build_outputs, build_chain, broadcast_all
+
+from useful import write_to_file, write_to_stdout, add_interface_to_config, path
+from tx_cache import cached_raw_transaction
+from key_functions import fetch_workers, raw_transactions_fetcher
+from input_resolver import InputResolver
+from wallet_snapshot import wallet_snapshot
+from coin_selection import select_coins, InsufficientFundsError
+from fee import estimate_size, estimate_p2pkh_size, fee_for_size, P2PKH_SCRIPT_SIZE, DEFAULT_FEE_RATE
+
+from interfaces import create_interface, command_fee_rate
+from collections import deque
+from typing import Any, Deque, Dict, Iterable, Iterator, List, Optional, Tuple
+import csv
+import os
+import re
 import traceback
 
+# -recipients: largest payout transaction (bytes) unless -max_bytes is given
+PAYOUT_MAX_BYTES = 1000000
+
+ADDRESS_PATTERN = re.compile(r"[a-zA-Z1-9]{27,35}$")
+
+
+# -------------------------------------------------------------------
+# Helper function to read the payouts of a -recipients csv file in the data
+# directory, one 'address,amount' row at a time; blank rows, '#' comments
+# and a header row are skipped. Raises ValueError naming the bad row.
+def read_payouts(filename: str) -> Iterator[Tuple[str, int]]:
+    with open(os.path.join(path, filename), 'r', newline='') as file:
+        reader = csv.reader(file)
+        for row in reader:
+            row = [field.strip() for field in row]
+            if not any(row) or row[0].startswith('#'):
+                continue
+            if len(row) != 2:
+                raise ValueError(f"{filename} line {reader.line_num}: expected 'address,amount'")
+            address, amount = row
+            if reader.line_num == 1 and not amount.isdigit():
+                continue
+            if not ADDRESS_PATTERN.match(address) or not amount.isdigit() or int(amount) <= 0:
+                raise ValueError(f"{filename} line {reader.line_num}: invalid payout {address},{amount}")
+            yield address, int(amount)
+
 
 class TransactionCommand:
     def __init__(self, paramfile=None,
@@ -23,7 +59,15 @@ class TransactionCommand:
                  op_return_data=None,
                  op_return_data_is_file=False,
                  op_return_only=False,
-                 change=None):
+                 change=None,
+                 sign_workers=1,
+                 cached=False,
+                 coin_selection='first_fit',
+                 fee_rate=None,
+                 recipients=None,
+                 max_outputs=None,
+                 max_bytes=None,
+                 chain=None):
 
         self.paramfile = paramfile
         self.genparam = genparam
@@ -41,9 +85,35 @@ class TransactionCommand:
         self.op_return_data = op_return_data
         self.op_return_data_is_file = op_return_data_is_file
         self.op_return_data_only = op_return_only
-        # regtest -> local node over JSON-RPC, testnet/mainnet -> WoC,
-        # mock -> in-memory (see build_interface_config)
-        self.interface = interface_factory.set_config(build_interface_config(self.network))
+        # processes used to sign the inputs of a large transaction
+        self.sign_workers = sign_workers
+        # -genparam reads the sender's utxos from the local utxo index
+        self.cached = cached
+        # strategy used to pick the inputs (see coin_selection.py)
+        self.coin_selection = coin_selection
+        # sat/byte (or 'node'); when set the fee follows the predicted size
+        # and -fee is ignored
+        self.fee_rate = fee_rate
+        # csv file of 'address,amount' payouts, packed into as few
+        # transactions of at most max_outputs payouts / max_bytes as possible
+        self.recipients = recipients
+        self.max_outputs = max_outputs
+        self.max_bytes = max_bytes or PAYOUT_MAX_BYTES
+        # csv file of 'address,amount' payments made as a chain of
+        # transactions, each spending the change of the one before
+        self.chain = chain
+        self.predicted_size: Optional[int] = None
+        self.predicted_fee: Optional[int] = None
+        self._interface = None
+
+    # regtest -> local node over JSON-RPC, testnet/mainnet -> WoC,
+    # mock -> in-memory (see useful.build_interface_config);
+    # created on first use, building a tx from a param file needs none
+    @property
+    def interface(self):
+        if self._interface is None:
+            self._interface = create_interface(self.network)
+        return self._interface
 
     # --------------------------------------------------------------
     # Create transaction from input file
@@ -55,7 +125,7 @@ class TransactionCommand:
 
         # Build transaction
         try:
-            tx = build_tx(self.paramfile)
+            tx = build_tx(self.paramfile, self.sign_workers)
         except KeyError as e:
             print(f"Error: Missing key: {e} in the parameter file:  '{self.paramfile}'. Please check the file and try again.")
             traceback.print_exc()
@@ -74,25 +144,17 @@ class TransactionCommand:
             print('\nNot broadcasting transaction')
 
     # --------------------------------------------------------------
-    # Get UTXO's for an amount
-    def utxo_amount(self, address, amount):
-        unspent = self.interface.get_utxo(address)
-        sum = 0
-        vin = []
-        i = 0
-        while sum < amount:
-            sum += unspent[i]['value']
-            vin.append(unspent[i])
-            i += 1
-
-        return vin
+    # Get UTXO's for an amount, using the -coin_selection strategy
+    def utxo_amount(self, unspent, amount):
+        return select_coins(unspent, amount, self.coin_selection)
 
     # --------------------------------------------------------------
-    def tx_in_full(self, txid: str) -> str:
-        return self.interface.get_raw_transaction(txid)
+    def tx_in_full(self, txid: str) -> Optional[str]:
+        return cached_raw_transaction(txid, self.network, self.interface.get_raw_transaction)
 
     # --------------------------------------------------------------
-    def find_inputs(self, data_dict):
+    # the key to sign with and the sender address, from -sender_key or -sender
+    def load_sender(self) -> Tuple[str, str]:
         key_for_signing = "<key for signing>"
         if self.sender_key:
             toml_ = True
@@ -104,76 +166,76 @@ class TransactionCommand:
             # print(f"JAS: DEBUG: key_for_signing: {key_for_signing}, sender_address: {sender_address}")
             self.sender = sender_address
 
-        elif self.sender:
+        else:
             sender_address = self.sender
+        return key_for_signing, sender_address
 
-        # get balance for the sender
-        # sb = self.bsv_client.get_balance(sender_address)
-        sb = self.interface.get_balance(sender_address)
-        sender_balance = int(sb['confirmed']) + int(sb['unconfirmed'])
+    # --------------------------------------------------------------
+    # get the sender's utxos (one request); the balance is derived from them
+    def sender_snapshot(self, sender_address: str):
+        snapshot = wallet_snapshot(sender_address, self.network, self.interface, self.cached)
+        if snapshot is None:
+            if self.cached:
+                print(f"Error: no cached utxos for {sender_address}, run once without --cached first.")
+            else:
+                print(f"Error: failed to retrieve the utxos for {sender_address}.")
+            exit(1)
+        return snapshot
+
+    # --------------------------------------------------------------
+    def find_inputs(self, data_dict, outputs=None):
+        key_for_signing, sender_address = self.load_sender()
+        snapshot = self.sender_snapshot(sender_address)
+        sender_balance = snapshot.total
 
         # check if sender has enough balance to send amount
-        amount_and_fee = int(self.amount) + int(self.fee)
+        fee = int(self.fee) if self.fee_rate is None else self.fee_for_inputs(1, outputs)
+        amount_and_fee = int(self.amount) + fee
         if sender_balance < amount_and_fee:
             print(f'Error: sender balance: {sender_balance} is less than amount + fee: {amount_and_fee}')
             exit(1)
 
         # get utxo for sender
-        sender_utxo = self.utxo_amount(sender_address, amount_and_fee)
-
-        # create transaction inputs (vin)
-        data_dict['transactioninput'] = []
-
-        downloaded_txns = {}
-        for utxo in sender_utxo:
-            # download the full tx via the bitcoin api (and store it so we don't spam the api)
-            if utxo['tx_hash'] not in downloaded_txns:
-                txn_full = self.tx_in_full(utxo['tx_hash'])
-                downloaded_txns[utxo['tx_hash']] = txn_full
-
-            data_dict['transactioninput'].append({
-                'tx_hash': utxo['tx_hash'],
-                'tx_pos': utxo['tx_pos'],
-                'amount': utxo['value'],
-                'input_tx_hash': downloaded_txns[utxo['tx_hash']],
-                'private_key_for_signing': key_for_signing
-            })
-
-    # --------------------------------------------------------------
-    # Generate transaction parameters
-    def generate_parameters(self):
-        print('Generating parameters')
-        data_dict: Dict[Any, Any] = {}
-        add_interface_to_config(data_dict, self.network)
+        try:
+            sender_utxo = self.utxo_amount(snapshot.utxos, amount_and_fee)
+            # a size-based fee grows with every input, so select again
+            # until the inputs also cover the fee for their own size
+            while self.fee_rate is not None:
+                fee = self.fee_for_inputs(len(sender_utxo), outputs)
+                if sum(u['value'] for u in sender_utxo) >= int(self.amount) + fee:
+                    break
+                sender_utxo = self.utxo_amount(snapshot.utxos, int(self.amount) + fee)
+        except InsufficientFundsError as e:
+            print(f'Error: {e}')
+            exit(1)
 
-        # find UTXO's for sender
-        if self.amount and (self.sender or self.sender_key):
-            self.find_inputs(data_dict)
-        elif self.op_return_data_only:
-            # the user must choose an input. add a placeholder for now
-            data_dict['transactioninput'] = [{
-                'tx_hash': "tx_id",
-                'tx_pos': "tx_index (integer value)",
-                'amount': "amount (integer value)",
-                'input_tx_hash': "input_tx_hash",
-                'private_key_for_signing': "key_for_signing"
-            }]
+        # create transaction inputs (vin); each distinct parent tx is
+        # downloaded once, concurrently (within the rate limit), or in
+        # JSON-RPC batches on regtest
+        resolver = InputResolver(self.tx_in_full, key_for_signing, fetch_workers(self.network),
+                                 raw_transactions_fetcher(self.network, self.interface))
+        data_dict['transactioninput'] = resolver.resolve(sender_utxo)
 
-        # Resolve the sender address after find_inputs, which populates
-        # self.sender from the key file when -sender_key is used. Computing it
-        # earlier left the change output as the literal "<sender address>"
-        # placeholder (which build_tx rejects) whenever -sender_key was given
-        # without an explicit -change.
-        if self.sender:
-            sender_address = self.sender
-        else:
-            sender_address = "<sender address>"
+    # --------------------------------------------------------------
+    # Fee at -fee_rate for a transaction with n_inputs inputs, the outputs
+    # and a change output; also remembers the predicted size
+    def fee_for_inputs(self, n_inputs: int, outputs: Optional[List[Dict[str, Any]]]) -> int:
+        vouts = build_outputs(outputs)[0] if outputs else []
+        script_sizes = [len(vout.script_pubkey.raw_serialize()) for vout in vouts]
+        self.predicted_size = estimate_size(n_inputs, script_sizes + [P2PKH_SCRIPT_SIZE])
+        self.predicted_fee = fee_for_size(self.predicted_size, self.fee_rate)
+        return self.predicted_fee
 
+    # --------------------------------------------------------------
+    # The [[transactionoutput]] entries for -recipient / -opreturn_data;
+    # None leaves the outputs for the user to fill in
+    def transaction_outputs(self) -> Optional[List[Dict[str, Any]]]:
+        outputs: Optional[List[Dict[str, Any]]] = None
         # if receiver is specified, create transaction outputs (vout)
         if self.recipient:
-            data_dict['transactionoutput'] = []
+            outputs = []
             if not self.op_return_data:
-                data_dict['transactionoutput'].append({
+                outputs.append({
                     'public_key': self.recipient,
                     'amount': self.amount,
                     'op_return': False,
@@ -181,13 +243,13 @@ class TransactionCommand:
                 })
             else:
                 if self.op_return_data_only:
-                    data_dict['transactionoutput'].append({
+                    outputs.append({
                         'op_return': True,
                         'data_to_encode': self.op_return_data,
                         'data_to_encode_file': self.op_return_data_is_file
                     })
                 else:
-                    data_dict['transactionoutput'].append({
+                    outputs.append({
                         'public_key': self.recipient,
                         'amount': self.amount,
                         'op_return': True,
@@ -200,11 +262,48 @@ class TransactionCommand:
         # or an inputs-only template). Previously this asserted
         # op_return_data_only and crashed those valid cases.
         elif self.op_return_data_only:
-            data_dict['transactionoutput'] = [{
+            outputs = [{
                 'op_return': True,
                 'data_to_encode': self.op_return_data,
                 'data_to_encode_file': self.op_return_data_is_file
             }]
+        return outputs
+
+    # --------------------------------------------------------------
+    # Generate transaction parameters
+    def generate_parameters(self):
+        print('Generating parameters')
+        data_dict: Dict[Any, Any] = {}
+        add_interface_to_config(data_dict, self.network)
+        outputs = self.transaction_outputs()
+
+        self.fee_rate = command_fee_rate(self.fee_rate, lambda: self.interface)
+
+        # find UTXO's for sender
+        if self.amount and (self.sender or self.sender_key):
+            self.find_inputs(data_dict, outputs)
+        elif self.op_return_data_only:
+            # the user must choose an input. add a placeholder for now
+            data_dict['transactioninput'] = [{
+                'tx_hash': "tx_id",
+                'tx_pos': "tx_index (integer value)",
+                'amount': "amount (integer value)",
+                'input_tx_hash': "input_tx_hash",
+                'private_key_for_signing': "key_for_signing"
+            }]
+
+        # Resolve the sender address after find_inputs, which populates
+        # self.sender from the key file when -sender_key is used. Computing it
+        # earlier left the change output as the literal "<sender address>"
+        # placeholder (which build_tx rejects) whenever -sender_key was given
+        # without an explicit -change.
+        if self.sender:
+            sender_address = self.sender
+        else:
+            sender_address = "<sender address>"
+
+        if outputs is not None:
+            data_dict['transactionoutput'] = outputs
 
         # if change address is specified, create change output
         if self.change:
@@ -218,8 +317,14 @@ class TransactionCommand:
             data_dict['tx_info']['create_change_output'] = True
             data_dict['tx_info']['change_output_public_key'] = sender_address
 
-        # add fee
+        # add fee; with a fee rate build_tx recomputes the fee from the
+        # actual transaction, tx_default_fee is the prediction
         data_dict['tx_info']['tx_default_fee'] = self.fee
+        if self.fee_rate is not None:
+            data_dict['tx_info']['tx_fee_rate'] = self.fee_rate
+            if self.predicted_fee is not None:
+                data_dict['tx_info']['tx_default_fee'] = self.predicted_fee
+                data_dict['tx_info']['tx_predicted_size'] = self.predicted_size
 
         # write to file or stdout; default is stdout
         if self.out:
@@ -228,13 +333,208 @@ class TransactionCommand:
         else:
             write_to_stdout(data_dict)
 
+    # --------------------------------------------------------------
+    # Inputs from pool for a payout transaction paying amount to n_outputs
+    # addresses plus change, at -fee_rate of its size; returns the inputs and
+    # the fee. Raises InsufficientFundsError.
+    def select_payout_inputs(self, pool: List[Dict[str, Any]], amount: int, n_outputs: int) -> Tuple[List[Dict[str, Any]], int]:
+        assert self.fee_rate is not None
+        inputs: List[Dict[str, Any]] = []
+        while True:
+            fee = fee_for_size(estimate_p2pkh_size(max(1, len(inputs)), n_outputs + 1), self.fee_rate)
+            if inputs and sum(u['value'] for u in inputs) >= amount + fee:
+                return inputs, fee
+            inputs = self.utxo_amount(pool, amount + fee)
+
+    # --------------------------------------------------------------
+    # Pack the payouts into transactions: each takes the next payouts, up to
+    # -max_outputs and while the transaction stays within -max_bytes, and
+    # its inputs from what is left of the one utxo snapshot. payouts is read
+    # as the transactions are made, so a large csv is never held in memory.
+    # Yields (utxos, outputs, fee) per transaction; raises
+    # InsufficientFundsError, or ValueError for a payout that needs more
+    # inputs than fit in -max_bytes.
+    def pack_payouts(self, payouts: Iterable[Tuple[str, int]], utxos: List[Dict[str, Any]]) -> Iterator[Tuple[List[Dict[str, Any]], List[Tuple[str, int]], int]]:
+        pool = list(utxos)
+        remaining = iter(payouts)
+        # payouts handed on by the transaction before, in csv order
+        pending: Deque[Tuple[str, int]] = deque()
+        while True:
+            outputs: List[Tuple[str, int]] = []
+            while (self.max_outputs is None or len(outputs) < self.max_outputs) \
+                    and (not outputs or estimate_p2pkh_size(1, len(outputs) + 2) <= self.max_bytes):
+                payout = pending.popleft() if pending else next(remaining, None)
+                if payout is None:
+                    break
+                outputs.append(payout)
+            if not outputs:
+                return
+
+            inputs, fee = self.select_payout_inputs(pool, sum(amount for _, amount in outputs), len(outputs))
+            # many small inputs: hand payouts on to the next transaction
+            while len(outputs) > 1 and estimate_p2pkh_size(len(inputs), len(outputs) + 1) > self.max_bytes:
+                pending.appendleft(outputs.pop())
+                inputs, fee = self.select_payout_inputs(pool, sum(amount for _, amount in outputs), len(outputs))
+            size = estimate_p2pkh_size(len(inputs), len(outputs) + 1)
+            if size > self.max_bytes:
+                address, amount = outputs[0]
+                raise ValueError(f"the payout of {amount} to {address} needs {len(inputs)} inputs, "
+                                 f"a transaction of {size} bytes, over -max_bytes {self.max_bytes}")
+
+            spent = {(u['tx_hash'], u['tx_pos']) for u in inputs}
+            pool = [u for u in pool if (u['tx_hash'], u['tx_pos']) not in spent]
+            yield inputs, outputs, fee
+
+    # --------------------------------------------------------------
+    # Generate the parameters of a -recipients payout: one param file per
+    # packed transaction, each paying its change back to the sender (or
+    # -change). The utxos are fetched once. The csv is streamed twice: a dry
+    # run of the packing checks every row and the funds before anything is
+    # written, then each transaction is written as it is packed, its
+    # parents downloaded together.
+    def generate_payouts(self):
+        print(f'Generating payout parameters from {self.recipients}')
+        if not (self.sender or self.sender_key):
+            print('Error: -recipients needs -sender or -sender_key')
+            exit(1)
+        try:
+            n_payouts = 0
+            total = 0
+            for _, amount in read_payouts(self.recipients):
+                n_payouts += 1
+                total += amount
+        except (OSError, ValueError) as e:
+            print(f"Error: {e}")
+            exit(1)
+        if not n_payouts:
+            print(f"Error: no payouts found in {self.recipients}")
+            exit(1)
+
+        self.fee_rate = command_fee_rate(self.fee_rate, lambda: self.interface, DEFAULT_FEE_RATE)
+
+        key_for_signing, sender_address = self.load_sender()
+        snapshot = self.sender_snapshot(sender_address)
+        try:
+            n_transactions = sum(1 for _ in self.pack_payouts(read_payouts(self.recipients), snapshot.utxos))
+        except InsufficientFundsError as e:
+            print(f'Error: sender balance: {snapshot.total} cannot pay {n_payouts} payouts worth {total} plus fees ({e})')
+            exit(1)
+        except ValueError as e:
+            print(f"Error: {e}")
+            exit(1)
+
+        resolver = InputResolver(self.tx_in_full, key_for_signing, fetch_workers(self.network),
+                                 raw_transactions_fetcher(self.network, self.interface))
+
+        print(f"Number of payouts: {n_payouts}, number of transactions: {n_transactions}")
+        for i, (inputs, outputs, fee) in enumerate(self.pack_payouts(read_payouts(self.recipients), snapshot.utxos)):
+            data_dict: Dict[Any, Any] = {}
+            add_interface_to_config(data_dict, self.network)
+            data_dict['transactioninput'] = resolver.resolve(inputs)
+            data_dict['transactionoutput'] = [{
+                'public_key': address,
+                'amount': amount,
+                'op_return': False,
+                'data_to_encode': ''
+            } for address, amount in outputs]
+            data_dict['tx_info'] = {
+                'create_change_output': True,
+                'change_output_public_key': self.change or sender_address,
+                'tx_default_fee': fee,
+                'tx_fee_rate': self.fee_rate,
+                'tx_predicted_size': estimate_p2pkh_size(len(inputs), len(outputs) + 1)
+            }
+
+            if self.out:
+                filename = numbered_file_name(self.out, i, n_transactions)
+                write_to_file(filename, data_dict)
+                print(f'Transaction {i + 1}/{n_transactions} ({len(outputs)} payouts) parameters generated, saved to file: {filename}')
+            else:
+                print(f'# transaction {i + 1}/{n_transactions}')
+                write_to_stdout(data_dict)
+
+    # --------------------------------------------------------------
+    # Build a chain of transactions offline from a -chain csv file, one
+    # payment per transaction: the first spends the sender's utxos (selected
+    # once for the whole chain), each later one the change of the one
+    # before. Then broadcast the chain in order (-broadcast true).
+    def generate_chain(self):
+        print(f'\n  -> Running bbt transaction,   chain={self.chain}, network={self.network}')
+        if not self.sender_key:
+            print('Error: -chain needs the -sender_key to sign with')
+            exit(1)
+        try:
+            payments = list(read_payouts(self.chain))
+        except (OSError, ValueError) as e:
+            print(f"Error: {e}")
+            exit(1)
+        if not payments:
+            print(f"Error: no payments found in {self.chain}")
+            exit(1)
+
+        self.fee_rate = command_fee_rate(self.fee_rate, lambda: self.interface, DEFAULT_FEE_RATE)
+
+        key_for_signing, sender_address = self.load_sender()
+        snapshot = self.sender_snapshot(sender_address)
+
+        # the first transaction also carries what the later ones pay in fees
+        later_fees = (len(payments) - 1) * fee_for_size(estimate_p2pkh_size(1, 2), self.fee_rate)
+        total = sum(amount for _, amount in payments)
+        try:
+            utxos, _ = self.select_payout_inputs(snapshot.utxos, total + later_fees, 1)
+        except InsufficientFundsError as e:
+            print(f'Error: sender balance: {snapshot.total} cannot pay {len(payments)} chained payments worth {total} plus fees ({e})')
+            exit(1)
+
+        resolver = InputResolver(self.tx_in_full, key_for_signing, fetch_workers(self.network),
+                                 raw_transactions_fetcher(self.network, self.interface))
+        steps = [[{
+            'public_key': address,
+            'amount': amount,
+            'op_return': False,
+            'data_to_encode': ''
+        }] for address, amount in payments]
+        tx_info = {
+            'create_change_output': True,
+            'change_output_public_key': sender_address,
+            'tx_default_fee': fee_for_size(estimate_p2pkh_size(1, 2), self.fee_rate),
+            'tx_fee_rate': self.fee_rate
+        }
+        try:
+            chain = build_chain(resolver.resolve(utxos), steps, tx_info, self.sign_workers)
+        except ValueError as e:
+            print(f"Error: {e}")
+            exit(1)
+
+        print(f"Number of payments: {len(payments)}, chain of {len(chain)} transactions")
+        for i, tx in enumerate(chain):
+            if self.out:
+                filename = numbered_file_name(self.out, i, len(chain), '.hex')
+                write_to_file(filename, tx, is_toml=False)
+                print(f'Transaction {i + 1}/{len(chain)} signed, saved to file: {filename}')
+            else:
+                print(f'Transaction {i + 1}/{len(chain)} serialised transaction: \n\n{tx}\n')
+
+        if self.broadcast == 'true':
+            broadcast_all(chain, self.network, stop_on_error=True)
+        else:
+            print('\nNot broadcasting transactions')
+
     # --------------------------------------------------------------
     # Run the command
     def run(self):
+        # build (and broadcast) a chain of payments
+        if self.chain:
+            self.generate_chain()
+
         # if parameter file is provided, use this to create transaction
-        if self.paramfile:
+        elif self.paramfile:
             self.create_transaction()
 
+        # generate the param files of a payout from a csv file
+        elif self.genparam and self.recipients:
+            self.generate_payouts()
+
         # generate parameter file from command line parameters
         elif self.genparam:
             self.generate_parameters()
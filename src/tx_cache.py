@@ -0,0 +1,188 @@
+import hashlib
+import os
+import threading
+from typing import Callable, Dict, List, Optional
+
+from useful import path
+
+# -------------------------------------------------------------------
+# On-disk cache of raw transactions, keyed by txid.
+#
+# Confirmed transactions never change, so once a parent transaction has been
+# downloaded there is no reason to ask the network for it again. The cache
+# lives under DATA_PATH/.tx_cache/<network>/ with one binary file per txid.
+#
+# Entries are content addressed: a raw tx is only stored, and only handed
+# back, when its double-SHA256 matches the txid. A bad API response or a
+# truncated file therefore never reaches the signer.
+#
+# The total size is capped by WBT_TX_CACHE_MAX_BYTES (default 256 MiB,
+# 0 disables the cache). When the cap is exceeded the least recently used
+# entries are evicted until the cache is back under 90% of the cap.
+
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+EVICT_TO_RATIO = 0.9
+
+
+# -------------------------------------------------------------------
+# Helper function to compute the txid of a raw (hex) transaction
+def txid_of(raw_tx: str) -> str:
+    digest = hashlib.sha256(hashlib.sha256(bytes.fromhex(raw_tx)).digest()).digest()
+    return digest[::-1].hex()
+
+
+# -------------------------------------------------------------------
+class RawTxCache:
+
+    def __init__(self, directory: str, max_bytes: int = DEFAULT_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        os.makedirs(self.directory, exist_ok=True)
+        self.total_bytes = sum(entry.stat().st_size for entry in os.scandir(self.directory) if entry.name.endswith('.tx'))
+
+    def _file(self, txid: str) -> str:
+        return os.path.join(self.directory, f'{txid.lower()}.tx')
+
+    # return the raw tx (hex) for txid, or None on a miss
+    def get(self, txid: str) -> Optional[str]:
+        the_file = self._file(txid)
+        try:
+            with open(the_file, 'rb') as file:
+                raw_tx = file.read().hex()
+        except OSError:
+            return None
+
+        if not raw_tx or txid_of(raw_tx) != txid.lower():
+            # corrupt entry, drop it and fall back to the network
+            self._remove(the_file)
+            return None
+
+        # bump the mtime so eviction treats this entry as recently used
+        try:
+            os.utime(the_file)
+        except OSError:
+            pass
+        return raw_tx
+
+    # store the raw tx (hex) for txid; returns False if the content does not hash to txid
+    def put(self, txid: str, raw_tx: Optional[str]) -> bool:
+        if not raw_tx:
+            return False
+        try:
+            if txid_of(raw_tx) != txid.lower():
+                return False
+        except ValueError:
+            return False
+
+        data = bytes.fromhex(raw_tx)
+        if len(data) > self.max_bytes:
+            return False
+
+        the_file = self._file(txid)
+        tmp_file = f'{the_file}.{os.getpid()}.{threading.get_ident()}.tmp'
+        try:
+            existing = os.path.getsize(the_file) if os.path.isfile(the_file) else 0
+            with open(tmp_file, 'wb') as file:
+                file.write(data)
+            os.replace(tmp_file, the_file)
+        except OSError:
+            self._remove(tmp_file)
+            return False
+
+        with self.lock:
+            self.total_bytes += len(data) - existing
+            if self.total_bytes > self.max_bytes:
+                self._evict()
+        return True
+
+    # remove least recently used entries until under the low-water mark
+    def _evict(self) -> None:
+        entries = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith('.tx'):
+                st = entry.stat()
+                entries.append((st.st_mtime_ns, st.st_size, entry.path))
+        entries.sort()
+
+        self.total_bytes = sum(size for _, size, _ in entries)
+        target = int(self.max_bytes * EVICT_TO_RATIO)
+        for _, size, the_file in entries:
+            if self.total_bytes <= target:
+                break
+            if self._remove(the_file):
+                self.total_bytes -= size
+
+    @staticmethod
+    def _remove(the_file: str) -> bool:
+        try:
+            os.remove(the_file)
+            return True
+        except OSError:
+            return False
+
+
+# -------------------------------------------------------------------
+# One cache per network, shared by every caller in the process.
+# The mock network (unit tests) is never cached, and nothing is cached when
+# the data directory does not exist or the cache is disabled.
+_caches: Dict[str, Optional[RawTxCache]] = {}
+_caches_lock = threading.Lock()
+
+
+def get_tx_cache(network: str) -> Optional[RawTxCache]:
+    with _caches_lock:
+        if network not in _caches:
+            _caches[network] = _open_cache(network)
+        return _caches[network]
+
+
+def _open_cache(network: str) -> Optional[RawTxCache]:
+    if network == 'mock' or not os.path.isdir(path):
+        return None
+    try:
+        max_bytes = int(os.environ.get('WBT_TX_CACHE_MAX_BYTES', DEFAULT_MAX_BYTES))
+    except ValueError:
+        print(f"Warning: WBT_TX_CACHE_MAX_BYTES is not a number of bytes, using {DEFAULT_MAX_BYTES}")
+        max_bytes = DEFAULT_MAX_BYTES
+    if max_bytes <= 0:
+        return None
+    try:
+        return RawTxCache(os.path.join(path, '.tx_cache', network), max_bytes)
+    except OSError as e:
+        print(f"Warning: raw transaction cache disabled: {e}")
+        return None
+
+
+# -------------------------------------------------------------------
+# Helper function to return a raw transaction, trying the cache before
+# calling fetch(txid) (normally interface.get_raw_transaction)
+def cached_raw_transaction(txid: str, network: str, fetch: Callable[[str], Optional[str]]) -> Optional[str]:
+    cache = get_tx_cache(network)
+    if cache is not None:
+        raw_tx = cache.get(txid)
+        if raw_tx is not None:
+            return raw_tx
+
+    raw_tx = fetch(txid)
+    if cache is not None:
+        cache.put(txid, raw_tx)
+    return raw_tx
+
+
+# -------------------------------------------------------------------
+# Helper function to return the raw transactions of txids, trying the cache
+# before calling fetch_many(missing txids) -> {txid: raw_tx} once for the rest
+def cached_raw_transactions(txids: List[str], network: str, fetch_many: Callable[[List[str]], Dict[str, Optional[str]]]) -> Dict[str, Optional[str]]:
+    cache = get_tx_cache(network)
+    found: Dict[str, Optional[str]] = {}
+    for txid in dict.fromkeys(txids):
+        found[txid] = cache.get(txid) if cache is not None else None
+    missing = [txid for txid, raw_tx in found.items() if raw_tx is None]
+    if missing:
+        fetched = fetch_many(missing)
+        for txid in missing:
+            found[txid] = fetched.get(txid)
+            if cache is not None:
+                cache.put(txid, found[txid])
+    return found
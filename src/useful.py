@@ -6,10 +6,11 @@ import os
 import pprint
 from pathlib import Path
 
-from typing import MutableMapping, Any
+from typing import MutableMapping, Any, Dict, Tuple
 import sys
 
-from tx_engine import Wallet, create_wallet_from_pem_bytes
+# tx_engine (and the requests stack it loads) is imported by the functions
+# that need it, so parsing the command line stays cheap
 
 # Specify the directory path
 # path = r'/app/data'
@@ -28,6 +29,20 @@ def address_regex_type(arg_value, pat=re.compile(r"[a-zA-Z1-9]{27,35}$")):
     return arg_value
 
 
+# -------------------------------------------------------------------
+#  Helper function for checking a -fee_rate: sat/byte, or 'node'
+def fee_rate_type(arg_value):
+    if arg_value == 'node':
+        return arg_value
+    try:
+        fee_rate = float(arg_value)
+    except ValueError:
+        raise argparse.ArgumentTypeError("invalid value, expected sat/byte or 'node'")
+    if fee_rate < 0:
+        raise argparse.ArgumentTypeError("invalid value, the fee rate cannot be negative")
+    return fee_rate
+
+
 # -------------------------------------------------------------------
 # Helper function for creating toml file
 def write_to_file(filename, data_dict, is_toml=True):
@@ -39,6 +54,16 @@ def write_to_file(filename, data_dict, is_toml=True):
     file.close()
 
 
+# -------------------------------------------------------------------
+# Helper function to number a file name for one of count outputs,
+# e.g. ('consolidate.toml', 0, 12) -> 'consolidate_001.toml'
+# suffix replaces the extension when given (e.g. '.hex')
+def numbered_file_name(filename: str, index: int, count: int, suffix: str | None = None) -> str:
+    stem, ext = os.path.splitext(filename)
+    width = max(3, len(str(count)))
+    return f"{stem}_{index + 1:0{width}d}{suffix if suffix is not None else ext}"
+
+
 # -------------------------------------------------------------------
 # Helper function for writing to stdout
 def write_to_stdout(data_dict, is_toml=True):
@@ -149,21 +174,39 @@ def print_config(config: MutableMapping[str, Any]) -> None:
     print('<------------------------------------------------------------>\n')
 
 
+def print_balance(address: str, balance: Any) -> None:
+    print('\n------------------------------------------------------------------------------------')
+    print('PubKey: \t{}\nBalance: \t{}'.format(address, balance))
+    print('------------------------------------------------------------------------------------\n')
+
+
 def print_amounts(amt_total_out: int, amt_total_in: int, fee: int, ret_amt: int) -> None:
     print('\n------------------------------------------------------------------------------------')
     print("Amounts:" + "\n\tAmount In: \t" + str(amt_total_in) + "\n\tAmount Out: \t" + str(amt_total_out) + "\n\tFee: \t\t" + str(fee) + "\n\tChange: \t" + str(ret_amt))
     print('------------------------------------------------------------------------------------\n')
 
 
+# keys already loaded in this process, by (filename, toml, key_type, mtime),
+# so batch and serve mode read and parse each key file once
+_key_cache: Dict[Tuple[str, bool, str, float], Tuple[str, str]] = {}
+
+
 # -------------------------------------------------------------------
 # Helper function to load private key from file
 def load_key_from_file(filename: str, toml: bool, key_type: str) -> tuple[str, str]:
+    try:
+        cache_key = (filename, toml, key_type, os.stat(os.path.join(path, filename)).st_mtime)
+    except OSError:
+        cache_key = None
+    if cache_key is not None and cache_key in _key_cache:
+        return _key_cache[cache_key]
     try:
         if toml:
             key_info = read_toml_file(filename)
             ret = key_info['key_info']['private_key'], key_info['key_info']['bitcoin_address']
         # else deal with pem format
         else:
+            from tx_engine import create_wallet_from_pem_bytes
             key_str = read_pem_file(filename)
             key_as_bytes = key_str.encode()
             key_wallet = create_wallet_from_pem_bytes(key_as_bytes, network=key_type)
@@ -171,6 +214,8 @@ def load_key_from_file(filename: str, toml: bool, key_type: str) -> tuple[str, s
             private_key = key_wallet.to_wif()
 
             ret = (private_key, address)
+        if cache_key is not None:
+            _key_cache[cache_key] = ret
         return ret
     except FileNotFoundError:
         print(f"Error: File {filename} not found.")
@@ -183,41 +228,15 @@ def load_key_from_file(filename: str, toml: bool, key_type: str) -> tuple[str, s
 
 # -------------------------------------------------------------------
 # Helper function to list keys
+# files already seen unchanged are read from the key index (see key_index.py)
+# (the .key list includes the addresses of the HD account manifests, .hd)
 def list_keys(network):
-
-    list_of_keys_from_keyfile = []
-    list_of_keys_from_pemfile = []
+    from key_index import indexed_keys
+    from hd_wallet import hd_keys
 
     print(f"Looking for keys in {path} directory...")
-    for file in os.listdir(path=path):
-        print(f"Checking file: {file}")
-        if file.endswith(".key"):
-            data_dict = read_toml_file(file)
-            if 'key_info' in data_dict:
-
-                # create a "Wallet" object and check the network matches
-                key = Wallet(data_dict["key_info"]["private_key"])
-                key_network = key.get_network()
-                if key_network == "BSV_Mainnet":
-                    network_type = "mainnet"
-                elif key_network == "BSV_Testnet":
-                    network_type = "testnet"
-                else:
-                    print(f"Error: Invalid network type: {key_network}")
-                    exit(1)
-
-                if network == 'regtest':
-                    network = 'testnet'
-                if network_type == network:
-                    list_of_keys_from_keyfile.append((file, data_dict["key_info"]["bitcoin_address"]))
-
-    for file in os.listdir(path=path):
-        if file.endswith(".pem"):
-            key_type = network_to_key_type(network)
-            key = load_key_from_file(file, False, key_type)
-            list_of_keys_from_pemfile.append((file, key[1]))
-
-    return list_of_keys_from_keyfile, list_of_keys_from_pemfile
+    key_list, pem_list = indexed_keys(network)
+    return key_list + hd_keys(network), pem_list
 
 
 # -------------------------------------------------------------------
@@ -225,7 +244,7 @@ def list_keys(network):
 def print_keys(network):
     key_list, pem_list = list_keys(network=network)
     print('\n------------------------------------------------------------------------------------')
-    print('WIF format keys ( .key ) in the data directory:')
+    print('WIF format keys ( .key ) and HD account addresses ( .hd ) in the data directory:')
     for key in key_list:
         print(f'\n    * {key[0]}')
         print(f'      -> bitcoin address: {key[1]}')
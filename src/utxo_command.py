@@ -1,5 +1,9 @@
-from useful import load_key_from_file, network_to_key_type, build_interface_config
-from tx_engine import interface_factory
+from useful import load_key_from_file, network_to_key_type, list_keys
+from tx_cache import cached_raw_transaction
+from interfaces import create_interface
+from utxo_index import address_utxos
+from key_functions import utxos_all
+from typing import Optional
 
 
 class utxoCommand:
@@ -7,11 +11,17 @@ class utxoCommand:
     def __init__(self,
                  key=None,
                  tx_hash=None,
-                 network='testnet'):
+                 network='testnet',
+                 cached=False,
+                 all=False):
         self.key = key
         self.network = network
         self.key_type = network_to_key_type(network)
         self.tx_hash = tx_hash
+        # read the local utxo index instead of the network
+        self.cached = cached
+        # every key file (.key|.pem) in the data directory
+        self.all = all
 
     # get the address from the key file
     def load_key_from_file(self):
@@ -25,30 +35,51 @@ class utxoCommand:
             print("Error: No key provided.")
             return
 
-        config = build_interface_config(self.network)
-        interface = interface_factory.set_config(config)
+        interface = create_interface(self.network)
 
         key = load_key_from_file(self.key, True, self.key_type)
         address = key[1]
-        unspent = interface.get_utxo(address)
+        unspent = address_utxos(address, self.network, interface, self.cached)
+        self.print_utxos(address, unspent)
+
+    # get the utxos of every key file, in bulk requests on WoC
+    def get_utxo_all(self):
+        print(f'\n  -> Running bbt utxo for all key files (.key|.pem), network={self.network}')
+        key_list, pem_list = list_keys(network=self.network)
+        keys = key_list + pem_list
+        unspent = utxos_all([key[1] for key in keys], self.network, self.cached)
+        for key in keys:
+            print(f'\n    * {key[0]}')
+            self.print_utxos(key[1], unspent[key[1]])
+
+    def print_utxos(self, address, unspent):
+        if unspent is None:
+            if self.cached:
+                print(f"Error: no cached utxos for {address}, run once without --cached first.")
+            else:
+                print(f"Failed to retrieve utxos for address {address}.")
+            return
         print(f'UTXO details for {address}')
         print("-" * 40)  # Separator for readability
         for element in unspent:
             print(f'block\t{element["height"]}\ntx_hash:tx_pos {element["tx_hash"]}:{element["tx_pos"]}\nvalue\t{element["value"]}')
             print("-" * 40)  # Separator for readability
 
-    def get_tx_hash(self) -> str:
+    def get_tx_hash(self) -> Optional[str]:
         if self.tx_hash is None:
             raise ValueError("No tx_hash supplied to download a full transaction")
 
-        config = build_interface_config(self.network)
-        interface = interface_factory.set_config(config)
-        raw_tx = interface.get_raw_transaction(self.tx_hash)
-        return raw_tx
+        def download(txid: str) -> Optional[str]:
+            return create_interface(self.network).get_raw_transaction(txid)
+
+        return cached_raw_transaction(self.tx_hash, self.network, download)
 
     def run(self) -> str | None:
         if self.tx_hash is not None:
             return self.get_tx_hash()
+        elif self.all:
+            self.get_utxo_all()
+            return None
         else:
             self.get_utxo()
             return None
@@ -0,0 +1,203 @@
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Iterable, List, Optional
+
+from tx_engine import Tx, p2pkh_script, address_to_public_key_hash
+from useful import path
+
+# -------------------------------------------------------------------
+# Local index of the unspent outputs of the addresses we work with.
+#
+# Every utxo list fetched from WoC or RPC is written to a SQLite database under
+# DATA_PATH/.utxo_index/<network>.db. The next time the same address is
+# fetched, only the difference is applied: new outputs are inserted and
+# outputs that have gone are deleted. The highest block height seen is kept
+# per address. A successful broadcast_tx marks the inputs it spent, and adds
+# the outputs paid back to indexed addresses (change) as unconfirmed. An
+# input the network still reports unspent SPENT_GRACE seconds after it was
+# marked is taken to belong to a dropped or rejected broadcast, and the next
+# sync makes it spendable again.
+#
+# With --cached (--offline), balance, utxo and transaction -genparam read the
+# index instead of the network, so repeated runs against the same wallet make
+# no utxo round-trips at all.
+#
+# Neither WoC nor the RPC node can list only the utxos created after a given
+# height, so a sync is still one utxo request; the saving is in --cached
+# runs, and in not rewriting rows that have not changed.
+#
+# WBT_UTXO_INDEX=0 disables the index. The mock network is never indexed.
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS utxos (
+    address TEXT NOT NULL,
+    tx_hash TEXT NOT NULL,
+    tx_pos INTEGER NOT NULL,
+    value INTEGER NOT NULL,
+    height INTEGER NOT NULL,
+    spent INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (tx_hash, tx_pos)
+);
+CREATE INDEX IF NOT EXISTS utxos_by_address ON utxos (address, spent);
+CREATE TABLE IF NOT EXISTS addresses (
+    address TEXT PRIMARY KEY,
+    synced_height INTEGER NOT NULL
+);
+'''
+
+# seconds the network has to see one of our broadcasts; spent holds the time
+# the utxo was marked spent (0 while unspent)
+SPENT_GRACE = 300
+
+
+# -------------------------------------------------------------------
+class UtxoIndex:
+
+    def __init__(self, db_file: str):
+        self.db_file = db_file
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(db_file, check_same_thread=False)
+        self.db.executescript(SCHEMA)
+
+    def close(self) -> None:
+        self.db.close()
+
+    # True once the address has been synced at least once
+    def is_synced(self, address: str) -> bool:
+        with self.lock:
+            row = self.db.execute('SELECT 1 FROM addresses WHERE address = ?', (address,)).fetchone()
+        return row is not None
+
+    # highest block height seen for address (-1 if never synced)
+    def synced_height(self, address: str) -> int:
+        with self.lock:
+            return self._synced_height(address, -1)
+
+    # bring the index for address in line with unspent (as returned by get_utxo)
+    # returns the number of rows written and deleted
+    def sync(self, address: str, unspent: Iterable[Dict[str, Any]]) -> Dict[str, int]:
+        latest = {(u['tx_hash'], u['tx_pos']): u for u in unspent}
+        with self.lock, self.db:
+            rows = self.db.execute('SELECT tx_hash, tx_pos, height, spent FROM utxos WHERE address = ?', (address,)).fetchall()
+            known = {(row[0], row[1]): row[2] for row in rows}
+
+            gone = [outpoint for outpoint in known if outpoint not in latest]
+            self.db.executemany('DELETE FROM utxos WHERE tx_hash = ? AND tx_pos = ?', gone)
+
+            # new outputs, and unconfirmed ones that have since been mined
+            changed = [(address, u['tx_hash'], u['tx_pos'], u['value'], u['height'])
+                       for outpoint, u in latest.items() if known.get(outpoint) != u['height']]
+            # an upsert keeps the spent flag set by record_broadcast while
+            # the network has not caught up with our own transaction
+            self.db.executemany(
+                'INSERT INTO utxos (address, tx_hash, tx_pos, value, height) VALUES (?, ?, ?, ?, ?) '
+                'ON CONFLICT (tx_hash, tx_pos) DO UPDATE SET value = excluded.value, height = excluded.height', changed)
+            # ...but not for longer than SPENT_GRACE: the broadcast did not land
+            expired = time.time() - SPENT_GRACE
+            self.db.executemany('UPDATE utxos SET spent = 0 WHERE tx_hash = ? AND tx_pos = ?',
+                                [(row[0], row[1]) for row in rows if 0 < row[3] < expired and (row[0], row[1]) in latest])
+
+            height = max([u['height'] for u in latest.values()] + [self._synced_height(address, 0)])
+            self.db.execute('INSERT OR REPLACE INTO addresses (address, synced_height) VALUES (?, ?)', (address, height))
+        return {'written': len(changed), 'deleted': len(gone)}
+
+    def _synced_height(self, address: str, default: int) -> int:
+        row = self.db.execute('SELECT synced_height FROM addresses WHERE address = ?', (address,)).fetchone()
+        return default if row is None else row[0]
+
+    # unspent outputs of address, in the same shape as get_utxo
+    def unspent(self, address: str) -> List[Dict[str, Any]]:
+        with self.lock:
+            rows = self.db.execute(
+                'SELECT height, tx_pos, tx_hash, value FROM utxos WHERE address = ? AND spent = 0 ORDER BY height, rowid',
+                (address,)).fetchall()
+        return [{'height': h, 'tx_pos': pos, 'tx_hash': txid, 'value': v} for h, pos, txid, v in rows]
+
+    # confirmed / unconfirmed totals of address, in the same shape as get_balance
+    def balance(self, address: str) -> Dict[str, int]:
+        totals = {'confirmed': 0, 'unconfirmed': 0}
+        for u in self.unspent(address):
+            totals['confirmed' if u['height'] > 0 else 'unconfirmed'] += u['value']
+        return totals
+
+    # a transaction of ours was accepted: mark its inputs spent and record the
+    # outputs that pay an indexed address
+    def record_broadcast(self, tx_hex: str) -> None:
+        tx = Tx.parse_hexstr(tx_hex)
+        txid = tx.id()
+        with self.lock, self.db:
+            now = int(time.time())
+            self.db.executemany('UPDATE utxos SET spent = ? WHERE tx_hash = ? AND tx_pos = ?',
+                                [(now, i.prev_tx, i.prev_index) for i in tx.tx_ins])
+
+            addresses = [row[0] for row in self.db.execute('SELECT address FROM addresses')]
+            scripts = {p2pkh_script(address_to_public_key_hash(a)).raw_serialize(): a for a in addresses}
+            self.db.executemany(
+                'INSERT OR IGNORE INTO utxos (address, tx_hash, tx_pos, value, height) VALUES (?, ?, ?, ?, 0)',
+                [(scripts[o.script_pubkey.raw_serialize()], txid, n, o.amount)
+                 for n, o in enumerate(tx.tx_outs) if o.script_pubkey.raw_serialize() in scripts])
+
+
+# -------------------------------------------------------------------
+# One index per network, shared by every caller in the process.
+_indexes: Dict[str, Optional[UtxoIndex]] = {}
+_indexes_lock = threading.Lock()
+
+
+def get_utxo_index(network: str) -> Optional[UtxoIndex]:
+    with _indexes_lock:
+        if network not in _indexes:
+            _indexes[network] = _open_index(network)
+        return _indexes[network]
+
+
+def _open_index(network: str) -> Optional[UtxoIndex]:
+    if network == 'mock' or not os.path.isdir(path):
+        return None
+    if os.environ.get('WBT_UTXO_INDEX', '1') == '0':
+        return None
+    try:
+        directory = os.path.join(path, '.utxo_index')
+        os.makedirs(directory, exist_ok=True)
+        return UtxoIndex(os.path.join(directory, f'{network}.db'))
+    except (OSError, sqlite3.Error) as e:
+        print(f"Warning: utxo index disabled: {e}")
+        return None
+
+
+# -------------------------------------------------------------------
+# Helper function to return the utxos of address.
+# Online, asks interface.get_utxo and syncs the index with the answer.
+# cached=True reads the index only; returns None if the address has never
+# been synced (or the index is disabled).
+def address_utxos(address: str, network: str, interface, cached: bool = False) -> Optional[List[Dict[str, Any]]]:
+    index = get_utxo_index(network)
+    if cached:
+        if index is None or not index.is_synced(address):
+            return None
+        return index.unspent(address)
+
+    unspent = interface.get_utxo(address)
+    if index is not None and unspent is not None:
+        index.sync(address, unspent)
+    return unspent
+
+
+# -------------------------------------------------------------------
+# Helper function to return the indexed balance of address, or None if the
+# address has never been synced (or the index is disabled)
+def cached_balance(address: str, network: str) -> Optional[Dict[str, int]]:
+    index = get_utxo_index(network)
+    if index is None or not index.is_synced(address):
+        return None
+    return index.balance(address)
+
+
+# -------------------------------------------------------------------
+# Helper function to record an accepted broadcast in the index
+def record_broadcast(network: str, tx_hex: str) -> None:
+    index = get_utxo_index(network)
+    if index is not None:
+        index.record_broadcast(tx_hex)
@@ -0,0 +1,39 @@
+from typing import Any, Dict, List, Optional
+
+from utxo_index import address_utxos
+
+# -------------------------------------------------------------------
+# The utxo set of one address, fetched once.
+#
+# transaction -genparam and consolidate used to ask for the balance and then
+# for the utxo list, i.e. two requests for the same data. A snapshot makes
+# the one utxo request (through the local utxo index, so --cached works too)
+# and derives the confirmed and unconfirmed totals from it. Outputs at
+# height 0 are in the mempool and count as unconfirmed.
+
+
+class WalletSnapshot:
+
+    def __init__(self, address: str, utxos: List[Dict[str, Any]]):
+        self.address = address
+        self.utxos = utxos
+        self.confirmed = sum(u['value'] for u in utxos if u['height'] > 0)
+        self.unconfirmed = sum(u['value'] for u in utxos if u['height'] <= 0)
+
+    @property
+    def total(self) -> int:
+        return self.confirmed + self.unconfirmed
+
+    # the totals in the same shape as get_balance
+    def balance(self) -> Dict[str, int]:
+        return {'confirmed': self.confirmed, 'unconfirmed': self.unconfirmed}
+
+
+# -------------------------------------------------------------------
+# Helper function to take a snapshot of address; None if its utxos could
+# not be retrieved (or, with cached=True, the address is not indexed)
+def wallet_snapshot(address: str, network: str, interface, cached: bool = False) -> Optional[WalletSnapshot]:
+    utxos = address_utxos(address, network, interface, cached)
+    if utxos is None:
+        return None
+    return WalletSnapshot(address, utxos)
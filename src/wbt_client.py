@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+import json
+import os
+import socket
+import sys
+from typing import Any, Dict, List
+
+# -------------------------------------------------------------------
+# Thin client for 'wbt serve'.
+#
+# Sends one command line to a running server and prints what the command
+# printed, exiting with its exit code. It only uses the standard library, so
+# it runs on the host without docker or tx_engine:
+#
+#   WBT_SERVER=./data/wbt.sock python3 src/wbt_client.py balance -a <address>
+#   WBT_SERVER=127.0.0.1:8765 python3 src/wbt_client.py key -l
+#
+# wbt.sh uses it automatically when WBT_SERVER is set.
+
+DEFAULT_SERVER = os.path.join('data', 'wbt.sock')
+
+
+# Helper function to connect to a Unix socket path or host:port
+def connect(server: str) -> socket.socket:
+    host, sep, port = server.rpartition(':')
+    if sep and port.isdigit() and not os.path.exists(server):
+        return socket.create_connection((host or '127.0.0.1', int(port)))
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.connect(server)
+    return sock
+
+
+# -------------------------------------------------------------------
+# Send argv to the server and return its response
+def send_command(server: str, argv: List[str]) -> Dict[str, Any]:
+    with connect(server) as sock, sock.makefile('rwb') as stream:
+        stream.write((json.dumps({'argv': argv}) + '\n').encode('utf-8'))
+        stream.flush()
+        line = stream.readline()
+    if not line:
+        raise ConnectionError(f"no response from {server}")
+    return json.loads(line)
+
+
+def main(argv: List[str]) -> int:
+    server = os.environ.get('WBT_SERVER', DEFAULT_SERVER)
+    try:
+        response = send_command(server, argv)
+    except OSError as e:
+        print(f"Error: cannot reach the wbt server at {server}: {e}", file=sys.stderr)
+        return 1
+    sys.stdout.write(response['output'])
+    return response['exit_code']
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
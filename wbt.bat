@@ -9,7 +9,16 @@ if not exist "data" (
     mkdir "data"
 )
 
+@REM Client mode: with WBT_SERVER set (host:port of a running 'wbt.bat serve'),
+@REM forward the command to the server instead of starting a new container
+if defined WBT_SERVER if not "%1"=="serve" (
+    python "%~dp0src\wbt_client.py" %*
+    exit /b %ERRORLEVEL%
+)
+
 @REM Run the image.
 @REM RPC_USER / RPC_PASSWORD / RPC_HOST are forwarded from the host env when
 @REM set; otherwise the regtest RPC interface uses its docker-node defaults.
-docker run -it --rm -v "%cd%\data:/app/data" -e RPC_USER -e RPC_PASSWORD -e RPC_HOST %IMAGE_NAME% %*
+@REM The WBT_* tuning variables (see README) are forwarded the same way.
+set "TUNING_ENV=-e WBT_TX_CACHE_MAX_BYTES -e WBT_RATE_LIMIT_TESTNET -e WBT_RATE_LIMIT_MAINNET -e WBT_FETCH_WORKERS -e WBT_UTXO_INDEX -e WBT_KEY_INDEX"
+docker run -it --rm -v "%cd%\data:/app/data" -e RPC_USER -e RPC_PASSWORD -e RPC_HOST %TUNING_ENV% %IMAGE_NAME% %*
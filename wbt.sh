@@ -18,12 +18,51 @@ fi
 
 DATA_PATH=/app/data
 
+# Client mode: with WBT_SERVER set (the socket path or host:port of a running
+# './wbt.sh serve'), forward the command to the server instead of starting a
+# new container
+if [ -n "$WBT_SERVER" ] && [ "$1" != "serve" ]; then
+  exec python3 "$(dirname "$0")/src/wbt_client.py" "$@"
+fi
+
+# Tuning variables forwarded into the container when set (see README)
+TUNING_VARS="WBT_TX_CACHE_MAX_BYTES WBT_RATE_LIMIT_TESTNET WBT_RATE_LIMIT_MAINNET WBT_FETCH_WORKERS WBT_UTXO_INDEX WBT_KEY_INDEX"
+
 # Function to handle Docker run command based on DEV_MODE and network parameters
 run_docker() {
   local volume_mount="./data:$DATA_PATH"
   local network_option=""
   local src_volume=""
+  local tuning_env=""
+  local port_option=""
+  local tty_option="-it"
+  local prev=""
+  local var
+
+  for var in $TUNING_VARS; do
+    tuning_env="$tuning_env -e $var"
+  done
   
+  # serve -port N: publish the port on the host's loopback interface only
+  # serve -regtest: attach the server to the regtest network, since the
+  # commands it runs carry their --network options in the requests
+  if [ "$1" == "serve" ]; then
+    for var in "$@"; do
+      if [ "$prev" == "-port" ]; then
+        port_option="-p 127.0.0.1:$var:$var"
+      fi
+      if [ "$var" == "-regtest" ]; then
+        network_option="--network $NETWORK_NAME"
+      fi
+      prev="$var"
+    done
+  fi
+
+  # no tty when stdin is a pipe or a file (e.g. batch - < script.txt)
+  if [ ! -t 0 ]; then
+    tty_option="-i"
+  fi
+
   # Adjust volume mount for DEV_MODE ON
   if [ "$DEV_MODE" == "ON" ]; then
     src_volume="-v ./src:/app/src"
@@ -35,6 +74,10 @@ run_docker() {
       network_option="--network $NETWORK_NAME"
     fi
   fi
+  # batch <script>: the network options are inside the script
+  if [ "$1" == "batch" ] && [ -f "./data/$2" ] && grep -q -- "--network regtest" "./data/$2"; then
+    network_option="--network $NETWORK_NAME"
+  fi
   
   # Print the command before running it
   # echo "docker run -it --rm ${network_option} -v ${volume_mount} ${src_volume} -e DATA_PATH=$DATA_PATH $IMAGE_NAME \"$@\""
@@ -43,7 +86,8 @@ run_docker() {
   # RPC_USER / RPC_PASSWORD / RPC_HOST are forwarded from the host env only
   # when set (docker '-e VAR' with no value); otherwise the regtest RPC
   # interface falls back to its docker-node defaults (bitcoin/bitcoin/node1:18332).
-  docker run -it --rm ${network_option} -v "${volume_mount}" ${src_volume} -e DATA_PATH="$DATA_PATH" -e RPC_USER -e RPC_PASSWORD -e RPC_HOST $IMAGE_NAME "$@"
+  # The WBT_* tuning variables are forwarded the same way.
+  docker run ${tty_option} --rm ${network_option} ${port_option} -v "${volume_mount}" ${src_volume} -e DATA_PATH="$DATA_PATH" -e RPC_USER -e RPC_PASSWORD -e RPC_HOST ${tuning_env} $IMAGE_NAME "$@"
 }
 
 # Echo DEV_MODE status